@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import re
+import ssl
+import time
+from html import unescape
+from typing import Optional, Union
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ABOUT = (
+    "Адвокат Панкратова А.В. предоставляет квалифицированную правовую помощь,"
+    " работает с уголовными и гражданскими делами и сопровождает клиентов на всех стадиях защиты."
+)
+
+META_DESCRIPTION_RE = re.compile(
+    r'<meta[^>]+name=["\']description["\'][^>]*content=["\'](.*?)["\']',
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def parse_description(html: str) -> Optional[str]:
+    match = META_DESCRIPTION_RE.search(html)
+    if not match:
+        return None
+    return unescape(match.group(1)).strip() or None
+
+
+class AboutInfoProvider:
+    """Текст «О нас» из памяти; сайт опрашивается в фоне условными GET-запросами."""
+
+    def __init__(
+        self,
+        url: str,
+        ttl: float = 3600,
+        timeout: float = 10.0,
+        retry_delay: float = 60.0,
+        client: Optional[httpx.AsyncClient] = None,
+        verify: Union[bool, ssl.SSLContext] = True,
+    ) -> None:
+        self.url = url
+        self.ttl = ttl
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self._client = client
+        self._own_client = client is None
+        # Общий SSL-контекст: загрузка корневых сертификатов в каждый клиент
+        # стоит около мегабайта памяти.
+        self.verify = verify
+        self._text: Optional[str] = None
+        self._fetched_at = 0.0
+        self._retry_at = 0.0
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_stale(self) -> bool:
+        return time.monotonic() - self._fetched_at > self.ttl
+
+    def get(self) -> str:
+        # Никогда не ждём сеть: отдаём то, что есть, и при необходимости
+        # запускаем обновление в фоне (stale-while-revalidate).
+        if (self._text is None or self.is_stale) and time.monotonic() >= self._retry_at:
+            self.schedule_refresh()
+        return self._text or DEFAULT_ABOUT
+
+    def schedule_refresh(self) -> None:
+        if self._refresh_task and not self._refresh_task.done():
+            return
+        try:
+            self._refresh_task = asyncio.get_running_loop().create_task(self.refresh())
+        except RuntimeError:
+            # Нет работающего цикла событий – обновимся при следующем вызове.
+            pass
+
+    async def refresh(self) -> None:
+        headers = {"User-Agent": "Mozilla/5.0"}
+        if self._text is not None:
+            if self._etag:
+                headers["If-None-Match"] = self._etag
+            if self._last_modified:
+                headers["If-Modified-Since"] = self._last_modified
+
+        try:
+            response = await self._get_client().get(self.url, headers=headers)
+        except httpx.HTTPError as exc:  # pragma: no cover - сеть
+            logger.warning("Не удалось получить данные с сайта: %s", exc)
+            self._retry_at = time.monotonic() + self.retry_delay
+            return
+
+        if response.status_code == 304:
+            self._fetched_at = time.monotonic()
+            return
+        if response.status_code != 200:  # pragma: no cover - сеть
+            logger.warning("Сайт вернул статус %s", response.status_code)
+            self._retry_at = time.monotonic() + self.retry_delay
+            return
+
+        description = parse_description(response.text)
+        if description:
+            self._text = description
+        self._etag = response.headers.get("ETag")
+        self._last_modified = response.headers.get("Last-Modified")
+        self._fetched_at = time.monotonic()
+
+    async def close(self) -> None:
+        if self._refresh_task and not self._refresh_task.done():
+            self._refresh_task.cancel()
+        if self._own_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout, follow_redirects=True, verify=self.verify
+            )
+        return self._client
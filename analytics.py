@@ -0,0 +1,228 @@
+import sqlite3
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from archive import archived_months, attach_month, has_table
+
+# Счётчики заявок по дням для /analytics. Каждая сохранённая заявка в той
+# же транзакции прибавляет единицу к строкам «день × измерение × значение»,
+# поэтому отчёт читает только строки за период, а не таблицы заявок, и не
+# зависит от их размера. Перенос заявок в архив счётчики не уменьшает.
+# День – по created_at в UTC, как в /export и /find.
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS request_rollup (
+    tenant_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    dimension TEXT NOT NULL,
+    value TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (tenant_id, day, kind, dimension, value)
+) WITHOUT ROWID
+"""
+
+# Вид заявки в счётчиках и её столбцы по измерениям; "total" – все заявки дня.
+ROLLUP_SOURCES: Dict[str, Tuple[str, Dict[str, str]]] = {
+    "emergency_calls": ("emergency", {"article": "article"}),
+    "consultations": (
+        "consultation",
+        {"article": "article", "urgency": "urgency", "city": "city", "slot": "preferred_time"},
+    ),
+}
+TOTAL = "total"
+UNKNOWN = "не указано"
+VALUE_LIMIT = 64
+
+ANALYTICS_DAYS = 7
+ANALYTICS_MAX_DAYS = 366
+# Длинный период показывается по неделям, а не по дням.
+WEEKLY_AFTER_DAYS = 31
+TOP_CITIES = 10
+ANALYTICS_USAGE = (
+    f"Использование: /analytics [дней, по умолчанию {ANALYTICS_DAYS}, до {ANALYTICS_MAX_DAYS}]\n"
+    "Например: /analytics 30"
+)
+
+
+def _day(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).date().isoformat()
+
+
+def normalize(dimension: str, value: Optional[str]) -> str:
+    # Город вводится текстом: «новосибирск » и «Новосибирск» – один город.
+    text = " ".join(str(value).split()) if value is not None else ""
+    if not text:
+        return UNKNOWN
+    if dimension == "city":
+        text = text.title()
+    return text[:VALUE_LIMIT]
+
+
+def rollup_values(table: str, row: Dict) -> List[Tuple[str, str]]:
+    _, columns = ROLLUP_SOURCES[table]
+    return [(TOTAL, "")] + [
+        (dimension, normalize(dimension, row.get(column))) for dimension, column in columns.items()
+    ]
+
+
+def record_request(conn: sqlite3.Connection, tenant_id: str, table: str, row: Dict) -> None:
+    """Учитывает только что сохранённую заявку в счётчиках (в транзакции записи)."""
+    kind, _ = ROLLUP_SOURCES[table]
+    day = _day(row["created_at"])
+    conn.executemany(
+        """
+        INSERT INTO request_rollup (tenant_id, day, kind, dimension, value, count)
+        VALUES (?, ?, ?, ?, ?, 1)
+        ON CONFLICT (tenant_id, day, kind, dimension, value) DO UPDATE SET count = count + 1
+        """,
+        [(tenant_id, day, kind, dimension, value) for dimension, value in rollup_values(table, row)],
+    )
+
+
+def count_requests(
+    conn: sqlite3.Connection, schema: str = "main", tenant_id: Optional[str] = None
+) -> Counter:
+    """Счётчики, посчитанные заново по таблицам заявок схемы ``schema``."""
+    counts: Counter = Counter()
+    for table, (kind, columns) in ROLLUP_SOURCES.items():
+        if not has_table(conn, schema, table):
+            continue
+        selected = ", ".join(columns.values())
+        cursor = conn.execute(
+            f"""
+            SELECT tenant_id, date(created_at, 'unixepoch'), {selected}, COUNT(*)
+            FROM {schema}.{table}
+            WHERE created_at IS NOT NULL AND (? IS NULL OR tenant_id = ?)
+            GROUP BY 1, 2, {selected}
+            """,
+            (tenant_id, tenant_id),
+        )
+        for tenant, day, *values, count in cursor:
+            row = dict(zip(columns.values(), values))
+            for dimension, value in rollup_values(table, row):
+                counts[(tenant, day, kind, dimension, value)] += count
+    return counts
+
+
+def count_archived_requests(archive_dir: Path, tenant_id: Optional[str] = None) -> Counter:
+    """Счётчики по всем архивам месяцев (см. archive.py); вызывать из потока."""
+    counts: Counter = Counter()
+    conn = sqlite3.connect(":memory:")
+    try:
+        for path in archived_months(archive_dir).values():
+            with attach_month(conn, path) as schema:
+                counts += count_requests(conn, schema, tenant_id)
+    finally:
+        conn.close()
+    return counts
+
+
+def replace_rollups(
+    conn: sqlite3.Connection, counts: Counter, tenant_id: Optional[str] = None
+) -> int:
+    """Заменяет счётчики бота (или всех ботов) на ``counts``; возвращает число строк."""
+    conn.execute("DELETE FROM request_rollup WHERE ? IS NULL OR tenant_id = ?", (tenant_id, tenant_id))
+    conn.executemany(
+        "INSERT INTO request_rollup (tenant_id, day, kind, dimension, value, count) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [key + (count,) for key, count in counts.items()],
+    )
+    return len(counts)
+
+
+def parse_analytics_args(args: Sequence[str]) -> int:
+    if not args:
+        return ANALYTICS_DAYS
+    if len(args) > 1 or not args[0].isdigit() or not 1 <= int(args[0]) <= ANALYTICS_MAX_DAYS:
+        raise ValueError(ANALYTICS_USAGE)
+    return int(args[0])
+
+
+class Report(NamedTuple):
+    first: date
+    last: date
+    # (kind, dimension, value) -> заявок за период; (kind, TOTAL, день) – по дням.
+    counts: Counter
+
+
+def read_report(conn: sqlite3.Connection, tenant_id: str, days: int, today: date) -> Report:
+    first = today - timedelta(days=days - 1)
+    counts: Counter = Counter()
+    cursor = conn.execute(
+        """
+        SELECT day, kind, dimension, value, count FROM request_rollup
+        WHERE tenant_id = ? AND day >= ? AND day <= ?
+        """,
+        (tenant_id, first.isoformat(), today.isoformat()),
+    )
+    for day, kind, dimension, value, count in cursor:
+        counts[(kind, dimension, day if dimension == TOTAL else value)] += count
+    return Report(first, today, counts)
+
+
+def _by_value(report: Report, kind: str, dimension: str) -> List[Tuple[str, int]]:
+    found = [
+        (value, count)
+        for (row_kind, row_dimension, value), count in report.counts.items()
+        if row_kind == kind and row_dimension == dimension
+    ]
+    return sorted(found, key=lambda item: (-item[1], item[0]))
+
+
+def _periods(report: Report) -> List[Tuple[str, date, date]]:
+    weekly = (report.last - report.first).days + 1 > WEEKLY_AFTER_DAYS
+    periods = []
+    start = report.first
+    while start <= report.last:
+        if not weekly:
+            periods.append((f"{start:%d.%m}", start, start))
+            start += timedelta(days=1)
+            continue
+        # Недели с понедельника; первая и последняя могут быть неполными.
+        end = min(start + timedelta(days=6 - start.weekday()), report.last)
+        periods.append((f"{start:%d.%m}–{end:%d.%m}", start, end))
+        start = end + timedelta(days=1)
+    return periods
+
+
+def format_report(report: Report) -> str:
+    def total(kind: str, start: date, end: date) -> int:
+        return sum(
+            count
+            for (row_kind, dimension, day), count in report.counts.items()
+            if row_kind == kind and dimension == TOTAL and start.isoformat() <= day <= end.isoformat()
+        )
+
+    days = (report.last - report.first).days + 1
+    consultations = total("consultation", report.first, report.last)
+    emergencies = total("emergency", report.first, report.last)
+    lines = [
+        f"📈 Заявки за {days} дн.: {report.first:%d.%m.%Y}–{report.last:%d.%m.%Y} (UTC)",
+        f"Консультаций: {consultations}, экстренных вызовов: {emergencies}",
+    ]
+    if not consultations and not emergencies:
+        return "\n".join(lines)
+
+    lines += ["", "По неделям:" if days > WEEKLY_AFTER_DAYS else "По дням:"]
+    for title, start, end in _periods(report):
+        lines.append(
+            f"{title} — {total('consultation', start, end)} конс., {total('emergency', start, end)} экстр."
+        )
+    articles = Counter(dict(_by_value(report, "consultation", "article")))
+    emergency_articles = Counter(dict(_by_value(report, "emergency", "article")))
+    lines += ["", "Статьи (консультации / экстренные):"]
+    for article, _ in (articles + emergency_articles).most_common():
+        lines.append(f"{article} — {articles[article]} / {emergency_articles[article]}")
+    sections = (
+        ("Срочность:", "urgency", None),
+        (f"Города (первые {TOP_CITIES}):", "city", TOP_CITIES),
+        ("Интервалы:", "slot", None),
+    )
+    for title, dimension, limit in sections:
+        values = _by_value(report, "consultation", dimension)[:limit]
+        if values:
+            lines += ["", title] + [f"{value} — {count}" for value, count in values]
+    return "\n".join(lines)
@@ -0,0 +1,328 @@
+import asyncio
+import calendar
+import gzip
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from storage import Database
+
+logger = logging.getLogger(__name__)
+
+# Хранение старых заявок. Строки emergency_calls и consultations старше
+# заданного возраста переносятся из рабочей базы в помесячные файлы
+# archive/advbot-ГГГГ-ММ.db (месяц по created_at в UTC). Когда граница
+# возраста уходит за конец месяца, новых строк в его файл больше не будет:
+# файл сжимается в .db.gz («запечатывается»). Выгрузка за период
+# подключает через ATTACH только архивы нужных месяцев. Полнотекстовый
+# поиск /find идёт только по рабочей базе: триггеры индекса удаляют из
+# него перенесённые строки.
+#
+# Перенос идёт частями и без общей транзакции на два файла: часть сначала
+# копируется в архив (INSERT OR IGNORE по id) и фиксируется там, и только
+# потом удаляется из рабочей базы через поток записи. Сбой между шагами
+# оставляет копию в обоих местах, и следующий запуск просто повторит шаг.
+
+ARCHIVE_TABLES = ("emergency_calls", "consultations")
+ARCHIVE_BATCH = 500
+# Сколько страниц освобождать за одну операцию incremental_vacuum: запись
+# в рабочую базу не ждёт дольше нескольких миллисекунд.
+VACUUM_PAGES = 2000
+MONTH_FILE_RE = re.compile(r"advbot-(\d{4})-(\d{2})\.db(\.gz)?")
+
+
+class Month(NamedTuple):
+    year: int
+    month: int
+
+    @classmethod
+    def of(cls, timestamp: int) -> "Month":
+        moment = datetime.fromtimestamp(timestamp, timezone.utc)
+        return cls(moment.year, moment.month)
+
+    @property
+    def start(self) -> int:
+        return calendar.timegm((self.year, self.month, 1, 0, 0, 0))
+
+    @property
+    def end(self) -> int:
+        year, month = (self.year + 1, 1) if self.month == 12 else (self.year, self.month + 1)
+        return calendar.timegm((year, month, 1, 0, 0, 0))
+
+    @property
+    def filename(self) -> str:
+        return f"advbot-{self.year:04d}-{self.month:02d}.db"
+
+
+def archived_months(archive_dir: Path) -> Dict[Month, Path]:
+    """Архивы по месяцам: открытые .db и запечатанные .db.gz."""
+    found: Dict[Month, Path] = {}
+    if not archive_dir.is_dir():
+        return found
+    for path in archive_dir.iterdir():
+        matched = MONTH_FILE_RE.fullmatch(path.name)
+        if matched:
+            month = Month(int(matched.group(1)), int(matched.group(2)))
+            # Если рядом остались оба файла (сбой при сжатии), верен несжатый.
+            if month not in found or not matched.group(3):
+                found[month] = path
+    return dict(sorted(found.items()))
+
+
+def months_in_range(archive_dir: Path, low: int, high: int) -> List[Tuple[Month, Path]]:
+    """Архивы, месяцы которых пересекаются с [low, high), по порядку."""
+    return [
+        (month, path)
+        for month, path in archived_months(archive_dir).items()
+        if month.start < high and month.end > low
+    ]
+
+
+def enable_incremental_vacuum(conn: sqlite3.Connection) -> bool:
+    """Включает auto_vacuum=INCREMENTAL; у существующей базы – разовым VACUUM.
+
+    Возвращает True, если режим пришлось менять.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # Для уже созданных таблиц режим вступает в силу только после VACUUM.
+    conn.execute("VACUUM")
+    return True
+
+
+def incremental_vacuum(conn: sqlite3.Connection, pages: int = VACUUM_PAGES) -> int:
+    """Возвращает в ОС до ``pages`` свободных страниц; сколько их осталось."""
+    # PRAGMA отдаёт по строке на страницу и освобождает их по мере чтения.
+    conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def _columns(conn: sqlite3.Connection, schema: str, table: str) -> List[Tuple[str, str, Optional[str]]]:
+    return [
+        (name, declared, default)
+        for _, name, declared, _, default, _ in conn.execute(f"PRAGMA {schema}.table_info({table})")
+    ]
+
+
+def _prepare_table(conn: sqlite3.Connection, table: str) -> List[str]:
+    """Создаёт таблицу архива по схеме рабочей базы и дополняет её новыми столбцами."""
+    existing = {name for name, _, _ in _columns(conn, "main", table)}
+    if not existing:
+        (ddl,) = conn.execute(
+            "SELECT sql FROM hot.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        conn.execute(ddl)
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_tenant_created ON {table} (tenant_id, created_at)"
+        )
+        existing = {name for name, _, _ in _columns(conn, "main", table)}
+    columns = []
+    for name, declared, default in _columns(conn, "hot", table):
+        if name not in existing:
+            # Столбцы, добавленные миграциями после создания архива.
+            default_sql = f" DEFAULT {default}" if default is not None else ""
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declared}{default_sql}")
+        columns.append(name)
+    return columns
+
+
+def _unseal(month: Month, archive_dir: Path) -> Path:
+    path = archive_dir / month.filename
+    packed = path.with_name(path.name + ".gz")
+    if packed.exists() and not path.exists():
+        temporary = path.with_name(path.name + ".tmp")
+        with gzip.open(packed, "rb") as source, open(temporary, "wb") as target:
+            shutil.copyfileobj(source, target)
+        os.replace(temporary, path)
+    packed.unlink(missing_ok=True)
+    return path
+
+
+def seal(path: Path) -> Path:
+    """Сжимает архив месяца, в который строк больше не будет, и удаляет несжатый."""
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        # Дописанный частями файл сначала уплотняется.
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    packed = path.with_name(path.name + ".gz")
+    temporary = path.with_name(path.name + ".gz.tmp")
+    with open(path, "rb") as source, gzip.open(temporary, "wb") as target:
+        shutil.copyfileobj(source, target)
+    os.replace(temporary, packed)
+    path.unlink()
+    return packed
+
+
+def copy_to_archive(
+    hot_path: Path, archive_dir: Path, table: str, cutoff: int, limit: int = ARCHIVE_BATCH
+) -> Tuple[Optional[Month], List[int]]:
+    """Копирует в архив следующую часть строк старше ``cutoff``.
+
+    Часть берётся из самого старого месяца. Возвращает месяц и id
+    скопированных строк, которые теперь можно удалить из рабочей базы.
+    """
+    hot = sqlite3.connect(f"{hot_path.resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        oldest = hot.execute(f"SELECT MIN(created_at) FROM {table} WHERE created_at < ?", (cutoff,))
+        (first,) = oldest.fetchone()
+    finally:
+        hot.close()
+    if first is None:
+        return None, []
+    month = Month.of(first)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    # uri=True – чтобы ATTACH понял параметр mode=ro у рабочей базы.
+    conn = sqlite3.connect(_unseal(month, archive_dir).resolve().as_uri(), uri=True, isolation_level=None)
+    try:
+        conn.execute("ATTACH DATABASE ? AS hot", (f"{hot_path.resolve().as_uri()}?mode=ro",))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = ", ".join(_prepare_table(conn, table))
+            ids = [
+                row_id
+                for (row_id,) in conn.execute(
+                    f"""
+                    SELECT id FROM hot.{table}
+                    WHERE created_at >= ? AND created_at < ?
+                    ORDER BY created_at, id LIMIT ?
+                    """,
+                    (month.start, min(month.end, cutoff), limit),
+                )
+            ]
+            placeholders = ", ".join("?" for _ in ids)
+            conn.execute(
+                f"INSERT OR IGNORE INTO main.{table} ({columns}) "
+                f"SELECT {columns} FROM hot.{table} WHERE id IN ({placeholders})",
+                ids,
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("DETACH DATABASE hot")
+    finally:
+        conn.close()
+    return month, ids
+
+
+def delete_archived(conn: sqlite3.Connection, table: str, ids: Sequence[int]) -> int:
+    placeholders = ", ".join("?" for _ in ids)
+    return conn.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", tuple(ids)).rowcount
+
+
+class ArchiveRun(NamedTuple):
+    moved: Dict[str, int]
+    sealed: List[Path]
+    freed_pages: int
+
+
+class Archiver:
+    """Переносит старые заявки в помесячные архивы и уплотняет рабочую базу.
+
+    Копирование идёт в отдельном потоке со своими соединениями, удаление и
+    incremental_vacuum – короткими операциями через общий поток записи,
+    поэтому обработчики апдейтов ждут не дольше одной части.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        archive_dir: Path,
+        retention_days: int,
+        batch_size: int = ARCHIVE_BATCH,
+    ) -> None:
+        self.database = database
+        self.archive_dir = archive_dir
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        # Пока идёт перенос, строки бывают и в архиве, и в рабочей базе:
+        # пересчёт по обоим источникам (например, счётчиков /analytics) ждёт его.
+        self.lock = asyncio.Lock()
+
+    def cutoff(self, now: float) -> int:
+        return int(now) - self.retention_days * 24 * 60 * 60
+
+    async def run(self, now: float) -> ArchiveRun:
+        async with self.lock:
+            cutoff = self.cutoff(now)
+            moved = {table: 0 for table in ARCHIVE_TABLES}
+            for table in ARCHIVE_TABLES:
+                while True:
+                    _, ids = await asyncio.to_thread(
+                        copy_to_archive,
+                        self.database.path,
+                        self.archive_dir,
+                        table,
+                        cutoff,
+                        self.batch_size,
+                    )
+                    if not ids:
+                        break
+                    moved[table] += await self.database.execute(
+                        lambda conn: delete_archived(conn, table, ids)
+                    )
+            freed = 0
+            if any(moved.values()):
+                freed = await self._vacuum()
+            sealed = []
+            for month, path in archived_months(self.archive_dir).items():
+                if path.suffix == ".db" and month.end <= cutoff:
+                    sealed.append(await asyncio.to_thread(seal, path))
+                    logger.info("Архив за %02d.%04d сжат: %s", month.month, month.year, sealed[-1])
+            return ArchiveRun(moved, sealed, freed)
+
+    async def _vacuum(self) -> int:
+        before = await self.database.read(
+            lambda conn: conn.execute("PRAGMA freelist_count").fetchone()[0]
+        )
+        left = before
+        while left:
+            remaining = await self.database.execute(incremental_vacuum)
+            if remaining >= left:
+                # auto_vacuum выключен: страницы так не освободить.
+                break
+            left = remaining
+        return before - left
+
+
+@contextmanager
+def attach_month(conn: sqlite3.Connection, path: Path, schema: str = "archive") -> Iterator[str]:
+    """Подключает архив месяца к соединению только для чтения.
+
+    Запечатанный архив распаковывается во временный файл на время чтения.
+    """
+    unpacked: Optional[Path] = None
+    if path.suffix == ".gz":
+        handle = tempfile.NamedTemporaryFile("wb", suffix=".db", delete=False)
+        with handle, gzip.open(path, "rb") as source:
+            shutil.copyfileobj(source, handle)
+        unpacked = Path(handle.name)
+    try:
+        source = (unpacked or path).resolve().as_uri()
+        conn.execute("ATTACH DATABASE ? AS " + schema, (f"{source}?mode=ro",))
+        try:
+            yield schema
+        finally:
+            conn.execute(f"DETACH DATABASE {schema}")
+    finally:
+        if unpacked is not None:
+            unpacked.unlink(missing_ok=True)
+
+
+def has_table(conn: sqlite3.Connection, schema: str, table: str) -> bool:
+    return (
+        conn.execute(
+            f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        is not None
+    )
@@ -0,0 +1,219 @@
+"""Нагрузочный прогон сценариев бота без сети.
+
+Синтетические апдейты проходят через настоящие обработчики main.py
+(callback-роутер, handle_text, handle_contact, handle_location), а бот
+подменён фейковым HTTP-слоем, который только запоминает вызовы API.
+
+Запуск из корня репозитория (нужен cfg.py):
+
+    python benchmarks/bench_flows.py --users 200 --rounds 3
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from telegram import Bot, Update  # noqa: E402
+from telegram.request import BaseRequest, RequestData  # noqa: E402
+
+import main  # noqa: E402
+from keyboards import TIME_SLOTS  # noqa: E402
+
+_ids = itertools.count(1)
+
+
+class FakeRequest(BaseRequest):
+    """HTTP-слой бота, который ничего не отправляет и отвечает правдоподобными объектами."""
+
+    def __init__(self) -> None:
+        self.calls: Counter = Counter()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    @property
+    def read_timeout(self) -> float:
+        return 1.0
+
+    async def do_request(self, url, method, request_data: RequestData = None, **kwargs):
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls[endpoint] += 1
+        params = request_data.parameters if request_data else {}
+        if endpoint == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif endpoint.startswith("send") or endpoint.startswith("edit"):
+            result = {
+                "message_id": next(_ids),
+                "date": int(time.time()),
+                "chat": {"id": params.get("chat_id", 1), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": "Клиент", "username": f"user{user_id}"}
+
+
+def message(user_id: int, **fields) -> dict:
+    body = {
+        "message_id": next(_ids),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+    }
+    body.update(fields)
+    return {"update_id": next(_ids), "message": body}
+
+
+def callback(user_id: int, data: str) -> dict:
+    return {
+        "update_id": next(_ids),
+        "callback_query": {
+            "id": str(next(_ids)),
+            "chat_instance": str(user_id),
+            "data": data,
+            "from": _user(user_id),
+            "message": {
+                "message_id": next(_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "menu",
+            },
+        },
+    }
+
+
+def emergency_journey(user_id: int) -> list:
+    return [
+        callback(user_id, "emergency_open"),
+        callback(user_id, "emergency_phone"),
+        message(user_id, text="+7 913 000-00-00"),
+        callback(user_id, "emergency_address"),
+        message(user_id, location={"latitude": 55.03, "longitude": 82.92}),
+        callback(user_id, "emergency_article_menu"),
+        callback(user_id, "emergency_article_228"),
+        callback(user_id, "emergency_submit"),
+    ]
+
+
+def consultation_journey(user_id: int) -> list:
+    return [
+        callback(user_id, "consult_open"),
+        message(user_id, text="Новосибирск"),
+        message(user_id, contact={"phone_number": "+79130000000", "first_name": "Клиент"}),
+        callback(user_id, "consult_urgency_Срочно"),
+        callback(user_id, "consult_article_159"),
+        message(user_id, text="Нужна консультация по делу"),
+        callback(user_id, f"consult_date_{datetime.now().date().isoformat()}"),
+        callback(user_id, f"consult_time_{TIME_SLOTS[user_id % len(TIME_SLOTS)]}"),
+    ]
+
+
+async def run_user(application, journey: list, latencies: list) -> None:
+    for payload in journey:
+        update = Update.de_json(payload, application.bot)
+        started = time.perf_counter()
+        await application.process_update(update)
+        latencies.append(time.perf_counter() - started)
+
+
+def percentile(values: list, share: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def rss_kib() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+async def bench(users: int, rounds: int, trace_memory: bool) -> None:
+    workdir = Path(tempfile.mkdtemp(prefix="advbot-bench-"))
+    main.DB_PATH = workdir / "advbot.db"
+    main.database.path = main.DB_PATH
+    main.GAZETTEER_INDEX_PATH = workdir / "gazetteer.idx"
+    main.init_db()
+    # Все консультации записываются на сегодня; прогон меряет обработку, а
+    # не отказы по занятым интервалам.
+    tenant = next(iter(main.tenants.values()))
+    tenant.slot_book.capacity = users * rounds
+
+    request = FakeRequest()
+    application = main.build_application(Bot("1:bench", request=request), tenant)
+    await application.initialize()
+    await application.post_init(application)
+
+    # tracemalloc заметно замедляет обработку, поэтому включается отдельно.
+    if trace_memory:
+        tracemalloc.start()
+    rss_before = rss_kib()
+    latencies: list = []
+    journeys = 0
+    started = time.perf_counter()
+    for round_no in range(rounds):
+        tasks = []
+        for index in range(users):
+            user_id = round_no * users + index + 1
+            journey = emergency_journey(user_id) if index % 2 else consultation_journey(user_id)
+            tasks.append(run_user(application, journey, latencies))
+        await asyncio.gather(*tasks)
+        journeys += len(tasks)
+    elapsed = time.perf_counter() - started
+    await application.persistence.flush()
+    traced = tracemalloc.get_traced_memory()[0] if trace_memory else None
+    tracemalloc.stop()
+    rss_after = rss_kib()
+
+    await application.shutdown()
+    await application.post_shutdown(application)
+
+    latencies.sort()
+    database = main.database
+    print(f"Пользователей: {users} x {rounds} раундов, сценариев: {journeys}, апдейтов: {len(latencies)}")
+    print(f"Время: {elapsed:.2f} с; {journeys / elapsed:.1f} сценариев/с; {len(latencies) / elapsed:.0f} апдейтов/с")
+    print(
+        "Задержка обработчика, мс: "
+        f"p50={statistics.median(latencies) * 1000:.2f} "
+        f"p95={percentile(latencies, 0.95) * 1000:.2f} "
+        f"p99={percentile(latencies, 0.99) * 1000:.2f} "
+        f"max={latencies[-1] * 1000:.2f}"
+    )
+    if database.batches:
+        print(
+            f"SQLite: пакетов {database.batches}, операций {database.operations}, "
+            f"запись {database.write_seconds * 1000:.1f} мс всего, "
+            f"{database.write_seconds / database.batches * 1000:.2f} мс на пакет"
+        )
+    print(f"Пиковый RSS: {rss_after / 1024:.1f} МиБ (+{(rss_after - rss_before) / 1024:.1f} МиБ за прогон)")
+    if traced is not None:
+        print(f"Объекты Python, оставшиеся после прогона: {traced / 1024:.0f} КиБ")
+    print(f"Вызовы Bot API: {dict(request.calls)}")
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100, help="одновременных пользователей")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--trace-memory", action="store_true", help="считать память через tracemalloc")
+    args = parser.parse_args()
+    asyncio.run(bench(args.users, args.rounds, args.trace_memory))
+
+
+if __name__ == "__main__":
+    main_cli()
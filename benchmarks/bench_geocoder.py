@@ -0,0 +1,52 @@
+"""Микробенчмарк офлайн-геокодера: поиск по индексу-сетке против перебора.
+
+Запуск из корня репозитория: ``python benchmarks/bench_geocoder.py``.
+"""
+
+import csv
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from geocoder import build_index, distance_km, load_geocoder  # noqa: E402
+
+GAZETTEER = Path(__file__).resolve().parent.parent / "gazetteer_ru.csv"
+ROUNDS = 20000
+
+
+def main() -> None:
+    index_path = Path(tempfile.mkdtemp(prefix="advbot-geo-")) / "gazetteer.idx"
+    started = time.perf_counter()
+    points = build_index(GAZETTEER, index_path)
+    print(f"Индекс: {points} точек, {index_path.stat().st_size} байт за {(time.perf_counter() - started) * 1000:.1f} мс")
+
+    with open(GAZETTEER, encoding="utf-8", newline="") as handle:
+        rows = [(float(row["lat"]), float(row["lon"])) for row in csv.DictReader(handle)]
+    rng = random.Random(1)
+    # Точки вокруг Новосибирска – основной сценарий – и по всей стране.
+    cases = {
+        "Новосибирск": [(rng.uniform(54.8, 55.15), rng.uniform(82.7, 83.2)) for _ in range(ROUNDS)],
+        "вся страна": [(rng.uniform(43, 70), rng.uniform(20, 180)) for _ in range(ROUNDS // 10)],
+    }
+    geocoder = load_geocoder(GAZETTEER, index_path)
+    try:
+        for title, points in cases.items():
+            started = time.perf_counter()
+            for lat, lon in points:
+                geocoder.nearest(lat, lon)
+            indexed = (time.perf_counter() - started) / len(points)
+            started = time.perf_counter()
+            for lat, lon in points:
+                min(distance_km(lat, lon, row_lat, row_lon) for row_lat, row_lon in rows)
+            brute = (time.perf_counter() - started) / len(points)
+            print(f"{title:<14} индекс {indexed * 1e6:8.1f} мкс   перебор {brute * 1e6:8.1f} мкс")
+    finally:
+        geocoder.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Микробенчмарк кэша клавиатур: время и аллокации на один апдейт.
+
+Запуск из корня репозитория: ``python benchmarks/bench_keyboards.py``.
+"""
+
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import keyboards  # noqa: E402
+from drafts import EmergencyDraft  # noqa: E402
+
+DRAFT = EmergencyDraft(phone="+79130000000", coordinates="55.0,82.9")
+ROUNDS = 20000
+
+CASES = [
+    (
+        "emergency_keyboard",
+        lambda: keyboards.build_emergency_keyboard.__wrapped__(keyboards.emergency_mask(DRAFT)),
+        lambda: keyboards.emergency_keyboard(DRAFT),
+    ),
+    (
+        "article_keyboard",
+        lambda: keyboards.article_keyboard.__wrapped__("consult_article"),
+        lambda: keyboards.article_keyboard("consult_article"),
+    ),
+    (
+        "consultation_date_keyboard",
+        lambda: keyboards.build_consultation_date_keyboard.__wrapped__(datetime.now().date()),
+        keyboards.consultation_date_keyboard,
+    ),
+    (
+        "consultation_time_keyboard",
+        keyboards.consultation_time_keyboard.__wrapped__,
+        keyboards.consultation_time_keyboard,
+    ),
+]
+
+
+def allocations_per_call(func, rounds: int = 1000) -> float:
+    func()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    keep = [func() for _ in range(rounds)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    del keep
+    stats = after.compare_to(before, "filename")
+    return sum(stat.size_diff for stat in stats if stat.size_diff > 0) / rounds
+
+
+def main() -> None:
+    print(f"{'клавиатура':<28}{'без кэша, мкс':>16}{'с кэшем, мкс':>16}{'байт без кэша':>16}{'байт с кэшем':>16}")
+    for name, uncached, cached in CASES:
+        uncached_us = timeit.timeit(uncached, number=ROUNDS) / ROUNDS * 1e6
+        cached_us = timeit.timeit(cached, number=ROUNDS) / ROUNDS * 1e6
+        print(
+            f"{name:<28}{uncached_us:>16.2f}{cached_us:>16.2f}"
+            f"{allocations_per_call(uncached):>16.0f}{allocations_per_call(cached):>16.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Прогон миграций схемы на большой базе.
+
+Создаёт базу в исходной схеме (версия 1) с синтетическими заявками, меряет
+типовые админские выборки, применяет остальные миграции и меряет те же
+выборки после них.
+
+Запуск из корня репозитория:
+
+    python benchmarks/bench_migrations.py --rows 2000000
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import migrations  # noqa: E402
+from keyboards import ARTICLE_OPTIONS, TIME_SLOTS  # noqa: E402
+from storage import connect  # noqa: E402
+
+URGENCIES = ("Очень срочно", "Срочно", "Не спешу")
+CHUNK = 50_000
+
+# Выборки до и после миграций: даты в v1 – ISO-строки, после – секунды Unix.
+QUERIES = (
+    (
+        "заявки за неделю",
+        "SELECT COUNT(*) FROM consultations WHERE created_at >= ? AND created_at < ?",
+    ),
+    (
+        "статья 228 за неделю",
+        "SELECT COUNT(*) FROM consultations WHERE article = '228' "
+        "AND created_at >= ? AND created_at < ?",
+    ),
+    (
+        "«Очень срочно» за неделю",
+        "SELECT COUNT(*) FROM consultations WHERE urgency = 'Очень срочно' "
+        "AND created_at >= ? AND created_at < ?",
+    ),
+    (
+        "вызовы пользователя",
+        "SELECT COUNT(*) FROM emergency_calls WHERE user_id = 4242 "
+        "AND created_at >= ? AND created_at < ?",
+    ),
+)
+
+
+def fill(conn, rows: int, started: datetime) -> None:
+    rng = random.Random(1)
+    span = 365 * 24 * 3600
+    for offset in range(0, rows, CHUNK):
+        size = min(CHUNK, rows - offset)
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT INTO consultations (user_id, username, full_name, city, phone, urgency, "
+            "article, description, preferred_date, preferred_time, created_at) "
+            "VALUES (?, ?, 'Клиент', 'Новосибирск', '+79130000000', ?, ?, 'Описание дела', ?, ?, ?)",
+            (
+                (
+                    user_id,
+                    f"user{user_id}",
+                    rng.choice(URGENCIES),
+                    rng.choice(ARTICLE_OPTIONS),
+                    created.date().isoformat(),
+                    rng.choice(TIME_SLOTS),
+                    created.isoformat(),
+                )
+                for user_id, created in (
+                    (rng.randrange(100_000), started + timedelta(seconds=rng.randrange(span)))
+                    for _ in range(size)
+                )
+            ),
+        )
+        conn.executemany(
+            "INSERT INTO emergency_calls (user_id, username, full_name, phone, address, article, "
+            "created_at) VALUES (?, ?, 'Клиент', '+79130000000', 'Красный проспект, 1', ?, ?)",
+            (
+                (
+                    user_id,
+                    f"user{user_id}",
+                    rng.choice(ARTICLE_OPTIONS),
+                    (started + timedelta(seconds=rng.randrange(span))).isoformat(),
+                )
+                for user_id in (rng.randrange(100_000) for _ in range(size // 4))
+            ),
+        )
+        conn.execute("COMMIT")
+
+
+def run_queries(conn, low, high) -> None:
+    for title, sql in QUERIES:
+        started = time.perf_counter()
+        count = conn.execute(sql, (low, high)).fetchone()[0]
+        elapsed = time.perf_counter() - started
+        plan = "; ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, (low, high)))
+        print(f"  {title:<28} {count:>7} строк {elapsed * 1000:9.1f} мс  {plan}")
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000, help="консультаций (вызовов – вчетверо меньше)")
+    parser.add_argument("--db", type=Path, help="путь к базе (по умолчанию – во временном каталоге)")
+    args = parser.parse_args()
+
+    path = args.db or Path(tempfile.mkdtemp(prefix="advbot-migrate-")) / "advbot.db"
+    conn = connect(path)
+    migrations.migrate(conn, target=1)
+    # Наивные ISO-даты в v1 записаны в UTC, так их и переводит миграция.
+    started_at = datetime(2025, 1, 1)
+    started = time.perf_counter()
+    fill(conn, args.rows, started_at)
+    print(f"База {path}: {args.rows} консультаций, {args.rows // 4} вызовов за {time.perf_counter() - started:.1f} с")
+
+    week = (started_at + timedelta(days=180), started_at + timedelta(days=187))
+    print("Выборки в схеме v1:")
+    run_queries(conn, week[0].isoformat(), week[1].isoformat())
+
+    for version, description, step in migrations.MIGRATIONS:
+        if version <= 1:
+            continue
+        started = time.perf_counter()
+        migrations.migrate(conn, target=version)
+        print(f"Миграция {version} ({description}): {time.perf_counter() - started:.1f} с")
+
+    print("Выборки после миграций:")
+    run_queries(
+        conn,
+        int(week[0].replace(tzinfo=timezone.utc).timestamp()),
+        int(week[1].replace(tzinfo=timezone.utc).timestamp()),
+    )
+    print(f"Размер файла: {path.stat().st_size / 2**20:.0f} МиБ")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,94 @@
+"""Ожидание воркера по классам апдейтов при наплыве нажатий в меню.
+
+Через PerUserUpdateProcessor прогоняется пачка апдейтов от ``--users``
+пользователей: в основном кнопки меню, среди них консультации и каждый
+``--emergency-every``-й – экстренный вызов. Обработчик только спит
+``--handler-ms``, как будто ждёт ответа Bot API. Печатается время от
+поступления апдейта до запуска обработчика по классам – без приоритетов
+(FIFO) и с классами и старением, как в main.py.
+
+Запуск из корня репозитория (нужен cfg.py):
+
+    python benchmarks/bench_priority.py --users 2000
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from telegram import Bot, Update  # noqa: E402
+
+import main  # noqa: E402
+from bench_flows import callback, percentile  # noqa: E402
+from update_processor import PerUserUpdateProcessor  # noqa: E402
+
+
+def updates(bot: Bot, users: int, emergency_every: int) -> list:
+    result = []
+    for user_id in range(1, users + 1):
+        if user_id % emergency_every == 0:
+            data = "emergency_submit"
+        elif user_id % 5 == 0:
+            data = "consult_open"
+        else:
+            data = "back_to_requests"
+        result.append(Update.de_json(callback(user_id, data), bot))
+    return result
+
+
+async def run(processor: PerUserUpdateProcessor, batch: list, handler_seconds: float) -> dict:
+    waits = defaultdict(list)
+
+    async def handle(priority: str, arrived: float) -> None:
+        waits[priority].append(time.perf_counter() - arrived)
+        await asyncio.sleep(handler_seconds)
+
+    await asyncio.gather(
+        *(
+            processor.process_update(update, handle(main.update_priority(update), time.perf_counter()))
+            for update in batch
+        )
+    )
+    return waits
+
+
+def report(title: str, waits: dict) -> None:
+    print(title)
+    for priority in main.UPDATE_PRIORITIES:
+        values = sorted(waits.get(priority, ()))
+        if values:
+            print(
+                f"  {priority:<13} {len(values):5d} апд.  p50 {percentile(values, 0.5) * 1000:7.1f} мс  "
+                f"p95 {percentile(values, 0.95) * 1000:7.1f} мс  макс {values[-1] * 1000:7.1f} мс"
+            )
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--emergency-every", type=int, default=50)
+    parser.add_argument("--handler-ms", type=float, default=5.0)
+    parser.add_argument("--aging", type=float, default=main.UPDATE_PRIORITY_AGING)
+    args = parser.parse_args()
+
+    bot = Bot("1:bench")
+    batch = updates(bot, args.users, args.emergency_every)
+    fifo = PerUserUpdateProcessor(main.UPDATE_WORKERS, len(batch))
+    prioritized = PerUserUpdateProcessor(
+        main.UPDATE_WORKERS,
+        len(batch),
+        classify=main.update_priority,
+        priorities=main.UPDATE_PRIORITIES,
+        aging=args.aging,
+    )
+    report("FIFO:", asyncio.run(run(fifo, batch, args.handler_ms / 1000)))
+    report(f"Приоритеты, старение {args.aging:g} с:", asyncio.run(run(prioritized, batch, args.handler_ms / 1000)))
+
+
+if __name__ == "__main__":
+    main_cli()
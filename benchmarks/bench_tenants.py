@@ -0,0 +1,73 @@
+"""Память на одного бота в режиме нескольких ботов в процессе.
+
+Собирает ``--tenants`` приложений так же, как main(), – с общим пулом
+соединений к Bot API и общим SSL-контекстом – и сравнивает прирост RSS на
+бота с ботами, собранными ApplicationBuilder по умолчанию (у каждого свои
+HTTP-клиенты), и с размером всего процесса. Сеть не нужна: приложения
+только собираются.
+
+Запуск из корня репозитория (нужен cfg.py):
+
+    python benchmarks/bench_tenants.py --tenants 50
+"""
+
+import argparse
+import gc
+import sys
+from dataclasses import replace
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from telegram.ext import ApplicationBuilder  # noqa: E402
+
+import main  # noqa: E402
+
+
+def rss_kib() -> int:
+    # Текущий, а не пиковый RSS: SSL-контексты живут в памяти OpenSSL, и
+    # tracemalloc их не видит.
+    with open("/proc/self/status") as handle:
+        for line in handle:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    raise RuntimeError("VmRSS недоступен")
+
+
+def measure(build, count: int) -> float:
+    gc.collect()
+    before = rss_kib()
+    applications = [build(index) for index in range(count)]
+    gc.collect()
+    per_app = (rss_kib() - before) / count
+    del applications
+    return per_app
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=50, help="сколько ботов собрать")
+    args = parser.parse_args()
+
+    template = next(iter(main.tenants.values())).config
+
+    def build_tenant(index: int):
+        config = replace(template, tenant_id=f"bench{index}", token=f"{index + 1}:bench")
+        return main.build_application(tenant=main.create_tenant(config))
+
+    def build_default(index: int):
+        return ApplicationBuilder().token(f"{index + 1}:default").build()
+
+    # Первое приложение прогревает импорты и кэши, его в замер не берём.
+    build_tenant(-1)
+    build_default(-1)
+    process = rss_kib()
+    shared = measure(build_tenant, args.tenants)
+    separate = measure(build_default, args.tenants)
+    print(f"Процесс с одним ботом: {process / 1024:.1f} МиБ")
+    print(f"Бот с общими ресурсами: {shared:7.1f} КиБ ({shared / process:.2%} процесса)")
+    print(f"Бот по умолчанию:       {separate:7.1f} КиБ ({separate / process:.2%} процесса)")
+
+
+if __name__ == "__main__":
+    main_cli()
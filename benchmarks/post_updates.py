@@ -0,0 +1,75 @@
+"""Отправка записанных апдейтов на локальный вебхук бота.
+
+Бот должен быть запущен с ``BOT_MODE = "webhook"``. Пример:
+
+    python benchmarks/post_updates.py benchmarks/sample_updates.jsonl \\
+        --url http://127.0.0.1:8443/telegram --secret <WEBHOOK_SECRET> --repeat 100
+
+Файл – JSONL, по одному объекту Update в строке. При повторах update_id
+сдвигается, чтобы апдейты не выглядели дубликатами.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+
+import httpx
+
+
+def load_updates(path: Path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+
+async def post_all(url: str, secret: str, updates, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = {}
+
+    async with httpx.AsyncClient(timeout=30) as client:
+
+        async def post(update):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(
+                    url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": secret}
+                )
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(update) for update in updates))
+        elapsed = time.perf_counter() - started
+    return latencies, statuses, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", type=Path)
+    parser.add_argument("--url", default="http://127.0.0.1:8443/telegram")
+    parser.add_argument("--secret", required=True)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    recorded = load_updates(args.file)
+    updates = []
+    for round_no in range(args.repeat):
+        for update in recorded:
+            updates.append({**update, "update_id": update["update_id"] + round_no * len(recorded)})
+
+    latencies, statuses, elapsed = asyncio.run(post_all(args.url, args.secret, updates, args.concurrency))
+    latencies.sort()
+    print(f"Отправлено: {len(updates)} за {elapsed:.2f} с ({len(updates) / elapsed:.0f} в секунду)")
+    print(f"Статусы: {statuses}")
+    print(
+        f"Задержка ответа, мс: p50={statistics.median(latencies) * 1000:.1f}"
+        f" p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}"
+        f" max={latencies[-1] * 1000:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
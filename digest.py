@@ -0,0 +1,136 @@
+import html
+import re
+import sqlite3
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from telegram.constants import ParseMode
+
+from outbox import enqueue_notification
+from storage import insert_row
+
+DIGEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS admin_digest (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    parse_mode TEXT,
+    created_at TEXT
+)
+"""
+
+# Ограничение Telegram на длину одного сообщения с запасом под заголовок сводки.
+MESSAGE_LIMIT = 4096 - 64
+SEPARATOR = "\n\n➖➖➖\n\n"
+TAG_RE = re.compile(r"<[^>]*>")
+
+
+def enqueue_digest_item(
+    conn: sqlite3.Connection,
+    tenant_id: str,
+    chat_id: int,
+    text: str,
+    parse_mode: Optional[str] = None,
+    media_kind: Optional[str] = None,
+    file_id: Optional[str] = None,
+) -> int:
+    """Откладывает заявку до сводки; с ``file_id`` – вложение, которое уйдёт после неё."""
+    return insert_row(
+        conn,
+        "admin_digest",
+        {
+            "tenant_id": tenant_id,
+            "chat_id": chat_id,
+            "text": text,
+            "parse_mode": parse_mode,
+            "media_kind": media_kind,
+            "file_id": file_id,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        },
+    )
+
+
+def pending_digest_items(conn: sqlite3.Connection, tenant_id: str) -> int:
+    """Сколько заявок ждёт сводки у получателя, которому их накопилось больше всех."""
+    row = conn.execute(
+        "SELECT COUNT(*) FROM admin_digest WHERE tenant_id = ? AND file_id IS NULL "
+        "GROUP BY chat_id ORDER BY 1 DESC LIMIT 1",
+        (tenant_id,),
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def shorten_html(text: str, limit: int) -> str:
+    """Обрезает HTML до ``limit`` символов, не разрывая теги и сущности.
+
+    Слишком длинная заявка остаётся без разметки: теги снимаются, а текст
+    обрезается до экранирования.
+    """
+    if len(text) <= limit:
+        return text
+    pieces: List[str] = []
+    size = 0
+    for char in html.unescape(TAG_RE.sub("", text)):
+        piece = html.escape(char, quote=False)
+        if size + len(piece) > limit:
+            break
+        pieces.append(piece)
+        size += len(piece)
+    return "".join(pieces)
+
+
+def pack_digest(
+    items: List[str], max_items: int, limit: int = MESSAGE_LIMIT, parse_mode: Optional[str] = None
+) -> List[List[str]]:
+    """Раскладывает заявки по сообщениям не больше ``max_items`` штук и ``limit`` символов."""
+    messages: List[List[str]] = []
+    current: List[str] = []
+    size = 0
+    for text in items:
+        text = shorten_html(text, limit) if parse_mode == ParseMode.HTML else text[:limit]
+        added = len(text) + (len(SEPARATOR) if current else 0)
+        if current and (len(current) >= max_items or size + added > limit):
+            messages.append(current)
+            current, size = [], 0
+            added = len(text)
+        current.append(text)
+        size += added
+    if current:
+        messages.append(current)
+    return messages
+
+
+def flush_digest(conn: sqlite3.Connection, tenant_id: str, max_items: int) -> int:
+    """Переносит отложенные заявки в admin_outbox сводками и возвращает их число.
+
+    Выполняется одной операцией записи: строки сводки либо все попадают в
+    очередь отправки, либо остаются на месте.
+    """
+    rows: List[Tuple[int, int, str, Optional[str], Optional[str], Optional[str]]] = conn.execute(
+        "SELECT id, chat_id, text, parse_mode, media_kind, file_id FROM admin_digest WHERE tenant_id = ? "
+        "ORDER BY chat_id, parse_mode, id",
+        (tenant_id,),
+    ).fetchall()
+    if not rows:
+        return 0
+    groups: Dict[Tuple[int, Optional[str]], List[str]] = {}
+    media: Dict[int, List[Tuple[str, Optional[str], str, str]]] = {}
+    for _, chat_id, text, parse_mode, media_kind, file_id in rows:
+        if file_id is None:
+            groups.setdefault((chat_id, parse_mode), []).append(text)
+        else:
+            media.setdefault(chat_id, []).append((text, parse_mode, media_kind, file_id))
+    for (chat_id, parse_mode), texts in groups.items():
+        parts = pack_digest(texts, max_items, parse_mode=parse_mode)
+        for index, part in enumerate(parts, start=1):
+            counter = f" {index}/{len(parts)}" if len(parts) > 1 else ""
+            header = f"🗂 Сводка заявок{counter}: {len(part)}\n\n"
+            enqueue_notification(conn, tenant_id, chat_id, header + SEPARATOR.join(part), parse_mode)
+    # Вложения встают в очередь чата после текста сводки и уходят за ним.
+    for chat_id, files in media.items():
+        for text, parse_mode, media_kind, file_id in files:
+            enqueue_notification(conn, tenant_id, chat_id, text, parse_mode, media_kind, file_id)
+    conn.execute(
+        "DELETE FROM admin_digest WHERE tenant_id = ? AND id <= ?", (tenant_id, max(row[0] for row in rows))
+    )
+    return sum(file_id is None for *_, file_id in rows)
@@ -0,0 +1,148 @@
+import secrets
+import sqlite3
+import sys
+import time
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Dict, List, Optional, Type, TypeVar, Union
+
+from storage import insert_row
+
+# Черновики заявок в user_data. Классы со слотами занимают в разы меньше
+# словарей с теми же полями, а touched_at позволяет вытеснять брошенные.
+# token – ключ идемпотентности: повторная отправка того же черновика не
+# создаёт вторую заявку.
+
+ABANDONED_EMERGENCIES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS abandoned_emergencies (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    phone TEXT,
+    address TEXT,
+    coordinates TEXT,
+    article TEXT,
+    touched_at INTEGER,
+    created_at INTEGER
+)
+"""
+ABANDONED_EMERGENCIES_INDEX = (
+    "CREATE INDEX IF NOT EXISTS idx_abandoned_emergencies_created "
+    "ON abandoned_emergencies (created_at)"
+)
+
+
+def new_token() -> str:
+    return secrets.token_urlsafe(12)
+
+
+@dataclass(slots=True)
+class EmergencyDraft:
+    phone: Optional[str] = None
+    address: Optional[str] = None
+    coordinates: Optional[str] = None
+    location_label: Optional[str] = None
+    article: Optional[str] = None
+    token: str = field(default_factory=new_token)
+    touched_at: float = field(default_factory=time.time)
+
+    def touch(self, now: Optional[float] = None) -> None:
+        self.touched_at = time.time() if now is None else now
+
+    def is_empty(self) -> bool:
+        return not (self.phone or self.address or self.coordinates or self.article)
+
+    def location(self) -> Optional[str]:
+        """Адрес текстом, а без него – координаты с подписью ближайшего пункта."""
+        if self.address:
+            return self.address
+        if self.coordinates and self.location_label:
+            return f"{self.coordinates} ({self.location_label})"
+        return self.coordinates
+
+
+@dataclass(slots=True, frozen=True)
+class Attachment:
+    """Файл, приложенный к заявке: содержимое лежит в media.MediaStore по sha256."""
+
+    kind: str
+    file_id: str
+    file_unique_id: str
+    sha256: str
+    size: int
+    file_name: Optional[str] = None
+
+
+@dataclass(slots=True)
+class ConsultDraft:
+    city: Optional[str] = None
+    phone: Optional[str] = None
+    urgency: Optional[str] = None
+    article: Optional[str] = None
+    description: Optional[str] = None
+    preferred_date: Optional[str] = None
+    preferred_time: Optional[str] = None
+    attachments: List[Attachment] = field(default_factory=list)
+    token: str = field(default_factory=new_token)
+    touched_at: float = field(default_factory=time.time)
+
+    def __post_init__(self) -> None:
+        # Из сохранённого JSON вложения читаются словарями.
+        self.attachments = [
+            item if isinstance(item, Attachment) else Attachment(**item) for item in self.attachments
+        ]
+
+    def touch(self, now: Optional[float] = None) -> None:
+        self.touched_at = time.time() if now is None else now
+
+
+Draft = Union[EmergencyDraft, ConsultDraft]
+D = TypeVar("D", EmergencyDraft, ConsultDraft)
+
+
+def draft_to_json(value: Any) -> Dict[str, Any]:
+    """``default`` для json.dumps: черновик сохраняется обычным объектом."""
+    if isinstance(value, (EmergencyDraft, ConsultDraft)):
+        return asdict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def draft_from_json(cls: Type[D], value: Any) -> Optional[D]:
+    # Неизвестные ключи отбрасываются: так читаются и словари, сохранённые
+    # до появления классов, и черновики с полями из будущих версий.
+    if isinstance(value, cls):
+        return value
+    if not isinstance(value, dict):
+        return None
+    known = {item.name for item in fields(cls)}
+    return cls(**{key: item for key, item in value.items() if key in known})
+
+
+def draft_size(draft: Union[Draft, Attachment]) -> int:
+    """Примерный размер черновика в байтах вместе со строками полей."""
+    size = sys.getsizeof(draft)
+    for item in fields(draft):
+        value = getattr(draft, item.name)
+        if isinstance(value, str):
+            size += sys.getsizeof(value)
+        elif isinstance(value, list):
+            size += sys.getsizeof(value) + sum(draft_size(element) for element in value)
+    return size
+
+
+def save_abandoned_emergency(
+    conn: sqlite3.Connection, tenant_id: str, user_id: int, draft: EmergencyDraft
+) -> int:
+    return insert_row(
+        conn,
+        "abandoned_emergencies",
+        {
+            "tenant_id": tenant_id,
+            "user_id": user_id,
+            "phone": draft.phone,
+            "address": draft.address,
+            "coordinates": draft.coordinates,
+            "location_label": draft.location_label,
+            "article": draft.article,
+            "touched_at": int(draft.touched_at),
+            "created_at": int(time.time()),
+        },
+    )
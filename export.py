@@ -0,0 +1,226 @@
+import csv
+import json
+import sqlite3
+import tempfile
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from archive import attach_month, has_table, months_in_range
+
+# Псевдонимы, которые админ пишет в команде, и таблицы за ними.
+EXPORT_TABLES = {
+    "emergency": "emergency_calls",
+    "emergency_calls": "emergency_calls",
+    "экстренные": "emergency_calls",
+    "consultations": "consultations",
+    "consult": "consultations",
+    "консультации": "consultations",
+}
+# Что попадает в выгрузку: столбцы перечислены явно, чтобы служебные поля,
+# которые появятся в таблицах, не уходили админу. В архивах старых месяцев
+# недостающие столбцы пустые.
+EXPORT_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "emergency_calls": (
+        "id",
+        "created_at",
+        "user_id",
+        "username",
+        "full_name",
+        "phone",
+        "address",
+        "coordinates",
+        "location_label",
+        "article",
+    ),
+    "consultations": (
+        "id",
+        "created_at",
+        "user_id",
+        "username",
+        "full_name",
+        "city",
+        "phone",
+        "urgency",
+        "article",
+        "description",
+        "preferred_date",
+        "preferred_time",
+    ),
+}
+EXPORT_FORMATS = ("csv", "jsonl")
+PAGE_SIZE = 1000
+# Бот не может отправить документ больше 50 МБ.
+DOCUMENT_LIMIT = 50 * 1024 * 1024
+
+EXPORT_USAGE = (
+    "Использование: /export <emergency|consultations> [с ГГГГ-ММ-ДД] [по ГГГГ-ММ-ДД] [csv|jsonl]\n"
+    "Например: /export consultations 2025-01-01 2025-01-31 jsonl"
+)
+
+
+@dataclass(frozen=True)
+class ExportRequest:
+    table: str
+    since: Optional[date] = None
+    until: Optional[date] = None
+    fmt: str = "csv"
+
+    @property
+    def filename(self) -> str:
+        since = self.since.isoformat() if self.since else "start"
+        until = self.until.isoformat() if self.until else "now"
+        return f"{self.table}_{since}_{until}.{self.fmt}"
+
+    def bounds(self) -> Tuple[int, int]:
+        # Даты включительно, в UTC – так же, как хранится created_at.
+        low = _epoch(self.since) if self.since else 0
+        high = _epoch(self.until + timedelta(days=1)) if self.until else 2**62
+        return low, high
+
+
+def _epoch(day: date) -> int:
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+
+
+def parse_export_args(args: Sequence[str]) -> ExportRequest:
+    if not args or args[0].lower() not in EXPORT_TABLES:
+        raise ValueError(EXPORT_USAGE)
+    table = EXPORT_TABLES[args[0].lower()]
+    dates: List[date] = []
+    fmt = "csv"
+    for arg in args[1:]:
+        if arg.lower() in EXPORT_FORMATS:
+            fmt = arg.lower()
+            continue
+        try:
+            dates.append(date.fromisoformat(arg))
+        except ValueError:
+            raise ValueError(f"Не понял «{arg}».\n{EXPORT_USAGE}") from None
+    if len(dates) > 2:
+        raise ValueError(EXPORT_USAGE)
+    since = dates[0] if dates else None
+    until = dates[1] if len(dates) > 1 else None
+    if since and until and since > until:
+        raise ValueError("Начало периода позже конца.")
+    return ExportRequest(table, since, until, fmt)
+
+
+def iter_pages(
+    conn: sqlite3.Connection,
+    tenant_id: str,
+    table: str,
+    low: int,
+    high: int,
+    page_size: int = PAGE_SIZE,
+    schema: str = "main",
+    after: Optional[Tuple[int, int]] = None,
+) -> Iterator[Tuple[List[str], List[tuple]]]:
+    """Страницы строк одного бота по (created_at, id) без OFFSET.
+
+    Каждая страница – отдельный короткий запрос по idx_*_tenant_created, поэтому
+    чтение не держит снимок базы всё время выгрузки и не мешает записи.
+    ``after`` – (created_at, id) последней уже выгруженной строки.
+    """
+    # Нижняя граница сдвигается вместе с курсором, чтобы каждая страница
+    # начиналась с поиска по индексу, а не с просмотра уже выгруженного.
+    cursor_at, cursor_id = after if after is not None and after[0] >= low else (low, -1)
+    while True:
+        cursor = conn.execute(
+            f"""
+            SELECT * FROM {schema}.{table}
+            WHERE tenant_id = ? AND created_at >= ? AND created_at < ? AND (created_at > ? OR id > ?)
+            ORDER BY created_at, id LIMIT ?
+            """,
+            (tenant_id, cursor_at, high, cursor_at, cursor_id, page_size),
+        )
+        columns = [column[0] for column in cursor.description]
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        yield columns, rows
+        last = dict(zip(columns, rows[-1]))
+        cursor_at, cursor_id = last["created_at"], last["id"]
+
+
+def iter_all_pages(
+    conn: sqlite3.Connection,
+    tenant_id: str,
+    table: str,
+    low: int,
+    high: int,
+    page_size: int = PAGE_SIZE,
+    archive_dir: Optional[Path] = None,
+) -> Iterator[Tuple[List[str], List[tuple]]]:
+    """Страницы из архивов нужных месяцев (см. archive.py), затем из рабочей базы.
+
+    Архив подключается, только если период захватывает его месяц. Курсор
+    переходит из источника в источник, поэтому строка, уже скопированная в
+    архив, но ещё не удалённая из рабочей базы, попадает в выгрузку один раз.
+    """
+    after: Optional[Tuple[int, int]] = None
+    months = months_in_range(archive_dir, low, high) if archive_dir is not None else []
+    for _, path in months:
+        with attach_month(conn, path) as schema:
+            if not has_table(conn, schema, table):
+                continue
+            for columns, rows in iter_pages(conn, tenant_id, table, low, high, page_size, schema, after):
+                yield columns, rows
+                last = dict(zip(columns, rows[-1]))
+                after = last["created_at"], last["id"]
+    yield from iter_pages(conn, tenant_id, table, low, high, page_size, after=after)
+
+
+def _readable(columns: List[str], row: tuple, exported: Sequence[str]) -> dict:
+    found = dict(zip(columns, row))
+    record = {column: found.get(column) for column in exported}
+    if record.get("created_at") is not None:
+        record["created_at"] = datetime.fromtimestamp(record["created_at"], timezone.utc).isoformat()
+    return record
+
+
+def export_to_file(
+    path: Path,
+    tenant_id: str,
+    request: ExportRequest,
+    page_size: int = PAGE_SIZE,
+    archive_dir: Optional[Path] = None,
+) -> Tuple[Path, int]:
+    """Пишет выгрузку во временный файл и возвращает его путь и число строк.
+
+    Работает синхронно со своим соединением только для чтения – вызывать
+    из отдельного потока. С ``archive_dir`` захватывает и архивы за период.
+    """
+    low, high = request.bounds()
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    handle = tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", newline="", suffix=f".{request.fmt}", delete=False
+    )
+    count = 0
+    exported = EXPORT_COLUMNS[request.table]
+    pages = iter_all_pages(conn, tenant_id, request.table, low, high, page_size, archive_dir)
+    try:
+        writer = None
+        # closing: архив отключается до закрытия соединения, даже при ошибке записи.
+        with closing(pages):
+            for columns, rows in pages:
+                records = [_readable(columns, row, exported) for row in rows]
+                if request.fmt == "jsonl":
+                    handle.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+                    count += len(rows)
+                    continue
+                if writer is None:
+                    writer = csv.DictWriter(handle, fieldnames=exported)
+                    writer.writeheader()
+                writer.writerows(records)
+                count += len(rows)
+    except Exception:
+        handle.close()
+        Path(handle.name).unlink(missing_ok=True)
+        raise
+    finally:
+        conn.close()
+    handle.close()
+    return Path(handle.name), count
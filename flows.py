@@ -0,0 +1,213 @@
+import re
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Mapping, MutableMapping, Optional, Tuple
+
+from drafts import ConsultDraft, Draft, EmergencyDraft, draft_from_json, draft_size
+from keyboards import TIME_SLOTS
+
+# Декларативное описание шагов экстренного вызова и консультации.
+# Состояние пользователя хранится в user_data так же, как и раньше:
+# "flow" для экстренного вызова и пара "flow" = "consult" + "consult_step"
+# для консультации. Здесь оно сводится к одному имени состояния, по
+# которому шаг находится в словаре за O(1).
+
+Validator = Callable[[str], Optional[str]]
+
+EMERGENCY_DRAFT = "emergency"
+CONSULT_DRAFT = "consult_data"
+CONSULT_PREFIX = "consult_"
+DRAFT_TYPES = {EMERGENCY_DRAFT: EmergencyDraft, CONSULT_DRAFT: ConsultDraft}
+# Название сценария черновика в метриках и статистике.
+DRAFT_FLOWS = {EMERGENCY_DRAFT: "emergency", CONSULT_DRAFT: "consultation"}
+FLOW_KEYS = ("flow", "consult_step")
+
+EMERGENCY_MENU = "emergency_menu"
+FINALIZE = "finalize"
+
+# Категории действий пользователя: у каждой свой лимит частоты.
+EMERGENCY_ACTION = "emergency"
+CONSULT_ACTION = "consultation"
+NAVIGATION_ACTION = "navigation"
+
+URGENCY_OPTIONS = ("Очень срочно", "Срочно", "Не спешу")
+CONSULT_DAYS_AHEAD = 5
+
+PHONE_DIGITS_RE = re.compile(r"\d")
+
+
+def validate_phone(value: str) -> Optional[str]:
+    digits = len(PHONE_DIGITS_RE.findall(value))
+    if 5 <= digits <= 15:
+        return None
+    return "Похоже, номер указан с ошибкой. Укажите номер телефона, например +7 913 000-00-00."
+
+
+def validate_text(value: str) -> Optional[str]:
+    if value:
+        return None
+    return "Сообщение пустое, напишите, пожалуйста, текстом."
+
+
+def validate_urgency(value: str) -> Optional[str]:
+    return None if value in URGENCY_OPTIONS else "Выберите срочность кнопкой."
+
+
+def validate_time_slot(value: str) -> Optional[str]:
+    return None if value in TIME_SLOTS else "Выберите интервал кнопкой."
+
+
+def validate_date(value: str) -> Optional[str]:
+    try:
+        chosen = date.fromisoformat(value)
+    except ValueError:
+        return "Выберите дату кнопкой."
+    today = datetime.now().date()
+    if today <= chosen < today + timedelta(days=CONSULT_DAYS_AHEAD):
+        return None
+    return "Эта дата уже недоступна, выберите другую."
+
+
+@dataclass(frozen=True)
+class Step:
+    draft: str
+    field: str
+    next_state: str
+    validator: Optional[Validator] = None
+    saved: Optional[str] = None
+
+
+# Шаги, на которых бот ждёт текст.
+TEXT_STEPS: Dict[str, Step] = {
+    "emergency_phone": Step(EMERGENCY_DRAFT, "phone", EMERGENCY_MENU, validate_phone),
+    "emergency_address": Step(EMERGENCY_DRAFT, "address", EMERGENCY_MENU, validate_text),
+    "emergency_article_custom": Step(EMERGENCY_DRAFT, "article", EMERGENCY_MENU, validate_text),
+    "consult_city": Step(CONSULT_DRAFT, "city", "consult_phone", validate_text),
+    "consult_phone": Step(CONSULT_DRAFT, "phone", "consult_urgency", validate_phone),
+    "consult_article_custom": Step(CONSULT_DRAFT, "article", "consult_description", validate_text),
+    "consult_description": Step(CONSULT_DRAFT, "description", "consult_date", validate_text),
+}
+
+# Шаги, на которых значение приходит в callback_data кнопки: ключ – префикс.
+CHOICE_STEPS: Dict[str, Step] = {
+    "consult_urgency_": Step(
+        CONSULT_DRAFT, "urgency", "consult_article", validate_urgency, "Срочность сохранена"
+    ),
+    "consult_date_": Step(
+        CONSULT_DRAFT, "preferred_date", "consult_time", validate_date, "Дата сохранена"
+    ),
+    "consult_time_": Step(
+        CONSULT_DRAFT, "preferred_time", FINALIZE, validate_time_slot, "Время сохранено"
+    ),
+}
+
+
+def current_state(user_data: MutableMapping[str, Any]) -> Optional[str]:
+    flow = user_data.get("flow")
+    if flow == "consult":
+        step = user_data.get("consult_step")
+        return f"{CONSULT_PREFIX}{step}" if step else None
+    return flow
+
+
+def action_category(callback_data: Optional[str], user_data: MutableMapping[str, Any]) -> str:
+    # Кнопки относятся к сценарию по префиксу, сообщения – по текущему шагу.
+    if callback_data is not None:
+        if callback_data.startswith("emergency_"):
+            return EMERGENCY_ACTION
+        if callback_data.startswith(CONSULT_PREFIX):
+            return CONSULT_ACTION
+        return NAVIGATION_ACTION
+    flow = user_data.get("flow")
+    if flow == "consult":
+        return CONSULT_ACTION
+    if flow:
+        return EMERGENCY_ACTION
+    return NAVIGATION_ACTION
+
+
+def set_state(user_data: MutableMapping[str, Any], state: Optional[str]) -> None:
+    if state is None or state == EMERGENCY_MENU:
+        user_data.pop("flow", None)
+    elif state == FINALIZE:
+        user_data["consult_step"] = None
+    elif state.startswith(CONSULT_PREFIX):
+        user_data["flow"] = "consult"
+        user_data["consult_step"] = state[len(CONSULT_PREFIX):]
+    else:
+        user_data["flow"] = state
+    # Любой переход по шагам продлевает жизнь черновикам пользователя.
+    for key in DRAFT_TYPES:
+        draft = user_data.get(key)
+        if draft is not None:
+            draft.touch()
+
+
+def get_draft(user_data: MutableMapping[str, Any], key: str) -> Draft:
+    draft = user_data.get(key)
+    if draft is None:
+        draft = user_data[key] = DRAFT_TYPES[key]()
+    return draft
+
+
+def restore_drafts(user_data: MutableMapping[str, Any]) -> None:
+    """Превращает черновики, прочитанные из JSON, обратно в объекты."""
+    for key, cls in DRAFT_TYPES.items():
+        if key in user_data:
+            draft = draft_from_json(cls, user_data[key])
+            if draft is None:
+                user_data.pop(key)
+            else:
+                user_data[key] = draft
+
+
+def sweep_idle_drafts(
+    users: Mapping[Any, MutableMapping[str, Any]],
+    ttl: float,
+    now: Optional[float] = None,
+    skip: Callable[[Any], bool] = lambda user_id: False,
+) -> List[Tuple[Any, str, Draft]]:
+    """Убирает черновики, не тронутые дольше ``ttl`` секунд.
+
+    Если у пользователя не осталось черновиков, сбрасывается и шаг
+    сценария. Возвращает вытесненные черновики как (user_id, ключ, черновик).
+    """
+    deadline = (time.time() if now is None else now) - ttl
+    evicted: List[Tuple[Any, str, Draft]] = []
+    for user_id, user_data in users.items():
+        stale = [
+            key
+            for key in DRAFT_TYPES
+            if key in user_data and user_data[key].touched_at < deadline
+        ]
+        if not stale or skip(user_id):
+            continue
+        for key in stale:
+            evicted.append((user_id, key, user_data.pop(key)))
+        if not any(key in user_data for key in DRAFT_TYPES):
+            for key in FLOW_KEYS:
+                user_data.pop(key, None)
+    return evicted
+
+
+def draft_stats(users: Mapping[Any, Mapping[str, Any]]) -> Dict[str, int]:
+    stats = {"user_data_entries": len(users), "draft_bytes": 0}
+    stats.update({f"drafts_{flow}": 0 for flow in DRAFT_FLOWS.values()})
+    for user_data in users.values():
+        for key, flow in DRAFT_FLOWS.items():
+            draft = user_data.get(key)
+            if draft is not None:
+                stats[f"drafts_{flow}"] += 1
+                stats["draft_bytes"] += draft_size(draft)
+    return stats
+
+
+def apply_step(user_data: MutableMapping[str, Any], step: Step, value: str) -> Optional[str]:
+    if step.validator:
+        error = step.validator(value)
+        if error:
+            return error
+    setattr(get_draft(user_data, step.draft), step.field, value)
+    set_state(user_data, step.next_state)
+    return None
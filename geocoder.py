@@ -0,0 +1,217 @@
+import bisect
+import csv
+import math
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+# Офлайн-определение ближайшего населённого пункта по координатам.
+#
+# Справочник – CSV со столбцами name, district, region, lat, lon (у крупных
+# городов строка на каждый район с координатами его центра). При старте он
+# один раз переводится в бинарный индекс-сетку, который дальше читается
+# через mmap: точки лежат массивами, отсортированными по номеру ячейки,
+# поэтому поиск просматривает только окно ячеек вокруг точки, расширяя его
+# вдвое, пока найденное не окажется ближе границы окна.
+#
+# Формат файла индекса (порядок байтов – родной для машины, файл
+# пересобирается на месте и между машинами не переносится):
+#   заголовок HEADER: сигнатура, число точек, число непустых ячеек, размер ячейки
+#   keys    uint32[cells]     номера непустых ячеек по возрастанию
+#   starts  uint32[cells + 1] первая точка каждой ячейки
+#   lats    float32[points]
+#   lons    float32[points]
+#   labels  uint32[points + 1] смещения подписей в blob
+#   blob    UTF-8 «name\x1fdistrict\x1fregion» подряд
+
+MAGIC = b"GAZ1"
+HEADER = struct.Struct("=4sIIf")
+CELL_SIZE = 0.5
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# Дальше этого от ближайшей точки подпись говорит «~N км от …».
+NEAR_KM = 3.0
+# Дальше этого поиск не идёт: точка не в зоне справочника.
+MAX_DISTANCE_KM = 300.0
+
+
+class Place(NamedTuple):
+    name: str
+    district: str
+    region: str
+    distance_km: float
+
+    @property
+    def label(self) -> str:
+        parts = [self.name]
+        if self.district:
+            parts.append(self.district)
+        if self.region and self.region != self.name:
+            parts.append(self.region)
+        text = ", ".join(parts)
+        if self.distance_km > NEAR_KM:
+            return f"~{self.distance_km:.0f} км от: {text}"
+        return text
+
+
+def _columns(cell_size: float) -> int:
+    return round(360 / cell_size)
+
+
+def _cell(lat: float, lon: float, cell_size: float) -> Tuple[int, int]:
+    return int((lat + 90) // cell_size), int((lon + 180) // cell_size) % _columns(cell_size)
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    # Разница долгот через антимеридиан: 179 и -179 – это 2°, а не 358°.
+    dlambda = math.radians((lon2 - lon1 + 180) % 360 - 180)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def build_index(csv_path: Path, index_path: Path, cell_size: float = CELL_SIZE) -> int:
+    """Собирает индекс из CSV-справочника и возвращает число точек."""
+    columns = _columns(cell_size)
+    points: List[Tuple[int, float, float, bytes]] = []
+    with open(csv_path, encoding="utf-8", newline="") as handle:
+        for record in csv.DictReader(handle):
+            lat, lon = float(record["lat"]), float(record["lon"])
+            row, column = _cell(lat, lon, cell_size)
+            label = "\x1f".join(
+                (record["name"].strip(), record.get("district", "").strip(), record.get("region", "").strip())
+            )
+            points.append((row * columns + column, lat, lon, label.encode("utf-8")))
+    points.sort(key=lambda point: point[0])
+
+    keys, starts = array("I"), array("I")
+    lats, lons, labels = array("f"), array("f"), array("I", [0])
+    blob = bytearray()
+    for index, (key, lat, lon, label) in enumerate(points):
+        if not keys or keys[-1] != key:
+            keys.append(key)
+            starts.append(index)
+        lats.append(lat)
+        lons.append(lon)
+        blob += label
+        labels.append(len(blob))
+    starts.append(len(points))
+
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    # Запись во временный файл и переименование: открытый mmap старого
+    # индекса в другом процессе не увидит полузаписанный файл.
+    handle = tempfile.NamedTemporaryFile("wb", dir=index_path.parent, delete=False)
+    try:
+        with handle:
+            handle.write(HEADER.pack(MAGIC, len(points), len(keys), cell_size))
+            for values in (keys, starts, lats, lons, labels):
+                values.tofile(handle)
+            handle.write(blob)
+        os.replace(handle.name, index_path)
+    except BaseException:
+        Path(handle.name).unlink(missing_ok=True)
+        raise
+    return len(points)
+
+
+class ReverseGeocoder:
+    """Поиск ближайшей точки справочника по индексу, открытому через mmap."""
+
+    def __init__(self, index_path: Path) -> None:
+        self._file = open(index_path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.points, cells, self.cell_size = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{index_path} не является индексом справочника")
+        self._columns = _columns(self.cell_size)
+        view = memoryview(self._map)
+        offset = HEADER.size
+        self._views = [view]
+
+        def take(code: str, count: int) -> memoryview:
+            nonlocal offset
+            size = count * struct.calcsize(code)
+            part = view[offset:offset + size].cast(code)
+            offset += size
+            self._views.append(part)
+            return part
+
+        self._keys = take("I", cells)
+        self._starts = take("I", cells + 1)
+        self._lats = take("f", self.points)
+        self._lons = take("f", self.points)
+        self._labels = take("I", self.points + 1)
+        self._blob = view[offset:]
+        self._views.append(self._blob)
+
+    def close(self) -> None:
+        for view in reversed(getattr(self, "_views", [])):
+            view.release()
+        self._views = []
+        self._map.close()
+        self._file.close()
+
+    def __len__(self) -> int:
+        return self.points
+
+    def _scan(
+        self, lat: float, lon: float, rows: range, first: int, last: int, best: Tuple[int, float]
+    ) -> Tuple[int, float]:
+        # Ячейки строки сетки идут в индексе подряд, поэтому окно столбцов
+        # каждой строки – два бинарных поиска и непрерывный диапазон точек.
+        # Окно, перешедшее через ±180°, продолжается с другого края строки.
+        best_index, best_km = best
+        if last - first + 1 >= self._columns:
+            spans = [(0, self._columns - 1)]
+        else:
+            first, last = first % self._columns, last % self._columns
+            spans = [(first, last)] if first <= last else [(first, self._columns - 1), (0, last)]
+        for row in rows:
+            for span_first, span_last in spans:
+                low = bisect.bisect_left(self._keys, row * self._columns + span_first)
+                high = bisect.bisect_right(self._keys, row * self._columns + span_last)
+                if low == high:
+                    continue
+                for index in range(self._starts[low], self._starts[high]):
+                    found = distance_km(lat, lon, self._lats[index], self._lons[index])
+                    if found <= best_km:
+                        best_index, best_km = index, found
+        return best_index, best_km
+
+    def nearest(self, lat: float, lon: float, max_km: float = MAX_DISTANCE_KM) -> Optional[Place]:
+        row, column = _cell(lat, lon, self.cell_size)
+        cell_km = self.cell_size * KM_PER_DEGREE
+        best = (-1, max_km)
+        reach = 1
+        while True:
+            # Окно из ±reach строк и стольких столбцов, чтобы и по долготе
+            # (ячейки сужаются к полюсам) оно покрывало круг радиусом
+            # reach * cell_km вокруг точки.
+            top = min(abs(lat) + reach * self.cell_size, 89.0)
+            columns = math.ceil(reach / math.cos(math.radians(top)))
+            best = self._scan(
+                lat, lon, range(row - reach, row + reach + 1), column - columns, column + columns, best
+            )
+            covered = reach * cell_km
+            if covered >= best[1]:
+                break
+            reach *= 2
+        best_index, best_km = best
+        if best_index < 0:
+            return None
+        label = bytes(self._blob[self._labels[best_index]:self._labels[best_index + 1]])
+        name, district, region = label.decode("utf-8").split("\x1f")
+        return Place(name, district, region, best_km)
+
+
+def load_geocoder(csv_path: Path, index_path: Path) -> ReverseGeocoder:
+    """Открывает индекс, пересобирая его, если справочник новее."""
+    if not index_path.exists() or index_path.stat().st_mtime < csv_path.stat().st_mtime:
+        build_index(csv_path, index_path)
+    return ReverseGeocoder(index_path)
@@ -0,0 +1,160 @@
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import FrozenSet, Optional, Tuple
+
+from telegram import (
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    KeyboardButton,
+    ReplyKeyboardMarkup,
+)
+
+from drafts import EmergencyDraft
+
+# Разметка в python-telegram-bot неизменяема, поэтому готовые клавиатуры
+# безопасно переиспользовать между апдейтами и пользователями.
+
+TIME_SLOTS = [
+    "08:00-10:00",
+    "10:00-12:00",
+    "12:00-14:00",
+    "16:00-18:00",
+    "18:00-20:00",
+    "20:00-22:00",
+]
+
+ARTICLE_OPTIONS = ["228", "159", "158", "105", "Другая"]
+
+MAIN_KEYBOARD = ReplyKeyboardMarkup(
+    [["ℹ️ О нас", "✉️ Оставить обращение"], ["📞 Контакты"]], resize_keyboard=True
+)
+
+CONTACT_REQUEST_KEYBOARD = ReplyKeyboardMarkup(
+    [[KeyboardButton("📱 Поделиться номером", request_contact=True)]],
+    resize_keyboard=True,
+    one_time_keyboard=True,
+)
+
+LOCATION_REQUEST_KEYBOARD = ReplyKeyboardMarkup(
+    [[KeyboardButton("📍 Отправить геопозицию", request_location=True)]],
+    resize_keyboard=True,
+    one_time_keyboard=True,
+)
+
+REQUESTS_MENU_KEYBOARD = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("🚨 Экстренный вызов", callback_data="emergency_open")],
+        [InlineKeyboardButton("📨 Обратиться к адвокату", callback_data="consult_open")],
+    ]
+)
+
+URGENCY_KEYBOARD = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("🔥 Очень срочно", callback_data="consult_urgency_Очень срочно")],
+        [InlineKeyboardButton("⚡ Срочно", callback_data="consult_urgency_Срочно")],
+        [InlineKeyboardButton("⏳ Не спешу", callback_data="consult_urgency_Не спешу")],
+    ]
+)
+
+EMERGENCY_PHONE = 1
+EMERGENCY_ADDRESS = 2
+EMERGENCY_ARTICLE = 4
+
+
+def checkbox(value) -> str:
+    return "✅" if value else "⬜️"
+
+
+def emergency_mask(data: EmergencyDraft) -> int:
+    mask = 0
+    if data.phone:
+        mask |= EMERGENCY_PHONE
+    if data.address or data.coordinates:
+        mask |= EMERGENCY_ADDRESS
+    if data.article:
+        mask |= EMERGENCY_ARTICLE
+    return mask
+
+
+def emergency_keyboard(data: EmergencyDraft) -> InlineKeyboardMarkup:
+    return build_emergency_keyboard(emergency_mask(data))
+
+
+@lru_cache(maxsize=8)
+def build_emergency_keyboard(mask: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        [
+            [
+                InlineKeyboardButton(
+                    f"{checkbox(mask & EMERGENCY_PHONE)} Указать номер",
+                    callback_data="emergency_phone",
+                )
+            ],
+            [
+                InlineKeyboardButton(
+                    f"{checkbox(mask & EMERGENCY_ADDRESS)} Указать адрес",
+                    callback_data="emergency_address",
+                )
+            ],
+            [
+                InlineKeyboardButton(
+                    f"{checkbox(mask & EMERGENCY_ARTICLE)} Указать статью",
+                    callback_data="emergency_article_menu",
+                )
+            ],
+            [InlineKeyboardButton("📤 Отправить экстренный вызов", callback_data="emergency_submit")],
+            [InlineKeyboardButton("⬅️ Вернуться к выбору", callback_data="back_to_requests")],
+        ]
+    )
+
+
+@lru_cache(maxsize=None)
+def article_keyboard(prefix: str) -> InlineKeyboardMarkup:
+    buttons = [
+        [InlineKeyboardButton(option, callback_data=f"{prefix}_{option}")]
+        for option in ARTICLE_OPTIONS
+    ]
+    buttons.append([InlineKeyboardButton("⬅️ Назад", callback_data=f"{prefix}_back")])
+    return InlineKeyboardMarkup(buttons)
+
+
+def consultation_date_keyboard(full_days: FrozenSet[date] = frozenset()) -> InlineKeyboardMarkup:
+    # Ключ кэша – текущая дата и занятые дни, поэтому после полуночи или
+    # новой записи клавиатура строится заново, а старая вытесняется.
+    return build_consultation_date_keyboard(datetime.now().date(), full_days)
+
+
+@lru_cache(maxsize=8)
+def build_consultation_date_keyboard(
+    today: date, full_days: FrozenSet[date] = frozenset()
+) -> InlineKeyboardMarkup:
+    options = [today + timedelta(days=i) for i in range(0, 5)]
+    options = [option for option in options if option not in full_days]
+    buttons = [
+        [
+            InlineKeyboardButton(
+                option.strftime("%d.%m (%A)"), callback_data=f"consult_date_{option.isoformat()}"
+            )
+        ]
+        for option in options
+    ]
+    return InlineKeyboardMarkup(buttons)
+
+
+@lru_cache(maxsize=64)
+def consultation_time_keyboard(slots: Tuple[str, ...] = tuple(TIME_SLOTS)) -> InlineKeyboardMarkup:
+    # Вариантов набора свободных интервалов немного, кэшируется каждый.
+    return InlineKeyboardMarkup(
+        [[InlineKeyboardButton(slot, callback_data=f"consult_time_{slot}")] for slot in slots]
+    )
+
+
+def search_page_keyboard(offset: int, total: int, page_size: int) -> Optional[InlineKeyboardMarkup]:
+    buttons = []
+    if offset > 0:
+        buttons.append(
+            InlineKeyboardButton("⬅️ Назад", callback_data=f"find_page_{max(offset - page_size, 0)}")
+        )
+    if offset + page_size < total:
+        buttons.append(InlineKeyboardButton("Далее ➡️", callback_data=f"find_page_{offset + page_size}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
@@ -1,31 +1,105 @@
+import asyncio
+import html
 import logging
-import re
+import secrets
 import sqlite3
-from datetime import datetime, timedelta
-from html import unescape
+import time
+from collections import Counter
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Dict, Optional
-from urllib.error import HTTPError, URLError
-from urllib.request import Request, urlopen
-
-from telegram import (
-    InlineKeyboardButton,
-    InlineKeyboardMarkup,
-    KeyboardButton,
-    ReplyKeyboardMarkup,
-    Update,
-)
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+import httpx
+from telegram import Bot, InlineKeyboardMarkup, Update
 from telegram.constants import ParseMode
+from telegram.error import TelegramError
 from telegram.ext import (
+    Application,
     ApplicationBuilder,
     CallbackQueryHandler,
     CommandHandler,
+    ApplicationHandlerStop,
     ContextTypes,
     MessageHandler,
+    TypeHandler,
     filters,
 )
-
-from cfg import TELEGRAM_BOT_TOKEN, ADMIN_ID
+from telegram.request import HTTPXRequest
+
+from about import AboutInfoProvider
+from analytics import (
+    count_archived_requests,
+    count_requests,
+    format_report,
+    parse_analytics_args,
+    read_report,
+    record_request,
+    replace_rollups,
+)
+from archive import Archiver, enable_incremental_vacuum
+import cfg
+from digest import MESSAGE_LIMIT, enqueue_digest_item, flush_digest, pending_digest_items, shorten_html
+from drafts import Attachment, ConsultDraft, EmergencyDraft, draft_to_json, save_abandoned_emergency
+from export import DOCUMENT_LIMIT, ExportRequest, export_to_file, parse_export_args
+from flows import (
+    CHOICE_STEPS,
+    CONSULT_ACTION,
+    CONSULT_DAYS_AHEAD,
+    CONSULT_DRAFT,
+    DRAFT_FLOWS,
+    EMERGENCY_ACTION,
+    EMERGENCY_DRAFT,
+    EMERGENCY_MENU,
+    FINALIZE,
+    TEXT_STEPS,
+    NAVIGATION_ACTION,
+    Step,
+    action_category,
+    apply_step,
+    current_state,
+    draft_stats,
+    get_draft,
+    restore_drafts,
+    set_state,
+    sweep_idle_drafts,
+)
+from geocoder import ReverseGeocoder, load_geocoder
+from keyboards import (
+    CONTACT_REQUEST_KEYBOARD,
+    LOCATION_REQUEST_KEYBOARD,
+    MAIN_KEYBOARD,
+    REQUESTS_MENU_KEYBOARD,
+    TIME_SLOTS,
+    URGENCY_KEYBOARD,
+    article_keyboard,
+    consultation_date_keyboard,
+    consultation_time_keyboard,
+    emergency_keyboard,
+    search_page_keyboard,
+)
+from media import MEDIA_MAX_BYTES, MediaStore, MediaTooLarge, known_media, link_attachments, remember_media
+from metrics import PrometheusServer, metrics
+from migrations import migrate
+from outbox import OutboxSender, enqueue_notification
+from persistence import SQLitePersistence
+from ratelimit import RateLimiter
+from router import CallbackRouter, Handler
+from routing import RecipientRouter
+from search import FIND_PAGE_SIZE, RANK_LIMIT, FindQuery, format_hit, parse_find_args, search_requests
+from slots import SlotBook, SlotTaken
+from storage import Database, connect, insert_row
+from submissions import DuplicateSubmission, SubmissionCache, check_token
+from tenants import (
+    DEFAULT_TENANT,
+    SharedHTTPXRequest,
+    Tenant,
+    TenantConfig,
+    load_tenants,
+    serve_applications,
+)
+from update_processor import PerUserUpdateProcessor
+from webhook import WebhookServer, build_ssl_context, serve_webhook
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -33,188 +107,385 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-MAIN_KEYBOARD = ReplyKeyboardMarkup(
-    [["ℹ️ О нас", "✉️ Оставить обращение"], ["📞 Контакты"]], resize_keyboard=True
-)
+TELEGRAM_BOT_TOKEN = getattr(cfg, "TELEGRAM_BOT_TOKEN", "")
+ADMIN_ID = getattr(cfg, "ADMIN_ID", 0)
 ABOUT_URL = "http://advpankratova.ru/"
+ABOUT_TTL = 6 * 60 * 60
+ABOUT_REFRESH_INTERVAL = 30 * 60
 DB_PATH = Path("DataBase") / "advbot.db"
+# Справочник населённых пунктов для подписи присланных геопозиций и его
+# бинарный индекс, который собирается при старте рядом с базой.
+GAZETTEER_PATH = Path(getattr(cfg, "GAZETTEER_PATH", "gazetteer_ru.csv"))
+GAZETTEER_INDEX_PATH = DB_PATH.parent / "gazetteer.idx"
+# Заявки старше ARCHIVE_AFTER_DAYS дней раз в ARCHIVE_INTERVAL секунд
+# переносятся в помесячные архивы рядом с базой (см. archive.py); 0 или
+# None – хранить всё в рабочей базе.
+ARCHIVE_DIR = DB_PATH.parent / "archive"
+ARCHIVE_AFTER_DAYS = getattr(cfg, "ARCHIVE_AFTER_DAYS", 365)
+ARCHIVE_INTERVAL = getattr(cfg, "ARCHIVE_INTERVAL", 24 * 60 * 60)
+# Файлы к заявкам на консультацию (см. media.py) и их число в одной заявке.
+MEDIA_DIR = DB_PATH.parent / "media"
+MAX_ATTACHMENTS = getattr(cfg, "MAX_ATTACHMENTS", 10)
+DB_BATCH_SIZE = 64
+DB_FLUSH_INTERVAL = 0.05
+EMERGENCY_DURABLE_WRITES = True
+PERSISTENCE_FLUSH_INTERVAL = 10
+# Сколько консультаций можно записать на один интервал одного дня.
+SLOT_CAPACITY = getattr(cfg, "SLOT_CAPACITY", 1)
+# Консультации с остальной срочностью копятся и уходят адвокату сводкой:
+# раз в DIGEST_INTERVAL секунд или как только наберётся DIGEST_MAX_ITEMS заявок.
+IMMEDIATE_URGENCIES = getattr(cfg, "IMMEDIATE_URGENCIES", ("Очень срочно",))
+DIGEST_INTERVAL = getattr(cfg, "DIGEST_INTERVAL", 60 * 60)
+DIGEST_MAX_ITEMS = getattr(cfg, "DIGEST_MAX_ITEMS", 10)
+# Черновики заявок, не тронутые DRAFT_TTL секунд, вытесняются из памяти;
+# брошенные экстренные вызовы с данными сохраняются и попадают в сводку.
+DRAFT_TTL = getattr(cfg, "DRAFT_TTL", 24 * 60 * 60)
+DRAFT_SWEEP_INTERVAL = getattr(cfg, "DRAFT_SWEEP_INTERVAL", 10 * 60)
+PERSIST_ABANDONED_EMERGENCIES = getattr(cfg, "PERSIST_ABANDONED_EMERGENCIES", True)
+# Получатели уведомлений по виду заявки, статье и срочности (см. routing.py);
+# без правил всё уходит ADMIN_ID. OUTBOX_CONCURRENCY – сколько отправок
+# разным получателям идёт одновременно.
+NOTIFY_ROUTES = getattr(cfg, "NOTIFY_ROUTES", ())
+OUTBOX_CONCURRENCY = getattr(cfg, "OUTBOX_CONCURRENCY", 8)
+# После стольких сетевых ошибок подряд уведомление снимается с очереди.
+OUTBOX_MAX_ATTEMPTS = getattr(cfg, "OUTBOX_MAX_ATTEMPTS", 10)
+# Пул соединений к Bot API, общий для всех ботов процесса (см. tenants.py).
+BOT_POOL_SIZE = getattr(cfg, "BOT_POOL_SIZE", 256)
+UPDATE_QUEUE_SIZE = getattr(cfg, "UPDATE_QUEUE_SIZE", 1000)
+UPDATE_WORKERS = getattr(cfg, "UPDATE_WORKERS", 8)
+# Сколько апдейтов одного пользователя может ждать своей очереди; лишние
+# отбрасываются, не занимая мест в UPDATE_QUEUE_SIZE.
+UPDATE_USER_PENDING = getattr(cfg, "UPDATE_USER_PENDING", 20)
+# Свободный воркер берёт сначала экстренные апдейты, затем консультации, затем
+# меню и справку; каждый следующий класс уступает предыдущему не дольше
+# UPDATE_PRIORITY_AGING секунд ожидания (см. update_processor.py).
+UPDATE_PRIORITIES = (EMERGENCY_ACTION, CONSULT_ACTION, NAVIGATION_ACTION)
+UPDATE_PRIORITY_AGING = getattr(cfg, "UPDATE_PRIORITY_AGING", 1.0)
+
+# Режим получения апдейтов: "polling" (по умолчанию) или "webhook".
+BOT_MODE = getattr(cfg, "BOT_MODE", "polling")
+WEBHOOK_URL = getattr(cfg, "WEBHOOK_URL", None)
+WEBHOOK_LISTEN = getattr(cfg, "WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = getattr(cfg, "WEBHOOK_PORT", 8443)
+WEBHOOK_PATH = getattr(cfg, "WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = getattr(cfg, "WEBHOOK_SECRET", None)
+WEBHOOK_CERT = getattr(cfg, "WEBHOOK_CERT", None)
+WEBHOOK_KEY = getattr(cfg, "WEBHOOK_KEY", None)
+WEBHOOK_MAX_CONNECTIONS = getattr(cfg, "WEBHOOK_MAX_CONNECTIONS", 40)
+
+METRICS_ENABLED = getattr(cfg, "METRICS_ENABLED", False)
+METRICS_LISTEN = getattr(cfg, "METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = getattr(cfg, "METRICS_PORT", None)
+metrics.configure(enabled=METRICS_ENABLED)
+
+# Лимиты частоты на пользователя: {"emergency": (ёмкость, токенов в секунду), ...}.
+RATE_LIMIT_ENABLED = getattr(cfg, "RATE_LIMIT_ENABLED", True)
+RATE_LIMITS = getattr(cfg, "RATE_LIMITS", None)
+RATE_LIMIT_IDLE_TTL = getattr(cfg, "RATE_LIMIT_IDLE_TTL", 600)
+RATE_LIMIT_TEXT = "Слишком много запросов. Подождите немного и попробуйте снова."
+# Сколько отправленных заявок помнить для ответа на повторные нажатия.
+SUBMISSION_CACHE_SIZE = getattr(cfg, "SUBMISSION_CACHE_SIZE", 10_000)
+MEDIA_TOO_LARGE_TEXT = "Файл больше 20 МБ, бот не может его принять. Пришлите файл поменьше."
+EMERGENCY_CONFIRMATION = "Спасибо! Экстренный вызов передан адвокату."
+CONSULT_CONFIRMATION = "Спасибо! Заявка передана адвокату."
+DEFAULT_GREETING = (
+    "Здравствуйте! Вас приветствует официальный бот для связи с адвокатом Панкратовой А.В.\n\n"
+    "Выберите действие ниже."
+)
+DEFAULT_CONTACTS = "Связаться с адвокатом:\nТелеграм: @user\nТелефон: +7 (913) 977-19-10"
+# Боты процесса: cfg.TENANTS или один бот из TELEGRAM_BOT_TOKEN и ADMIN_ID.
+TENANT_CONFIGS = load_tenants(
+    getattr(cfg, "TENANTS", ()),
+    default=TenantConfig(
+        DEFAULT_TENANT,
+        TELEGRAM_BOT_TOKEN,
+        int(ADMIN_ID),
+        ABOUT_URL,
+        DEFAULT_GREETING,
+        DEFAULT_CONTACTS,
+        tuple(NOTIFY_ROUTES),
+        SLOT_CAPACITY,
+    ),
+)
+TENANT_KEY = "tenant"
+# user_data приложений по токену бота: класс апдейта определяется ещё до
+# того, как он попал в приложение.
+user_data_by_token: Dict[str, Mapping[int, Dict[str, Any]]] = {}
+
+
+def update_category(update: Update, user_data: Mapping[str, Any]) -> str:
+    query = update.callback_query
+    message = update.message
+    if message is not None and message.text and message.text.startswith("/"):
+        return NAVIGATION_ACTION
+    return action_category(query.data if query else None, user_data)
+
+
+def update_priority(update: object) -> str:
+    if not isinstance(update, Update) or update.effective_user is None:
+        return NAVIGATION_ACTION
+    try:
+        user_data = user_data_by_token.get(update.get_bot().token, {})
+    except RuntimeError:
+        user_data = {}
+    return update_category(update, user_data.get(update.effective_user.id, {}))
+
+
+database = Database(DB_PATH, batch_size=DB_BATCH_SIZE, flush_interval=DB_FLUSH_INTERVAL)
+update_processor = PerUserUpdateProcessor(
+    workers=UPDATE_WORKERS,
+    max_pending=UPDATE_QUEUE_SIZE,
+    max_user_pending=UPDATE_USER_PENDING,
+    classify=update_priority,
+    priorities=UPDATE_PRIORITIES,
+    aging=UPDATE_PRIORITY_AGING,
+)
+rate_limiter = RateLimiter(RATE_LIMITS, idle_ttl=RATE_LIMIT_IDLE_TTL)
+submissions = SubmissionCache(SUBMISSION_CACHE_SIZE)
+archiver = Archiver(database, ARCHIVE_DIR, ARCHIVE_AFTER_DAYS) if ARCHIVE_AFTER_DAYS else None
+prometheus_server: Optional[PrometheusServer] = None
+geocoder: Optional[ReverseGeocoder] = None
+# Корневые сертификаты загружаются один раз на процесс: SSL-контекст в
+# каждом HTTP-клиенте стоил бы около мегабайта на бота.
+tls_context = httpx.create_ssl_context()
+bot_request = SharedHTTPXRequest(connection_pool_size=BOT_POOL_SIZE, httpx_kwargs={"verify": tls_context})
+about_providers: Dict[str, AboutInfoProvider] = {}
+media_store = MediaStore(MEDIA_DIR, verify=tls_context)
+# Сколько ботов запущено: общие ресурсы поднимает первый и закрывает последний.
+running_tenants = 0
+
+
+def create_tenant(config: TenantConfig) -> Tenant:
+    about = about_providers.get(config.about_url)
+    refreshes_about = about is None
+    if about is None:
+        about = about_providers[config.about_url] = AboutInfoProvider(
+            config.about_url, ttl=ABOUT_TTL, verify=tls_context
+        )
+    return Tenant(
+        config,
+        about,
+        SlotBook(config.tenant_id, TIME_SLOTS, capacity=config.slot_capacity),
+        RecipientRouter.from_config(config.notify_routes, default=(config.admin_id,)),
+        OutboxSender(
+            database, config.tenant_id, concurrency=OUTBOX_CONCURRENCY, max_attempts=OUTBOX_MAX_ATTEMPTS
+        ),
+        refreshes_about,
+    )
+
 
-TIME_SLOTS = [
-    "08:00-10:00",
-    "10:00-12:00",
-    "12:00-14:00",
-    "16:00-18:00",
-    "18:00-20:00",
-    "20:00-22:00",
-]
+tenants: Dict[str, Tenant] = {config.tenant_id: create_tenant(config) for config in TENANT_CONFIGS}
 
-ARTICLE_OPTIONS = ["228", "159", "158", "105", "Другая"]
 
-ABOUT_CACHE: Optional[str] = None
+def tenant_of(holder: Union[ContextTypes.DEFAULT_TYPE, Application]) -> Tenant:
+    """Бот, которому пришёл апдейт или принадлежит задача (context или application)."""
+    return holder.bot_data[TENANT_KEY]
 
 
 def init_db() -> None:
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS emergency_calls (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                username TEXT,
-                full_name TEXT,
-                phone TEXT,
-                address TEXT,
-                coordinates TEXT,
-                article TEXT,
-                created_at TEXT
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS consultations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                username TEXT,
-                full_name TEXT,
-                city TEXT,
-                phone TEXT,
-                urgency TEXT,
-                article TEXT,
-                description TEXT,
-                preferred_date TEXT,
-                preferred_time TEXT,
-                created_at TEXT
-            )
-            """
+    conn = connect(DB_PATH)
+    try:
+        if enable_incremental_vacuum(conn):
+            logger.info("Для рабочей базы включён auto_vacuum=INCREMENTAL")
+        applied = migrate(conn)
+    finally:
+        conn.close()
+    if applied:
+        logger.info("Схема БД обновлена до версии %s", applied[-1])
+
+
+async def refresh_about_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await tenant_of(context).about.refresh()
+
+
+async def send_digest(tenant: Tenant) -> int:
+    count = await database.execute(lambda conn: flush_digest(conn, tenant.tenant_id, DIGEST_MAX_ITEMS))
+    if count:
+        metrics.inc("digest_items_total", value=count)
+        tenant.outbox.wake()
+    return count
+
+
+async def digest_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await send_digest(tenant_of(context))
+
+
+async def archive_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    with metrics.span("archive_seconds"):
+        run = await archiver.run(time.time())
+    for table, count in run.moved.items():
+        if count:
+            metrics.inc("archived_rows_total", value=count, table=table)
+    if any(run.moved.values()) or run.sealed:
+        logger.info(
+            "В архив перенесено: %s; сжато месяцев: %s; освобождено страниц: %s",
+            run.moved,
+            len(run.sealed),
+            run.freed_pages,
         )
 
 
-def fetch_about_info() -> str:
-    global ABOUT_CACHE
-    if ABOUT_CACHE:
-        return ABOUT_CACHE
+def abandoned_summary(user_id: int, draft: EmergencyDraft) -> str:
+    address = draft.location()
+    return (
+        "⏳ Незавершённый экстренный вызов\n\n"
+        f"Профиль: <a href=\"tg://user?id={user_id}\">{user_id}</a>\n"
+        f"Телефон: {html.escape(draft.phone) if draft.phone else 'не указан'}\n"
+        f"Адрес/координаты: {html.escape(address) if address else 'не указаны'}\n"
+        f"Статья: {html.escape(draft.article) if draft.article else 'не указана'}"
+    )
+
 
-    description = None
+def save_abandoned_emergencies(
+    conn: sqlite3.Connection, tenant: Tenant, drafts: List[Tuple[int, EmergencyDraft]]
+) -> None:
+    for user_id, draft in drafts:
+        save_abandoned_emergency(conn, tenant.tenant_id, user_id, draft)
+        recipients = tenant.recipients.recipients("emergency", draft.article)
+        add_to_digest(conn, tenant.tenant_id, abandoned_summary(user_id, draft), recipients)
+
+
+async def sweep_drafts(application: Application) -> int:
+    """Вытесняет черновики, брошенные дольше DRAFT_TTL, и возвращает их число."""
+    tenant = tenant_of(application)
+    # Обработчик апдейтов общий у всех ботов и различает только пользователей,
+    # поэтому занятым считается и тот, кто сейчас пишет другому боту.
+    busy = update_processor.queue_depth
+    evicted = sweep_idle_drafts(application.user_data, DRAFT_TTL, skip=lambda user_id: busy(user_id) > 0)
+    abandoned = []
+    for user_id, key, draft in evicted:
+        metrics.inc("flows_total", flow=DRAFT_FLOWS[key], outcome="expired")
+        if key == EMERGENCY_DRAFT and PERSIST_ABANDONED_EMERGENCIES and not draft.is_empty():
+            abandoned.append((user_id, draft))
+    if abandoned:
+        await database.execute(lambda conn: save_abandoned_emergencies(conn, tenant, abandoned))
+        tenant.outbox.wake()
+
+    # Пустые user_data остаются от завершённых сценариев: их записи
+    # удаляются целиком, а у остальных затронутых обновляется сохранённая копия.
+    swept = {user_id for user_id, _, _ in evicted}
+    for user_id, user_data in list(application.user_data.items()):
+        if busy(user_id):
+            continue
+        if not user_data:
+            application.drop_user_data(user_id)
+        elif user_id in swept and application.persistence is not None:
+            await application.persistence.update_user_data(user_id, user_data)
+    return len(evicted)
+
+
+async def sweep_drafts_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await sweep_drafts(context.application)
+
+
+async def start_shared() -> None:
+    global geocoder, prometheus_server
     try:
-        request = Request(ABOUT_URL, headers={"User-Agent": "Mozilla/5.0"})
-        with urlopen(request, timeout=10) as response:
-            html = response.read().decode("utf-8", errors="ignore")
-        meta_match = re.search(
-            r'<meta[^>]+name=["\']description["\'][^>]*content=["\'](.*?)["\']',
-            html,
-            re.IGNORECASE | re.DOTALL,
+        geocoder = await asyncio.to_thread(load_geocoder, GAZETTEER_PATH, GAZETTEER_INDEX_PATH)
+    except (OSError, ValueError) as exc:
+        logger.warning("Справочник населённых пунктов недоступен, геопозиции без подписи: %s", exc)
+    await database.start()
+    if METRICS_ENABLED and METRICS_PORT:
+        prometheus_server = PrometheusServer(
+            lambda: metrics.render_prometheus(runtime_gauges(tenants.values())),
+            METRICS_LISTEN,
+            METRICS_PORT,
         )
-        if meta_match:
-            description = unescape(meta_match.group(1)).strip()
-    except (HTTPError, URLError, TimeoutError) as exc:  # pragma: no cover - сеть
-        logger.warning("Не удалось получить данные с сайта: %s", exc)
-
-    ABOUT_CACHE = (
-        description
-        or "Адвокат Панкратова А.В. предоставляет квалифицированную правовую помощь,"
-        " работает с уголовными и гражданскими делами и сопровождает клиентов на всех стадиях защиты."
-    )
-    return ABOUT_CACHE
+        await prometheus_server.start()
+
+
+async def stop_shared() -> None:
+    if prometheus_server is not None:
+        await prometheus_server.stop()
+    for about in about_providers.values():
+        await about.close()
+    await media_store.close()
+    await database.stop()
+    if geocoder is not None:
+        geocoder.close()
+
+
+async def post_init(application) -> None:
+    global running_tenants
+    tenant = tenant_of(application)
+    # Счётчик растёт до запуска: post_shutdown вызывается и после неудачного post_init.
+    running_tenants += 1
+    if running_tenants == 1:
+        await start_shared()
+    await database.read(lambda conn: tenant.slot_book.load(conn, datetime.now().date()))
+    tenant.outbox.start(application.bot)
+
+
+async def post_shutdown(application) -> None:
+    global running_tenants
+    await tenant_of(application).outbox.stop()
+    running_tenants -= 1
+    if not running_tenants:
+        await stop_shared()
+
+
+def runtime_gauges(selected: Iterable[Tenant]) -> Dict[str, float]:
+    processor = update_processor.stats()
+    drafts: Counter = Counter()
+    in_flight = 0
+    for tenant in selected:
+        if tenant.application is not None:
+            drafts.update(draft_stats(tenant.application.user_data))
+        in_flight += tenant.outbox.in_flight
+    return {
+        **drafts,
+        "db_batches_total": database.batches,
+        "db_operations_total": database.operations,
+        "db_write_seconds_total": database.write_seconds,
+        "pending_updates": processor["pending"],
+        "pending_users": processor["users"],
+        "max_user_queue_depth": processor["max_depth"],
+        **{
+            f"waiting_updates_{priority}": processor.get(f"waiting_{priority}", 0)
+            for priority in UPDATE_PRIORITIES
+        },
+        "rate_limit_buckets": len(rate_limiter),
+        "submission_cache_entries": len(submissions),
+        "outbox_in_flight": in_flight,
+    }
 
 
-def checkbox(value: Optional[str]) -> str:
-    return "✅" if value else "⬜️"
+def note_abandoned(context: ContextTypes.DEFAULT_TYPE) -> None:
+    if EMERGENCY_DRAFT in context.user_data:
+        metrics.inc("flows_total", flow="emergency", outcome="abandoned")
+    if CONSULT_DRAFT in context.user_data:
+        metrics.inc("flows_total", flow="consultation", outcome="abandoned")
 
 
 def user_link(update: Update) -> str:
     user = update.effective_user
     display_name = user.full_name or user.first_name or "пользователь"
-    return f"<a href=\"tg://user?id={user.id}\">{display_name}</a>"
+    return f"<a href=\"tg://user?id={user.id}\">{html.escape(display_name)}</a>"
 
 
 async def show_requests_menu(update: Update, text: str) -> None:
-    keyboard = InlineKeyboardMarkup(
-        [
-            [InlineKeyboardButton("🚨 Экстренный вызов", callback_data="emergency_open")],
-            [InlineKeyboardButton("📨 Обратиться к адвокату", callback_data="consult_open")],
-        ]
-    )
     if update.callback_query:
         await update.callback_query.answer()
-        await update.callback_query.edit_message_text(text, reply_markup=keyboard)
+        await update.callback_query.edit_message_text(text, reply_markup=REQUESTS_MENU_KEYBOARD)
     else:
-        await update.message.reply_text(text, reply_markup=keyboard)
+        await update.message.reply_text(text, reply_markup=REQUESTS_MENU_KEYBOARD)
 
 
-def emergency_summary(data: Dict[str, Optional[str]]) -> str:
+def emergency_summary(data: EmergencyDraft) -> str:
     return (
         "🚨 Экстренный вызов\n\n"
-        f"Номер: {data.get('phone') or 'не указан'}\n"
-        f"Адрес/координаты: {data.get('address') or data.get('coordinates') or 'не указаны'}\n"
-        f"Статья: {data.get('article') or 'не указана'}\n\n"
+        f"Номер: {data.phone or 'не указан'}\n"
+        f"Адрес/координаты: {data.location() or 'не указаны'}\n"
+        f"Статья: {data.article or 'не указана'}\n\n"
         "Выберите, что добавить или отправьте заявку."
     )
 
 
-def emergency_keyboard(data: Dict[str, Optional[str]]) -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(
-        [
-            [
-                InlineKeyboardButton(
-                    f"{checkbox(data.get('phone'))} Указать номер", callback_data="emergency_phone"
-                )
-            ],
-            [
-                InlineKeyboardButton(
-                    f"{checkbox(data.get('address') or data.get('coordinates'))} Указать адрес",
-                    callback_data="emergency_address",
-                )
-            ],
-            [
-                InlineKeyboardButton(
-                    f"{checkbox(data.get('article'))} Указать статью",
-                    callback_data="emergency_article_menu",
-                )
-            ],
-            [InlineKeyboardButton("📤 Отправить экстренный вызов", callback_data="emergency_submit")],
-            [InlineKeyboardButton("⬅️ Вернуться к выбору", callback_data="back_to_requests")],
-        ]
-    )
-
-
-def article_keyboard(prefix: str) -> InlineKeyboardMarkup:
-    buttons = [
-        [InlineKeyboardButton(option, callback_data=f"{prefix}_{option}")]
-        for option in ARTICLE_OPTIONS
-    ]
-    buttons.append([InlineKeyboardButton("⬅️ Назад", callback_data=f"{prefix}_back")])
-    return InlineKeyboardMarkup(buttons)
-
-
-def consultation_date_keyboard() -> InlineKeyboardMarkup:
-    today = datetime.now().date()
-    options = [today + timedelta(days=i) for i in range(0, 5)]
-    buttons = [
-        [
-            InlineKeyboardButton(
-                date.strftime("%d.%m (%A)"), callback_data=f"consult_date_{date.isoformat()}"
-            )
-        ]
-        for date in options
-    ]
-    return InlineKeyboardMarkup(buttons)
-
-
-def consultation_time_keyboard() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(
-        [[InlineKeyboardButton(slot, callback_data=f"consult_time_{slot}")] for slot in TIME_SLOTS]
-    )
-
-
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    note_abandoned(context)
     context.user_data.clear()
-    greeting = (
-        "Здравствуйте! Вас приветствует официальный бот для связи с адвокатом Панкратовой А.В.\n\n"
-        "Выберите действие ниже."
-    )
-    await update.message.reply_text(greeting, reply_markup=MAIN_KEYBOARD)
+    await update.message.reply_text(tenant_of(context).config.greeting, reply_markup=MAIN_KEYBOARD)
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -231,15 +502,12 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 async def handle_main_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     text = update.message.text.strip()
     if text == "ℹ️ О нас":
-        about = fetch_about_info()
+        about = tenant_of(context).about.get()
         await update.message.reply_text(about, reply_markup=MAIN_KEYBOARD)
     elif text == "✉️ Оставить обращение":
         await show_requests_menu(update, "Выберите формат обращения:")
     elif text == "📞 Контакты":
-        await update.message.reply_text(
-            "Связаться с адвокатом:\nТелеграм: @user\nТелефон: +7 (913) 977-19-10",
-            reply_markup=MAIN_KEYBOARD,
-        )
+        await update.message.reply_text(tenant_of(context).config.contacts, reply_markup=MAIN_KEYBOARD)
     else:
         await update.message.reply_text(
             "Пожалуйста, воспользуйтесь кнопками меню или командой /help.",
@@ -250,38 +518,27 @@ async def handle_main_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def open_emergency(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
-    context.user_data["emergency"] = {"phone": None, "address": None, "coordinates": None, "article": None}
-    context.user_data.pop("flow", None)
-    await query.edit_message_text(
-        emergency_summary(context.user_data["emergency"]),
-        reply_markup=emergency_keyboard(context.user_data["emergency"]),
-    )
+    note_abandoned(context)
+    metrics.inc("flows_total", flow="emergency", outcome="started")
+    draft = context.user_data[EMERGENCY_DRAFT] = EmergencyDraft()
+    set_state(context.user_data, EMERGENCY_MENU)
+    await query.edit_message_text(emergency_summary(draft), reply_markup=emergency_keyboard(draft))
 
 
 async def emergency_request_contact(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    context.user_data["flow"] = "emergency_phone"
-    keyboard = ReplyKeyboardMarkup(
-        [[KeyboardButton("📱 Поделиться номером", request_contact=True)]],
-        resize_keyboard=True,
-        one_time_keyboard=True,
-    )
+    set_state(context.user_data, "emergency_phone")
     await update.callback_query.answer()
     await update.callback_query.message.reply_text(
         "Укажите номер телефона или поделитесь контактом.",
-        reply_markup=keyboard,
+        reply_markup=CONTACT_REQUEST_KEYBOARD,
     )
 
 
 async def emergency_request_address(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    context.user_data["flow"] = "emergency_address"
-    keyboard = ReplyKeyboardMarkup(
-        [[KeyboardButton("📍 Отправить геопозицию", request_location=True)]],
-        resize_keyboard=True,
-        one_time_keyboard=True,
-    )
+    set_state(context.user_data, "emergency_address")
     await update.callback_query.answer()
     await update.callback_query.message.reply_text(
-        "Пришлите адрес текстом или отправьте геопозицию.", reply_markup=keyboard
+        "Пришлите адрес текстом или отправьте геопозицию.", reply_markup=LOCATION_REQUEST_KEYBOARD
     )
 
 
@@ -299,45 +556,54 @@ async def select_emergency_article(update: Update, context: ContextTypes.DEFAULT
         await open_emergency(update, context)
         return
     if value == "Другая":
-        context.user_data["flow"] = "emergency_article_custom"
+        set_state(context.user_data, "emergency_article_custom")
         await query.answer()
         await query.message.reply_text("Введите номер статьи или краткое описание.")
         return
-    context.user_data.setdefault("emergency", {})["article"] = value
-    context.user_data.pop("flow", None)
+    draft = get_draft(context.user_data, EMERGENCY_DRAFT)
+    draft.article = value
+    set_state(context.user_data, EMERGENCY_MENU)
     await query.answer("Сохранено")
-    await query.message.reply_text(
-        "Статья сохранена.",
-        reply_markup=emergency_keyboard(context.user_data["emergency"]),
-    )
+    await query.message.reply_text("Статья сохранена.", reply_markup=emergency_keyboard(draft))
 
 
 async def submit_emergency(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
-    await query.answer()
-    data = context.user_data.get("emergency", {})
     user = update.effective_user
+    tenant = tenant_of(context)
+    data = context.user_data.get(EMERGENCY_DRAFT)
+    # Повторное нажатие или повторно доставленный callback: черновик уже
+    # отправлен, пользователь получает то же подтверждение.
+    owner = (tenant.tenant_id, user.id)
+    confirmation = submissions.get(data.token) if data else submissions.latest(owner, "emergency")
+    if confirmation is not None:
+        metrics.inc("duplicate_submissions_total", flow="emergency")
+        await query.answer(confirmation)
+        return
+    await query.answer()
+    data = get_draft(context.user_data, EMERGENCY_DRAFT)
+    # Уведомление уходит с разметкой HTML: всё введённое пользователем
+    # экранируется, иначе Telegram отклонит сообщение (и сводку с ним).
+    address = data.location()
     message = (
         "🚨 Экстренный вызов\n\n"
-        f"От: {user.full_name}\n"
+        f"От: {html.escape(user.full_name)}\n"
         f"Профиль: {user_link(update)}\n"
-        f"Телефон: {data.get('phone') or 'не указан'}\n"
-        f"Адрес/координаты: {data.get('address') or data.get('coordinates') or 'не указаны'}\n"
-        f"Статья: {data.get('article') or 'не указана'}"
+        f"Телефон: {html.escape(data.phone) if data.phone else 'не указан'}\n"
+        f"Адрес/координаты: {html.escape(address) if address else 'не указаны'}\n"
+        f"Статья: {html.escape(data.article) if data.article else 'не указана'}"
     )
 
     try:
-        await context.bot.send_message(
-            chat_id=int(ADMIN_ID), text=message, parse_mode=ParseMode.HTML
-        )
-    except Exception as exc:  # pragma: no cover - внешнее взаимодействие
-        logger.error("Не удалось отправить экстренный вызов админу: %s", exc)
-
-    save_emergency_data(user, data)
+        await save_emergency_data(tenant, user, data, message)
+    except DuplicateSubmission:
+        metrics.inc("duplicate_submissions_total", flow="emergency")
+    else:
+        tenant.outbox.wake()
+        metrics.inc("flows_total", flow="emergency", outcome="completed")
+    submissions.remember(owner, "emergency", data.token, EMERGENCY_CONFIRMATION)
     context.user_data.clear()
-    await query.message.reply_text(
-        "Спасибо! Экстренный вызов передан адвокату.", reply_markup=MAIN_KEYBOARD
-    )
+    await query.message.reply_text(EMERGENCY_CONFIRMATION, reply_markup=MAIN_KEYBOARD)
 
 
 async def back_to_requests(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -347,142 +613,201 @@ async def back_to_requests(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 async def open_consultation(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
-    context.user_data["flow"] = "consult"
-    context.user_data["consult_step"] = "city"
-    context.user_data["consult_data"] = {
-        "city": None,
-        "phone": None,
-        "urgency": None,
-        "article": None,
-        "description": None,
-        "preferred_date": None,
-        "preferred_time": None,
-    }
+    note_abandoned(context)
+    metrics.inc("flows_total", flow="consultation", outcome="started")
+    context.user_data[CONSULT_DRAFT] = ConsultDraft()
+    set_state(context.user_data, "consult_city")
     await query.message.reply_text("Укажите город, откуда вы обращаетесь.", reply_markup=MAIN_KEYBOARD)
 
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    flow = context.user_data.get("flow")
-    if flow == "consult":
-        await handle_consult_text(update, context)
-    elif flow in {"emergency_phone", "emergency_address", "emergency_article_custom"}:
-        await handle_emergency_text(update, context)
-    else:
-        await handle_main_buttons(update, context)
+    step = TEXT_STEPS.get(current_state(context.user_data))
+    if step is None:
+        if context.user_data.get("flow") == "consult":
+            await update.message.reply_text(
+                "Уточните, пожалуйста, данные согласно шагам обращения.",
+                reply_markup=MAIN_KEYBOARD,
+            )
+        else:
+            await handle_main_buttons(update, context)
+        return
+    error = apply_step(context.user_data, step, update.message.text.strip())
+    if error:
+        await update.message.reply_text(error)
+        return
+    await STATE_PROMPTS[step.next_state](update, context)
+
+
+def choice_handler(prefix: str, step: Step) -> Handler:
+    async def handle_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        query = update.callback_query
+        if step.draft not in context.user_data:
+            confirmation = None
+            if step.next_state == FINALIZE:
+                owner = (tenant_of(context).tenant_id, update.effective_user.id)
+                confirmation = submissions.latest(owner, DRAFT_FLOWS[step.draft])
+            if confirmation is not None:
+                metrics.inc("duplicate_submissions_total", flow=DRAFT_FLOWS[step.draft])
+            await query.answer(confirmation or "Начните обращение заново через меню.")
+            return
+        error = apply_step(context.user_data, step, query.data[len(prefix):])
+        if error:
+            await query.answer(error)
+            return
+        await query.answer(step.saved)
+        await STATE_PROMPTS[step.next_state](update, context)
+
+    return handle_choice
 
 
 async def handle_contact(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     phone = update.message.contact.phone_number
-    flow = context.user_data.get("flow")
-    if flow == "emergency_phone":
-        context.user_data.setdefault("emergency", {})["phone"] = phone
-        context.user_data.pop("flow", None)
-        await update.message.reply_text(
-            "Телефон сохранен.",
-            reply_markup=emergency_keyboard(context.user_data["emergency"]),
-        )
-    elif flow == "consult" and context.user_data.get("consult_step") == "phone":
-        context.user_data["consult_data"]["phone"] = phone
-        context.user_data["consult_step"] = "urgency"
+    state = current_state(context.user_data)
+    if state == "emergency_phone":
+        draft = get_draft(context.user_data, EMERGENCY_DRAFT)
+        draft.phone = phone
+        set_state(context.user_data, EMERGENCY_MENU)
+        await update.message.reply_text("Телефон сохранен.", reply_markup=emergency_keyboard(draft))
+    elif state == "consult_phone":
+        get_draft(context.user_data, CONSULT_DRAFT).phone = phone
+        set_state(context.user_data, "consult_urgency")
         await ask_urgency(update, context)
     else:
         await update.message.reply_text("Контакт сохранен.", reply_markup=MAIN_KEYBOARD)
 
 
 async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    flow = context.user_data.get("flow")
-    if flow == "emergency_address":
-        coords = f"{update.message.location.latitude},{update.message.location.longitude}"
-        context.user_data.setdefault("emergency", {})["coordinates"] = coords
-        context.user_data.pop("flow", None)
-        await update.message.reply_text(
-            "Координаты сохранены.",
-            reply_markup=emergency_keyboard(context.user_data["emergency"]),
-        )
+    if current_state(context.user_data) == "emergency_address":
+        location = update.message.location
+        draft = get_draft(context.user_data, EMERGENCY_DRAFT)
+        draft.coordinates = f"{location.latitude},{location.longitude}"
+        place = geocoder.nearest(location.latitude, location.longitude) if geocoder else None
+        draft.location_label = place.label if place else None
+        set_state(context.user_data, EMERGENCY_MENU)
+        text = f"Координаты сохранены: {place.label}." if place else "Координаты сохранены."
+        await update.message.reply_text(text, reply_markup=emergency_keyboard(draft))
     else:
         await update.message.reply_text("Локация сохранена.", reply_markup=MAIN_KEYBOARD)
 
 
-async def handle_emergency_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    flow = context.user_data.get("flow")
-    text = update.message.text.strip()
-    data = context.user_data.setdefault("emergency", {})
-    if flow == "emergency_phone":
-        data["phone"] = text
-    elif flow == "emergency_address":
-        data["address"] = text
-    elif flow == "emergency_article_custom":
-        data["article"] = text
-    context.user_data.pop("flow", None)
-    await update.message.reply_text(
-        "Данные сохранены.", reply_markup=emergency_keyboard(data)
+async def handle_attachment(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    message = update.message
+    draft = context.user_data.get(CONSULT_DRAFT)
+    if context.user_data.get("flow") != "consult" or draft is None:
+        await message.reply_text(
+            "Файлы можно приложить к заявке на консультацию: «✉️ Оставить обращение» → "
+            "«📨 Обратиться к адвокату».",
+            reply_markup=MAIN_KEYBOARD,
+        )
+        return
+    if len(draft.attachments) >= MAX_ATTACHMENTS:
+        await message.reply_text(f"К одной заявке можно приложить не больше {MAX_ATTACHMENTS} файлов.")
+        return
+    if message.photo:
+        # Самый крупный из размеров, которые Telegram подготовил для фото.
+        source, kind, file_name, mime_type = message.photo[-1], "photo", None, "image/jpeg"
+    else:
+        document = message.document
+        source, kind, file_name, mime_type = document, "document", document.file_name, document.mime_type
+    if (source.file_size or 0) > MEDIA_MAX_BYTES:
+        await message.reply_text(MEDIA_TOO_LARGE_TEXT)
+        return
+    try:
+        sha256, size = await store_media(context.bot, source.file_id, source.file_unique_id, mime_type)
+    except MediaTooLarge:
+        await message.reply_text(MEDIA_TOO_LARGE_TEXT)
+        return
+    except (TelegramError, httpx.HTTPError, OSError) as exc:
+        logger.warning("Не удалось сохранить файл %s: %s", source.file_unique_id, exc)
+        await message.reply_text("Не удалось сохранить файл, попробуйте отправить его ещё раз.")
+        return
+    draft.attachments.append(Attachment(kind, source.file_id, source.file_unique_id, sha256, size, file_name))
+    draft.touch()
+    step = TEXT_STEPS.get(current_state(context.user_data))
+    if message.caption and step is not None and step.field == "description":
+        # Подпись к файлу на шаге описания – и есть описание.
+        error = apply_step(context.user_data, step, message.caption.strip())
+        if not error:
+            await message.reply_text("📎 Файл и описание сохранены.")
+            await STATE_PROMPTS[step.next_state](update, context)
+            return
+    await message.reply_text(
+        f"📎 Файл приложен к заявке (всего: {len(draft.attachments)}). Продолжайте заполнение."
     )
 
 
-async def handle_consult_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    step = context.user_data.get("consult_step")
-    data = context.user_data.get("consult_data", {})
-    text = update.message.text.strip()
+async def store_media(
+    bot: Bot, file_id: str, file_unique_id: str, mime_type: Optional[str]
+) -> Tuple[str, int]:
+    """SHA-256 и размер файла: уже сохранённый не скачивается заново."""
+    known = await database.read(lambda conn: known_media(conn, file_unique_id))
+    if known is not None and media_store.path(known[0]).exists():
+        metrics.inc("attachments_total", outcome="known")
+        return known
+    with metrics.span("media_download_seconds"):
+        sha256, size = await media_store.download(bot, file_id)
+    await database.execute(lambda conn: remember_media(conn, sha256, size, mime_type, file_unique_id))
+    metrics.inc("attachments_total", outcome="downloaded")
+    return sha256, size
+
+
+async def prompt_emergency_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await update.effective_message.reply_text(
+        "Данные сохранены.",
+        reply_markup=emergency_keyboard(get_draft(context.user_data, EMERGENCY_DRAFT)),
+    )
 
-    if step == "city":
-        data["city"] = text
-        context.user_data["consult_step"] = "phone"
-        keyboard = ReplyKeyboardMarkup(
-            [[KeyboardButton("📱 Поделиться номером", request_contact=True)]],
-            resize_keyboard=True,
-            one_time_keyboard=True,
-        )
-        await update.message.reply_text(
-            "Укажите номер телефона или поделитесь контактом.", reply_markup=keyboard
-        )
-    elif step == "phone":
-        data["phone"] = text
-        context.user_data["consult_step"] = "urgency"
-        await ask_urgency(update, context)
-    elif step == "description":
-        data["description"] = text
-        context.user_data["consult_step"] = "date"
-        await update.message.reply_text(
-            "Выберите удобную дату для связи:", reply_markup=consultation_date_keyboard()
-        )
-    else:
-        await update.message.reply_text(
-            "Уточните, пожалуйста, данные согласно шагам обращения.",
-            reply_markup=MAIN_KEYBOARD,
-        )
+
+async def prompt_consult_phone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await update.effective_message.reply_text(
+        "Укажите номер телефона или поделитесь контактом.", reply_markup=CONTACT_REQUEST_KEYBOARD
+    )
 
 
 async def ask_urgency(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    keyboard = InlineKeyboardMarkup(
-        [
-            [InlineKeyboardButton("🔥 Очень срочно", callback_data="consult_urgency_Очень срочно")],
-            [InlineKeyboardButton("⚡ Срочно", callback_data="consult_urgency_Срочно")],
-            [InlineKeyboardButton("⏳ Не спешу", callback_data="consult_urgency_Не спешу")],
-        ]
+    await update.effective_message.reply_text(
+        "Выберите степень срочности:", reply_markup=URGENCY_KEYBOARD
     )
-    await update.message.reply_text("Выберите степень срочности:", reply_markup=keyboard)
 
 
-async def handle_consult_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    query = update.callback_query
-    if query.data.startswith("consult_urgency_"):
-        await set_consult_urgency(update, context)
-    elif query.data.startswith("consult_article_"):
-        await set_consult_article(update, context)
-    elif query.data.startswith("consult_date_"):
-        await set_consult_date(update, context)
-    elif query.data.startswith("consult_time_"):
-        await set_consult_time(update, context)
+async def prompt_consult_article(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await update.effective_message.reply_text(
+        "Выберите статью обращения:", reply_markup=article_keyboard("consult_article")
+    )
 
 
-async def set_consult_urgency(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    query = update.callback_query
-    _, _, value = query.data.partition("consult_urgency_")
-    context.user_data["consult_data"]["urgency"] = value
-    context.user_data["consult_step"] = "article"
-    await query.answer("Срочность сохранена")
-    await query.message.reply_text(
-        "Выберите статью обращения:", reply_markup=article_keyboard("consult_article")
+async def prompt_consult_description(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await update.effective_message.reply_text("Кратко опишите суть проблемы.")
+
+
+async def prompt_consult_date(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    today = datetime.now().date()
+    slot_book = tenant_of(context).slot_book
+    slot_book.prune(today)
+    days = [today + timedelta(days=i) for i in range(CONSULT_DAYS_AHEAD)]
+    full_days = slot_book.full_days(days)
+    if len(full_days) == len(days):
+        await update.effective_message.reply_text(
+            "На ближайшие дни свободных интервалов нет. Позвоните адвокату "
+            "по номеру из раздела «📞 Контакты».",
+            reply_markup=MAIN_KEYBOARD,
+        )
+        return
+    await update.effective_message.reply_text(
+        "Выберите удобную дату для связи:", reply_markup=consultation_date_keyboard(full_days)
+    )
+
+
+async def prompt_consult_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    day = get_draft(context.user_data, CONSULT_DRAFT).preferred_date
+    free = tenant_of(context).slot_book.free_slots(day)
+    if not free:
+        set_state(context.user_data, "consult_date")
+        await update.effective_message.reply_text("На эту дату мест уже нет.")
+        await prompt_consult_date(update, context)
+        return
+    await update.effective_message.reply_text(
+        "Выберите удобный интервал времени:", reply_markup=consultation_time_keyboard(free)
     )
 
 
@@ -491,173 +816,555 @@ async def set_consult_article(update: Update, context: ContextTypes.DEFAULT_TYPE
     _, _, value = query.data.partition("consult_article_")
     if value == "back":
         await query.answer()
-        await query.message.reply_text(
-            "Выберите статью обращения:", reply_markup=article_keyboard("consult_article")
-        )
+        await prompt_consult_article(update, context)
         return
     if value == "Другая":
-        context.user_data["consult_step"] = "article_custom"
+        set_state(context.user_data, "consult_article_custom")
         await query.answer()
         await query.message.reply_text("Укажите статью обращения.")
         return
-    context.user_data["consult_data"]["article"] = value
-    context.user_data["consult_step"] = "description"
+    get_draft(context.user_data, CONSULT_DRAFT).article = value
+    set_state(context.user_data, "consult_description")
     await query.answer("Статья сохранена")
-    await query.message.reply_text("Кратко опишите суть проблемы.")
-
-
-async def set_consult_date(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    query = update.callback_query
-    _, _, value = query.data.partition("consult_date_")
-    context.user_data["consult_data"]["preferred_date"] = value
-    context.user_data["consult_step"] = "time"
-    await query.answer("Дата сохранена")
-    await query.message.reply_text(
-        "Выберите удобный интервал времени:", reply_markup=consultation_time_keyboard()
-    )
-
-
-async def set_consult_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    query = update.callback_query
-    _, _, value = query.data.partition("consult_time_")
-    data = context.user_data.get("consult_data", {})
-    data["preferred_time"] = value
-    context.user_data["consult_step"] = None
-    await query.answer("Время сохранено")
-
-    await finalize_consultation(update, context)
+    await prompt_consult_description(update, context)
 
 
 async def finalize_consultation(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    data = context.user_data.get("consult_data", {})
+    data = get_draft(context.user_data, CONSULT_DRAFT)
     user = update.effective_user
+    tenant = tenant_of(context)
+    confirmation = submissions.get(data.token)
+    if confirmation is not None:
+        metrics.inc("duplicate_submissions_total", flow="consultation")
+        context.user_data.clear()
+        await update.effective_message.reply_text(confirmation, reply_markup=MAIN_KEYBOARD)
+        return
     message = (
         "📨 Новая заявка на консультацию\n\n"
-        f"От: {user.full_name}\n"
+        f"От: {html.escape(user.full_name)}\n"
         f"Профиль: {user_link(update)}\n"
-        f"Город: {data.get('city') or 'не указан'}\n"
-        f"Телефон: {data.get('phone') or 'не указан'}\n"
-        f"Срочность: {data.get('urgency') or 'не указана'}\n"
-        f"Статья: {data.get('article') or 'не указана'}\n"
-        f"Описание: {data.get('description') or 'не указано'}\n"
-        f"Дата связи: {data.get('preferred_date') or 'не выбрана'}\n"
-        f"Время связи: {data.get('preferred_time') or 'не выбрано'}"
+        f"Город: {html.escape(data.city) if data.city else 'не указан'}\n"
+        f"Телефон: {html.escape(data.phone) if data.phone else 'не указан'}\n"
+        f"Срочность: {html.escape(data.urgency) if data.urgency else 'не указана'}\n"
+        f"Статья: {html.escape(data.article) if data.article else 'не указана'}\n"
+        f"Описание: {html.escape(data.description) if data.description else 'не указано'}\n"
+        f"Дата связи: {data.preferred_date or 'не выбрана'}\n"
+        f"Время связи: {data.preferred_time or 'не выбрано'}"
     )
+    if data.attachments:
+        message += f"\nВложения: {len(data.attachments)} (следом отдельными сообщениями)"
+
     try:
-        await context.bot.send_message(
-            chat_id=int(ADMIN_ID), text=message, parse_mode=ParseMode.HTML
+        await save_consultation_data(
+            tenant, user, data, message, digest=data.urgency not in IMMEDIATE_URGENCIES
         )
-    except Exception as exc:  # pragma: no cover - внешнее взаимодействие
-        logger.error("Не удалось отправить заявку админу: %s", exc)
-
-    save_consultation_data(user, data)
+    except SlotTaken:
+        # Интервал заняли, пока пользователь заполнял заявку: черновик
+        # остаётся, выбирается только другое время.
+        data.preferred_time = None
+        set_state(context.user_data, "consult_time")
+        await update.effective_message.reply_text("Этот интервал уже заняли, выберите другой.")
+        await prompt_consult_time(update, context)
+        return
+    except DuplicateSubmission:
+        metrics.inc("duplicate_submissions_total", flow="consultation")
+    else:
+        tenant.outbox.wake()
+        metrics.inc("flows_total", flow="consultation", outcome="completed")
+    submissions.remember((tenant.tenant_id, user.id), "consultation", data.token, CONSULT_CONFIRMATION)
     context.user_data.clear()
-    await update.callback_query.message.reply_text(
-        "Спасибо! Заявка передана адвокату.", reply_markup=MAIN_KEYBOARD
-    )
+    await update.callback_query.message.reply_text(CONSULT_CONFIRMATION, reply_markup=MAIN_KEYBOARD)
+
+
+def save_with_notification(
+    conn: sqlite3.Connection,
+    tenant_id: str,
+    table: str,
+    row: Dict,
+    notification: str,
+    recipients: Sequence[int],
+    digest: bool = False,
+    media: Sequence[Tuple[str, str, str]] = (),
+) -> int:
+    # Заявка и уведомления всем получателям фиксируются одной транзакцией:
+    # у каждого получателя своя строка очереди и свои повторы. ``media`` –
+    # вложения (вид, file_id, подпись), они встают в очередь после текста.
+    row_id = insert_row(conn, table, row)
+    record_request(conn, tenant_id, table, row)
+    if not digest:
+        text = shorten_html(notification, MESSAGE_LIMIT)
+        for chat_id in recipients:
+            enqueue_notification(conn, tenant_id, chat_id, text, ParseMode.HTML)
+            for kind, file_id, caption in media:
+                enqueue_notification(conn, tenant_id, chat_id, caption, None, kind, file_id)
+        return row_id
+    add_to_digest(conn, tenant_id, notification, recipients)
+    for chat_id in recipients:
+        for kind, file_id, caption in media:
+            enqueue_digest_item(conn, tenant_id, chat_id, caption, None, kind, file_id)
+    return row_id
+
+
+def add_to_digest(
+    conn: sqlite3.Connection, tenant_id: str, notification: str, recipients: Sequence[int]
+) -> None:
+    for chat_id in recipients:
+        enqueue_digest_item(conn, tenant_id, chat_id, notification, ParseMode.HTML)
+    if pending_digest_items(conn, tenant_id) >= DIGEST_MAX_ITEMS:
+        flush_digest(conn, tenant_id, DIGEST_MAX_ITEMS)
+
+
+async def save_emergency_data(tenant: Tenant, user, data: EmergencyDraft, notification: str) -> int:
+    row = {
+        "tenant_id": tenant.tenant_id,
+        "user_id": user.id,
+        "username": user.username,
+        "full_name": user.full_name,
+        "phone": data.phone,
+        "address": data.address,
+        "coordinates": data.coordinates,
+        "location_label": data.location_label,
+        "article": data.article,
+        "submission_token": data.token,
+        "created_at": int(time.time()),
+    }
+
+    recipients = tenant.recipients.recipients("emergency", data.article)
 
+    def save(conn: sqlite3.Connection) -> int:
+        check_token(conn, "emergency_calls", data.token)
+        return save_with_notification(
+            conn, tenant.tenant_id, "emergency_calls", row, notification, recipients
+        )
 
-async def handle_consult_article_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
-    if context.user_data.get("consult_step") == "article_custom":
-        context.user_data["consult_data"]["article"] = update.message.text.strip()
-        context.user_data["consult_step"] = "description"
-        await update.message.reply_text("Кратко опишите суть проблемы.")
-        return True
-    return False
-
-
-def save_emergency_data(user, data: Dict[str, Optional[str]]) -> None:
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            """
-            INSERT INTO emergency_calls (user_id, username, full_name, phone, address, coordinates, article, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                user.id,
-                user.username,
-                user.full_name,
-                data.get("phone"),
-                data.get("address"),
-                data.get("coordinates"),
-                data.get("article"),
-                datetime.utcnow().isoformat(),
-            ),
+    with metrics.span("db_seconds", op="save_emergency"):
+        return await database.execute(save, durable=EMERGENCY_DURABLE_WRITES)
+
+
+def attachment_caption(full_name: str, index: int, total: int, attachment: Attachment) -> str:
+    caption = f"📎 {index}/{total} к заявке от {full_name}"
+    return f"{caption}: {attachment.file_name}" if attachment.file_name else caption
+
+
+async def save_consultation_data(
+    tenant: Tenant, user, data: ConsultDraft, notification: str, digest: bool = False
+) -> int:
+    row = {
+        "tenant_id": tenant.tenant_id,
+        "user_id": user.id,
+        "username": user.username,
+        "full_name": user.full_name,
+        "city": data.city,
+        "phone": data.phone,
+        "urgency": data.urgency,
+        "article": data.article,
+        "description": data.description,
+        "preferred_date": data.preferred_date,
+        "preferred_time": data.preferred_time,
+        "submission_token": data.token,
+        "created_at": int(time.time()),
+    }
+    day, slot = row["preferred_date"], row["preferred_time"]
+    recipients = tenant.recipients.recipients("consultation", data.article, data.urgency)
+    attachments = list(data.attachments)
+    media = [
+        (item.kind, item.file_id, attachment_caption(user.full_name, index, len(attachments), item))
+        for index, item in enumerate(attachments, start=1)
+    ]
+    slot_book = tenant.slot_book
+
+    def book(conn: sqlite3.Connection) -> int:
+        # Сначала токен: у повторной отправки место занято ею же самой.
+        check_token(conn, "consultations", data.token)
+        if day and slot:
+            slot_book.check(conn, day, slot)
+        row_id = save_with_notification(
+            conn, tenant.tenant_id, "consultations", row, notification, recipients, digest, media
         )
+        link_attachments(conn, tenant.tenant_id, row_id, attachments)
+        return row_id
 
+    with metrics.span("db_seconds", op="save_consultation"):
+        row_id = await database.execute(book)
+    if day and slot:
+        slot_book.record(day, slot)
+    return row_id
 
-def save_consultation_data(user, data: Dict[str, Optional[str]]) -> None:
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            """
-            INSERT INTO consultations (
-                user_id, username, full_name, city, phone, urgency, article, description, preferred_date, preferred_time, created_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                user.id,
-                user.username,
-                user.full_name,
-                data.get("city"),
-                data.get("phone"),
-                data.get("urgency"),
-                data.get("article"),
-                data.get("description"),
-                data.get("preferred_date"),
-                data.get("preferred_time"),
-                datetime.utcnow().isoformat(),
-            ),
+
+async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    try:
+        query = parse_find_args(context.args)
+    except ValueError as exc:
+        await update.message.reply_text(str(exc))
+        return
+    context.user_data["find_query"] = list(query)
+    text, keyboard = await find_page(tenant_of(context), query, 0)
+    await update.message.reply_text(text, parse_mode=ParseMode.HTML, reply_markup=keyboard)
+
+
+async def show_find_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+    tenant = tenant_of(context)
+    saved = context.user_data.get("find_query")
+    if update.effective_user.id != tenant.admin_id or not saved:
+        return
+    text, keyboard = await find_page(tenant, FindQuery(*saved), int(query.data[len("find_page_"):]))
+    await query.edit_message_text(text, parse_mode=ParseMode.HTML, reply_markup=keyboard)
+
+
+async def find_page(
+    tenant: Tenant, query: FindQuery, offset: int
+) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    with metrics.span("db_seconds", op="find"):
+        total, hits = await database.read(
+            lambda conn: search_requests(conn, tenant.tenant_id, query, offset)
         )
+    if not total:
+        return "Ничего не найдено.", None
+    if not hits and offset:
+        # Кнопка со старой выдачи ведёт за её конец (совпадений стало меньше):
+        # показываем последнюю страницу.
+        offset = (total - 1) // FIND_PAGE_SIZE * FIND_PAGE_SIZE
+        with metrics.span("db_seconds", op="find"):
+            total, hits = await database.read(
+                lambda conn: search_requests(conn, tenant.tenant_id, query, offset)
+            )
+    found = f"более {RANK_LIMIT}, сначала новые" if total > RANK_LIMIT else str(total)
+    header = f"Найдено: {found}; показаны {offset + 1}–{offset + len(hits)}"
+    text = "\n\n".join([header] + [format_hit(hit) for hit in hits])
+    return text, search_page_keyboard(offset, total, FIND_PAGE_SIZE)
 
 
-async def handle_callback_queries(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    data = update.callback_query.data
-    if data == "emergency_open":
-        await open_emergency(update, context)
-    elif data == "emergency_phone":
-        await emergency_request_contact(update, context)
-    elif data == "emergency_address":
-        await emergency_request_address(update, context)
-    elif data == "emergency_article_menu":
-        await open_emergency_articles(update, context)
-    elif data.startswith("emergency_article_"):
-        await select_emergency_article(update, context)
-    elif data == "emergency_submit":
-        await submit_emergency(update, context)
-    elif data == "back_to_requests":
-        await back_to_requests(update, context)
-    elif data == "consult_open":
-        await open_consultation(update, context)
-    elif data.startswith("consult_"):
-        await handle_consult_callbacks(update, context)
+async def answer_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await update.callback_query.answer()
+
+
+STATE_PROMPTS: Dict[str, Handler] = {
+    EMERGENCY_MENU: prompt_emergency_menu,
+    "consult_phone": prompt_consult_phone,
+    "consult_urgency": ask_urgency,
+    "consult_article": prompt_consult_article,
+    "consult_description": prompt_consult_description,
+    "consult_date": prompt_consult_date,
+    "consult_time": prompt_consult_time,
+    FINALIZE: finalize_consultation,
+}
+
+
+def build_callback_router() -> CallbackRouter:
+    timed = metrics.instrument
+    router = CallbackRouter(fallback=answer_callback)
+    router.exact("emergency_open", timed(open_emergency))
+    router.exact("emergency_phone", timed(emergency_request_contact))
+    router.exact("emergency_address", timed(emergency_request_address))
+    router.exact("emergency_article_menu", timed(open_emergency_articles))
+    router.exact("emergency_submit", timed(submit_emergency))
+    router.exact("back_to_requests", timed(back_to_requests))
+    router.exact("consult_open", timed(open_consultation))
+    router.prefix("find_page_", timed(show_find_page))
+    router.prefix("emergency_article_", timed(select_emergency_article))
+    router.prefix("consult_article_", timed(set_consult_article))
+    for prefix, step in CHOICE_STEPS.items():
+        router.prefix(prefix, timed(choice_handler(prefix, step), f"set_consult_{step.field}"))
+    return router
+
+
+callback_router = build_callback_router()
+
+
+def update_kind(update: Update) -> str:
+    if update.callback_query:
+        return "callback_query"
+    message = update.message
+    if message is None:
+        return "other"
+    if message.contact:
+        return "contact"
+    if message.location:
+        return "location"
+    if message.photo or message.document:
+        return "attachment"
+    if message.text:
+        return "command" if message.text.startswith("/") else "text"
+    return "message"
+
+
+async def count_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    metrics.inc("updates_total", kind=update_kind(update))
+
+
+async def enforce_rate_limit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user = update.effective_user
+    tenant = tenant_of(context)
+    if user is None or user.id == tenant.admin_id:
+        return
+    query = update.callback_query
+    message = update.message
+    category = update_category(update, context.user_data)
+    # У каждого бота свои лимиты: кто пишет двум адвокатам, не тратит общий бюджет.
+    owner = (tenant.tenant_id, user.id)
+    if rate_limiter.allow(owner, category):
+        return
+    metrics.inc("rate_limited_total", category=category)
+    # Кнопку всё равно нужно «отжать», сообщение же отправляем один раз
+    # за эпизод превышения, чтобы флуд не расходовал лимиты Bot API.
+    if query is not None:
+        await query.answer(RATE_LIMIT_TEXT)
+    elif message is not None and rate_limiter.should_notify(owner, category):
+        await message.reply_text(RATE_LIMIT_TEXT)
+    raise ApplicationHandlerStop
+
+
+async def digest_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    count = await send_digest(tenant_of(context))
+    if count:
+        await update.message.reply_text(f"Сводка отправлена, заявок в ней: {count}.")
     else:
-        await update.callback_query.answer()
+        await update.message.reply_text("Отложенных заявок нет.")
+
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    try:
+        request = parse_export_args(context.args)
+    except ValueError as exc:
+        await update.message.reply_text(str(exc))
+        return
+    await update.message.reply_text("Готовлю выгрузку, пришлю файлом.")
+    # Выгрузка идёт фоном: очередь апдейтов админа не ждёт её окончания.
+    context.application.create_task(send_export(update, tenant_of(context), request), update=update)
+
 
+async def send_export(update: Update, tenant: Tenant, request: ExportRequest) -> None:
+    try:
+        with metrics.span("export_seconds", table=request.table):
+            path, count = await asyncio.to_thread(
+                export_to_file, DB_PATH, tenant.tenant_id, request, archive_dir=ARCHIVE_DIR
+            )
+    except Exception as exc:
+        logger.exception("Не удалось выгрузить %s: %s", request.table, exc)
+        await update.message.reply_text("Не удалось подготовить выгрузку, попробуйте позже.")
+        return
+    try:
+        if not count:
+            await update.message.reply_text("За этот период записей нет.")
+        elif path.stat().st_size > DOCUMENT_LIMIT:
+            await update.message.reply_text(
+                f"Выгрузка слишком большая для Telegram ({count} строк), сузьте период."
+            )
+        else:
+            await update.message.reply_document(
+                path, filename=request.filename, caption=f"Строк: {count}"
+            )
+    finally:
+        path.unlink(missing_ok=True)
 
-async def handle_text_preprocess(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if await handle_consult_article_text(update, context):
+
+async def analytics_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    try:
+        days = parse_analytics_args(context.args)
+    except ValueError as exc:
+        await update.message.reply_text(str(exc))
         return
-    await handle_text(update, context)
+    tenant = tenant_of(context)
+    today = datetime.now(timezone.utc).date()
+    with metrics.span("db_seconds", op="analytics"):
+        report = await database.read(lambda conn: read_report(conn, tenant.tenant_id, days, today))
+    await update.message.reply_text(format_report(report))
+
+
+async def analytics_rebuild_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await update.message.reply_text("Пересчитываю статистику по всем заявкам, включая архив.")
+    context.application.create_task(send_rebuilt_analytics(update, tenant_of(context)), update=update)
+
+
+async def rebuild_analytics(tenant: Tenant) -> int:
+    """Пересчитывает счётчики бота по рабочей базе и архивам; возвращает число строк."""
+    # Перенос в архив на это время ждёт: иначе часть заявок посчиталась бы
+    # дважды или ни разу.
+    async with archiver.lock if archiver is not None else nullcontext():
+        archived = await asyncio.to_thread(count_archived_requests, ARCHIVE_DIR, tenant.tenant_id)
+
+        def rebuild(conn: sqlite3.Connection) -> int:
+            counts = count_requests(conn, tenant_id=tenant.tenant_id) + archived
+            return replace_rollups(conn, counts, tenant.tenant_id)
+
+        return await database.execute(rebuild)
+
+
+async def send_rebuilt_analytics(update: Update, tenant: Tenant) -> None:
+    with metrics.span("analytics_rebuild_seconds"):
+        rows = await rebuild_analytics(tenant)
+    await update.message.reply_text(f"Статистика пересчитана, строк счётчиков: {rows}.")
+
+
+async def handle_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    metrics.inc("errors_total", error=type(context.error).__name__)
+    logger.error("Ошибка при обработке апдейта", exc_info=context.error)
+
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    gauges = runtime_gauges([tenant_of(context)])
+    lines = [
+        "📊 Статистика бота",
+        "",
+        f"SQLite: пакетов {gauges['db_batches_total']}, операций {gauges['db_operations_total']}, "
+        f"запись {gauges['db_write_seconds_total'] * 1000:.0f} мс",
+        f"Очередь апдейтов: {gauges['pending_updates']} от {gauges['pending_users']} польз., "
+        f"макс. глубина {gauges['max_user_queue_depth']}",
+        f"Лимитер: корзин в памяти {gauges['rate_limit_buckets']}",
+        f"Отправленные заявки в памяти: {gauges['submission_cache_entries']}",
+        f"Уведомления: в отправке {gauges['outbox_in_flight']}",
+        f"Черновики: экстренных {gauges['drafts_emergency']}, консультаций "
+        f"{gauges['drafts_consultation']}, ~{gauges['draft_bytes'] / 1024:.1f} КиБ; "
+        f"user_data в памяти {gauges['user_data_entries']}",
+    ]
+    if metrics.enabled:
+        lines += ["", metrics.render_text()]
+    else:
+        lines += ["", "Метрики выключены (METRICS_ENABLED в cfg.py)."]
+    await update.message.reply_text("\n".join(lines))
+
+
+def build_application(bot: Optional[Bot] = None, tenant: Optional[Tenant] = None) -> Application:
+    """Приложение бота ``tenant`` (по умолчанию – первого из настроек)."""
+    tenant = tenant or next(iter(tenants.values()))
+    builder = ApplicationBuilder()
+    if bot is not None:
+        builder = builder.bot(bot)
+    else:
+        # Обычные запросы всех ботов идут через общий пул, а long polling
+        # держит соединение подолгу – ему у каждого бота своё.
+        builder = (
+            builder.token(tenant.config.token)
+            .request(bot_request)
+            .get_updates_request(HTTPXRequest(httpx_kwargs={"verify": tls_context}))
+        )
+    application = (
+        builder.update_queue(asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE))
+        .concurrent_updates(update_processor)
+        .persistence(
+            SQLitePersistence(
+                database,
+                tenant.tenant_id,
+                update_interval=PERSISTENCE_FLUSH_INTERVAL,
+                json_default=draft_to_json,
+                on_load=restore_drafts,
+            )
+        )
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    application.bot_data[TENANT_KEY] = tenant
+    user_data_by_token[application.bot.token] = application.user_data
+    tenant.application = application
+    if tenant.refreshes_about:
+        application.job_queue.run_repeating(
+            refresh_about_job, interval=ABOUT_REFRESH_INTERVAL, first=0, name="about_refresh"
+        )
+    application.job_queue.run_repeating(
+        digest_job, interval=DIGEST_INTERVAL, first=DIGEST_INTERVAL, name="admin_digest"
+    )
+    application.job_queue.run_repeating(
+        sweep_drafts_job, interval=DRAFT_SWEEP_INTERVAL, first=DRAFT_SWEEP_INTERVAL, name="draft_sweep"
+    )
+    # Архив общий для всех ботов базы, переносом занимается первый.
+    if archiver is not None and tenant is next(iter(tenants.values())):
+        application.job_queue.run_repeating(
+            archive_job, interval=ARCHIVE_INTERVAL, first=ARCHIVE_INTERVAL, name="archive"
+        )
+
+    timed = metrics.instrument
+    admin_only = filters.User(user_id=tenant.admin_id)
+    if metrics.enabled:
+        application.add_handler(TypeHandler(Update, count_update), group=-2)
+    if RATE_LIMIT_ENABLED:
+        application.add_handler(TypeHandler(Update, enforce_rate_limit), group=-1)
+    application.add_handler(CommandHandler("start", timed(start)))
+    application.add_handler(CommandHandler("help", timed(help_command)))
+    application.add_handler(CommandHandler("stats", stats_command, filters=admin_only))
+    application.add_handler(CommandHandler("digest", digest_command, filters=admin_only))
+    application.add_handler(CommandHandler("export", export_command, filters=admin_only))
+    application.add_handler(CommandHandler("find", find_command, filters=admin_only))
+    application.add_handler(CommandHandler("analytics", analytics_command, filters=admin_only))
+    application.add_handler(
+        CommandHandler("analytics_rebuild", analytics_rebuild_command, filters=admin_only)
+    )
+    application.add_handler(CallbackQueryHandler(callback_router.dispatch))
+    application.add_handler(MessageHandler(filters.CONTACT, timed(handle_contact)))
+    application.add_handler(MessageHandler(filters.LOCATION, timed(handle_location)))
+    application.add_handler(MessageHandler(filters.PHOTO | filters.Document.ALL, timed(handle_attachment)))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, timed(handle_text)))
+    application.add_error_handler(handle_error)
+    return application
 
 
 def main() -> None:
-    if not TELEGRAM_BOT_TOKEN:
-        raise RuntimeError("Не найден TELEGRAM_BOT_TOKEN в cfg.py")
+    for config in TENANT_CONFIGS:
+        if not config.token:
+            raise RuntimeError(
+                f"Не найден токен бота {config.tenant_id}: TELEGRAM_BOT_TOKEN или TENANTS в cfg.py"
+            )
 
     init_db()
+    applications = [build_application(tenant=tenant) for tenant in tenants.values()]
+
+    if BOT_MODE == "webhook":
+        run_webhook(applications)
+    elif len(applications) == 1:
+        logger.info("Бот запущен")
+        applications[0].run_polling()
+    else:
+        logger.info("Запущено ботов: %s", len(applications))
+        asyncio.run(serve_applications(applications, start_polling, stop_polling))
+
+
+async def start_polling(applications: Sequence[Application]) -> None:
+    for application in applications:
+        await application.updater.start_polling()
+
+
+async def stop_polling(applications: Sequence[Application]) -> None:
+    for application in applications:
+        if application.updater.running:
+            await application.updater.stop()
 
-    application = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
 
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CallbackQueryHandler(handle_callback_queries))
-    application.add_handler(MessageHandler(filters.CONTACT, handle_contact))
-    application.add_handler(MessageHandler(filters.LOCATION, handle_location))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_preprocess))
+def webhook_route(tenant: Tenant) -> Tuple[str, Optional[str]]:
+    # Единственный бот слушает WEBHOOK_PATH, как и раньше; при нескольких
+    # к пути и к WEBHOOK_URL добавляется tenant_id.
+    suffix = "" if len(tenants) == 1 else f"/{tenant.tenant_id}"
+    url = WEBHOOK_URL.rstrip("/") + suffix if WEBHOOK_URL else None
+    return WEBHOOK_PATH.strip("/") + suffix, url
 
-    logger.info("Бот запущен")
-    application.run_polling()
+
+def run_webhook(applications: Sequence[Application]) -> None:
+    secret_token = WEBHOOK_SECRET
+    if not secret_token:
+        if not WEBHOOK_URL:
+            raise RuntimeError("Для вебхука без WEBHOOK_URL укажите WEBHOOK_SECRET в cfg.py")
+        # Вебхук регистрируется при каждом запуске, поэтому секрет можно менять.
+        secret_token = secrets.token_urlsafe(32)
+
+    routes = [(application, *webhook_route(tenant_of(application))) for application in applications]
+    server = WebhookServer(
+        {path: application for application, path, _ in routes},
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        secret_token=secret_token,
+        ssl_context=build_ssl_context(WEBHOOK_CERT, WEBHOOK_KEY),
+    )
+    logger.info("Бот запущен в режиме вебхука")
+    asyncio.run(
+        serve_webhook(
+            server,
+            [(application, url) for application, _, url in routes],
+            certificate=WEBHOOK_CERT,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+    )
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,198 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import ssl
+import tempfile
+import time
+from pathlib import Path
+from typing import AsyncIterator, Optional, Sequence, Tuple, Union
+
+import httpx
+from telegram import Bot
+
+from drafts import Attachment
+
+# Файлы, которые клиенты прикладывают к заявке на консультацию. Содержимое
+# хранится один раз под именем из своего SHA-256 (media/ab/cd/abcd…), а
+# заявки ссылаются на него через consultation_attachments. Скачивание идёт
+# потоком кусками по CHUNK_SIZE с подсчётом хэша на лету, поэтому файл
+# целиком в памяти не бывает. Уже известный файл (тот же file_unique_id)
+# повторно не скачивается. Админу вложения уходят по file_id – Telegram
+# пересылает их сам, без повторной загрузки байтов.
+
+MEDIA_FILES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media_files (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mime_type TEXT,
+    created_at INTEGER NOT NULL
+) WITHOUT ROWID
+"""
+# Один и тот же файл в Telegram может прийти под разными file_unique_id
+# (например, разные размеры фото), поэтому соответствие – отдельной таблицей.
+MEDIA_SOURCES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media_sources (
+    file_unique_id TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL REFERENCES media_files (sha256)
+) WITHOUT ROWID
+"""
+# Без внешнего ключа на consultations: заявки уходят в архив (archive.py),
+# а ссылки на их файлы остаются в рабочей базе.
+CONSULTATION_ATTACHMENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS consultation_attachments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tenant_id TEXT NOT NULL,
+    consultation_id INTEGER NOT NULL,
+    sha256 TEXT NOT NULL REFERENCES media_files (sha256),
+    kind TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    file_unique_id TEXT NOT NULL,
+    file_name TEXT,
+    created_at INTEGER NOT NULL
+)
+"""
+CONSULTATION_ATTACHMENTS_INDEX = (
+    "CREATE INDEX IF NOT EXISTS idx_consultation_attachments_consultation "
+    "ON consultation_attachments (tenant_id, consultation_id)"
+)
+
+CHUNK_SIZE = 64 * 1024
+# Больше этого Bot API скачать не даёт (getFile).
+MEDIA_MAX_BYTES = 20 * 1024 * 1024
+
+
+class MediaTooLarge(Exception):
+    """Файл больше, чем можно скачать через Bot API."""
+
+
+def known_media(conn: sqlite3.Connection, file_unique_id: str) -> Optional[Tuple[str, int]]:
+    """SHA-256 и размер уже сохранённого файла с этим file_unique_id."""
+    return conn.execute(
+        """
+        SELECT media_files.sha256, media_files.size FROM media_sources
+        JOIN media_files USING (sha256) WHERE file_unique_id = ?
+        """,
+        (file_unique_id,),
+    ).fetchone()
+
+
+def remember_media(
+    conn: sqlite3.Connection, sha256: str, size: int, mime_type: Optional[str], file_unique_id: str
+) -> None:
+    conn.execute(
+        "INSERT OR IGNORE INTO media_files (sha256, size, mime_type, created_at) VALUES (?, ?, ?, ?)",
+        (sha256, size, mime_type, int(time.time())),
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO media_sources (file_unique_id, sha256) VALUES (?, ?)",
+        (file_unique_id, sha256),
+    )
+
+
+def link_attachments(
+    conn: sqlite3.Connection, tenant_id: str, consultation_id: int, attachments: Sequence[Attachment]
+) -> None:
+    now = int(time.time())
+    conn.executemany(
+        """
+        INSERT INTO consultation_attachments (
+            tenant_id, consultation_id, sha256, kind, file_id, file_unique_id, file_name, created_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (
+                tenant_id,
+                consultation_id,
+                item.sha256,
+                item.kind,
+                item.file_id,
+                item.file_unique_id,
+                item.file_name,
+                now,
+            )
+            for item in attachments
+        ],
+    )
+
+
+class MediaStore:
+    """Хранилище файлов по SHA-256 содержимого в каталоге ``root``."""
+
+    def __init__(
+        self,
+        root: Path,
+        max_bytes: int = MEDIA_MAX_BYTES,
+        chunk_size: int = CHUNK_SIZE,
+        verify: Union[bool, ssl.SSLContext] = True,
+        client: Optional[httpx.AsyncClient] = None,
+    ) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self._verify = verify
+        self._client = client
+
+    def path(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256[2:4] / sha256
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            # Файлы идут с api.telegram.org, общий с ботами SSL-контекст
+            # передаётся через ``verify``.
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(30.0), verify=self._verify)
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _chunks(self, file_path: str) -> AsyncIterator[bytes]:
+        if not file_path.startswith(("http://", "https://")):
+            # Локальный сервер Bot API (--local) отдаёт путь на диске; чтение
+            # идёт в потоке, чтобы большой файл не останавливал цикл событий.
+            handle = await asyncio.to_thread(open, file_path, "rb")
+            try:
+                while chunk := await asyncio.to_thread(handle.read, self.chunk_size):
+                    yield chunk
+            finally:
+                await asyncio.to_thread(handle.close)
+            return
+        async with self._get_client().stream("GET", file_path) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(self.chunk_size):
+                yield chunk
+
+    async def download(self, bot: Bot, file_id: str) -> Tuple[str, int]:
+        """Скачивает файл из Telegram и возвращает его SHA-256 и размер.
+
+        Если файл с таким содержимым уже есть, скачанная копия удаляется.
+        """
+        telegram_file = await bot.get_file(file_id)
+        if (telegram_file.file_size or 0) > self.max_bytes or not telegram_file.file_path:
+            raise MediaTooLarge(file_id)
+        self.root.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        # Временный файл в том же каталоге: os.replace ниже атомарен.
+        handle = tempfile.NamedTemporaryFile("wb", dir=self.root, prefix=".part-", delete=False)
+        try:
+            with handle:
+                async for chunk in self._chunks(telegram_file.file_path):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise MediaTooLarge(file_id)
+                    digest.update(chunk)
+                    handle.write(chunk)
+            sha256 = digest.hexdigest()
+            target = self.path(sha256)
+            if target.exists():
+                Path(handle.name).unlink()
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(handle.name, target)
+        except BaseException:
+            Path(handle.name).unlink(missing_ok=True)
+            raise
+        return sha256, size
@@ -0,0 +1,226 @@
+import asyncio
+import bisect
+import functools
+import logging
+import time
+from contextlib import nullcontext
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telegram.ext import ApplicationHandlerStop
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм в секундах.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+NULL_SPAN = nullcontext()
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, share: float) -> float:
+        # Оценка сверху: граница корзины, в которую попал квантиль.
+        if not self.count:
+            return 0.0
+        rank = share * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return BUCKETS[index] if index < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+class Span:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram: Histogram) -> None:
+        self.histogram = histogram
+
+    def __enter__(self) -> "Span":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Metrics:
+    """Счётчики и гистограммы задержек в памяти процесса.
+
+    Пока ``enabled`` выключен, ``span`` возвращает общий пустой контекст,
+    ``inc``/``observe`` сразу выходят, а ``instrument`` не оборачивает
+    обработчики вовсе.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.started_at = time.time()
+
+    def configure(self, enabled: bool) -> None:
+        self.enabled = enabled
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def histogram(self, name: str, **labels: Any) -> Histogram:
+        key = (name, _labels(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        return histogram
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        if self.enabled:
+            self.histogram(name, **labels).observe(seconds)
+
+    def span(self, name: str, **labels: Any):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self.histogram(name, **labels))
+
+    def instrument(self, func: Callable[..., Awaitable[Any]], name: Optional[str] = None):
+        if not self.enabled:
+            return func
+        handler_name = name or func.__name__
+        histogram = self.histogram("handler_seconds", handler=handler_name)
+
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except ApplicationHandlerStop:
+                raise
+            except Exception:
+                self.inc("handler_errors_total", handler=handler_name)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started)
+
+        return wrapper
+
+    def render_text(self) -> str:
+        lines: List[str] = [f"Аптайм: {int(time.time() - self.started_at)} с"]
+        if self.counters:
+            lines.append("")
+            lines.append("Счётчики:")
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"• {name}{_format_labels(labels)}: {value:g}")
+        if self.histograms:
+            lines.append("")
+            lines.append("Задержки (count / p50 / p95 / p99, мс):")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if not histogram.count:
+                    continue
+                lines.append(
+                    f"• {name}{_format_labels(labels)}: {histogram.count} / "
+                    f"{_ms(histogram.quantile(0.5))} / {_ms(histogram.quantile(0.95))} / "
+                    f"{_ms(histogram.quantile(0.99))}"
+                )
+        return "\n".join(lines)
+
+    def render_prometheus(self, extra_gauges: Optional[Dict[str, float]] = None) -> str:
+        lines: List[str] = []
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"advbot_{name}{_prometheus_labels(labels)} {value:g}")
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS + (float("inf"),), histogram.counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(
+                    f"advbot_{name}_bucket{_prometheus_labels(labels + (('le', le),))} {cumulative}"
+                )
+            lines.append(f"advbot_{name}_sum{_prometheus_labels(labels)} {histogram.total:.6f}")
+            lines.append(f"advbot_{name}_count{_prometheus_labels(labels)} {histogram.count}")
+        for name, value in (extra_gauges or {}).items():
+            lines.append(f"advbot_{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _ms(seconds: float) -> str:
+    return "∞" if seconds == float("inf") else f"{seconds * 1000:g}"
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "[" + ", ".join(f"{key}={value}" for key, value in labels) + "]"
+
+
+def _prometheus_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+class PrometheusServer:
+    """Отдаёт метрики в текстовом формате Prometheus по GET /metrics."""
+
+    def __init__(
+        self, render: Callable[[], str], listen: str = "127.0.0.1", port: int = 9108
+    ) -> None:
+        self.render = render
+        self.listen = listen
+        self.port = port
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.listen, self.port)
+        logger.info("Метрики Prometheus доступны на %s:%s/metrics", self.listen, self.port)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 10)
+            while (await asyncio.wait_for(reader.readline(), 10)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", self.render().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b""
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode("ascii")
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+metrics = Metrics()
@@ -0,0 +1,333 @@
+import logging
+import sqlite3
+import time
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from analytics import ROLLUP_SCHEMA, count_requests, replace_rollups
+from digest import DIGEST_SCHEMA
+from drafts import ABANDONED_EMERGENCIES_INDEX, ABANDONED_EMERGENCIES_SCHEMA
+from media import (
+    CONSULTATION_ATTACHMENTS_INDEX,
+    CONSULTATION_ATTACHMENTS_SCHEMA,
+    MEDIA_FILES_SCHEMA,
+    MEDIA_SOURCES_SCHEMA,
+)
+from outbox import OUTBOX_FAILED_COLUMN, OUTBOX_INDEX, OUTBOX_SCHEMA, OUTBOX_TENANT_INDEX
+from persistence import USER_STATE_SCHEMA
+from search import SEARCH_LAYOUT, SEARCH_LAYOUT_V1, create_search_index, drop_search_index
+from slots import SLOTS_INDEX, TENANT_SLOTS_INDEX
+from submissions import SUBMISSION_TOKEN_INDEXES
+
+logger = logging.getLogger(__name__)
+
+# Версионные миграции схемы. Каждый шаг выполняется в своей транзакции
+# вместе с записью в schema_version, поэтому прерванный запуск ничего не
+# ломает: при следующем старте шаг просто повторится целиком. Шаги
+# добавляются только в конец списка и после выпуска не меняются.
+
+Migration = Callable[[sqlite3.Connection], None]
+
+SCHEMA_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at INTEGER NOT NULL
+)
+"""
+
+MIGRATIONS: List[Tuple[int, str, Migration]] = []
+
+
+def migration(version: int, description: str) -> Callable[[Migration], Migration]:
+    def register(step: Migration) -> Migration:
+        if MIGRATIONS and MIGRATIONS[-1][0] >= version:
+            raise ValueError(f"Миграция {version} объявлена не по порядку")
+        MIGRATIONS.append((version, description, step))
+        return step
+
+    return register
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    conn.execute(SCHEMA_VERSION_TABLE)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, target: Optional[int] = None) -> List[int]:
+    """Применяет недостающие миграции до ``target`` (по умолчанию – до последней).
+
+    Соединение должно быть открыто с ``isolation_level=None``: транзакциями
+    управляет сама функция.
+    """
+    applied: List[int] = []
+    version = current_version(conn)
+    for step_version, description, step in MIGRATIONS:
+        if step_version <= version or (target is not None and step_version > target):
+            continue
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            step(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (step_version, description, int(time.time())),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        logger.info(
+            "Миграция %s (%s) применена за %.1f с",
+            step_version,
+            description,
+            time.perf_counter() - started,
+        )
+        applied.append(step_version)
+    return applied
+
+
+def rebuild_table(
+    conn: sqlite3.Connection, table: str, ddl: str, columns: Sequence[str], select: Sequence[str]
+) -> None:
+    """Пересоздаёт таблицу по шаблону ``ddl`` (с ``{name}``), копируя данные выражениями ``select``.
+
+    Индексы старой таблицы удаляются вместе с ней и создаются заново
+    следующими шагами.
+    """
+    temporary = f"{table}_rebuild"
+    conn.execute(ddl.format(name=temporary))
+    conn.execute(
+        f"INSERT INTO {temporary} ({', '.join(columns)}) SELECT {', '.join(select)} FROM {table}"
+    )
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {temporary} RENAME TO {table}")
+    if sequence is not None:
+        # AUTOINCREMENT не должен выдать заново номера удалённых заявок.
+        conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (sequence[0], table))
+
+
+EMERGENCY_CALLS_V1 = """
+CREATE TABLE IF NOT EXISTS emergency_calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    username TEXT,
+    full_name TEXT,
+    phone TEXT,
+    address TEXT,
+    coordinates TEXT,
+    article TEXT,
+    created_at TEXT
+)
+"""
+
+CONSULTATIONS_V1 = """
+CREATE TABLE IF NOT EXISTS consultations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    username TEXT,
+    full_name TEXT,
+    city TEXT,
+    phone TEXT,
+    urgency TEXT,
+    article TEXT,
+    description TEXT,
+    preferred_date TEXT,
+    preferred_time TEXT,
+    created_at TEXT
+)
+"""
+
+EMERGENCY_COLUMNS = (
+    "id",
+    "user_id",
+    "username",
+    "full_name",
+    "phone",
+    "address",
+    "coordinates",
+    "article",
+)
+CONSULTATION_COLUMNS = (
+    "id",
+    "user_id",
+    "username",
+    "full_name",
+    "city",
+    "phone",
+    "urgency",
+    "article",
+    "description",
+    "preferred_date",
+    "preferred_time",
+)
+
+
+@migration(1, "исходная схема")
+def initial_schema(conn: sqlite3.Connection) -> None:
+    # Базы, созданные до появления версий, уже содержат эти таблицы.
+    for statement in (
+        EMERGENCY_CALLS_V1,
+        CONSULTATIONS_V1,
+        OUTBOX_SCHEMA,
+        OUTBOX_INDEX,
+        USER_STATE_SCHEMA,
+        DIGEST_SCHEMA,
+        SLOTS_INDEX,
+    ):
+        conn.execute(statement)
+
+
+@migration(2, "created_at заявок в секундах Unix")
+def epoch_created_at(conn: sqlite3.Connection) -> None:
+    epoch = "CAST(strftime('%s', created_at) AS INTEGER)"
+    rebuild_table(
+        conn,
+        "emergency_calls",
+        """
+        CREATE TABLE {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            username TEXT,
+            full_name TEXT,
+            phone TEXT,
+            address TEXT,
+            coordinates TEXT,
+            article TEXT,
+            created_at INTEGER
+        )
+        """,
+        EMERGENCY_COLUMNS + ("created_at",),
+        EMERGENCY_COLUMNS + (epoch,),
+    )
+    rebuild_table(
+        conn,
+        "consultations",
+        """
+        CREATE TABLE {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            username TEXT,
+            full_name TEXT,
+            city TEXT,
+            phone TEXT,
+            urgency TEXT,
+            article TEXT,
+            description TEXT,
+            preferred_date TEXT,
+            preferred_time TEXT,
+            created_at INTEGER
+        )
+        """,
+        CONSULTATION_COLUMNS + ("created_at",),
+        CONSULTATION_COLUMNS + (epoch,),
+    )
+
+
+@migration(3, "индексы под выборки по времени, пользователю, статье и срочности")
+def access_indexes(conn: sqlite3.Connection) -> None:
+    # Во всех индексах последним идёт created_at: выборки «за период» по
+    # статье, срочности или пользователю читают только нужный диапазон.
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS idx_emergency_calls_created ON emergency_calls (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_emergency_calls_user ON emergency_calls (user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_emergency_calls_article ON emergency_calls (article, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_consultations_created ON consultations (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_consultations_user ON consultations (user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_consultations_article ON consultations (article, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_consultations_urgency ON consultations (urgency, created_at)",
+        SLOTS_INDEX,
+    ):
+        conn.execute(statement)
+
+
+@migration(4, "полнотекстовый поиск по заявкам")
+def full_text_search(conn: sqlite3.Connection) -> None:
+    create_search_index(conn, SEARCH_LAYOUT_V1)
+
+
+@migration(5, "брошенные черновики экстренных вызовов")
+def abandoned_emergencies(conn: sqlite3.Connection) -> None:
+    conn.execute(ABANDONED_EMERGENCIES_SCHEMA)
+    conn.execute(ABANDONED_EMERGENCIES_INDEX)
+
+
+@migration(6, "токены идемпотентности заявок")
+def submission_tokens(conn: sqlite3.Connection) -> None:
+    # Старые заявки остаются без токена: частичные индексы их не учитывают.
+    conn.execute("ALTER TABLE emergency_calls ADD COLUMN submission_token TEXT")
+    conn.execute("ALTER TABLE consultations ADD COLUMN submission_token TEXT")
+    for statement in SUBMISSION_TOKEN_INDEXES:
+        conn.execute(statement)
+
+
+@migration(7, "подпись места к координатам экстренного вызова")
+def location_labels(conn: sqlite3.Connection) -> None:
+    conn.execute("ALTER TABLE emergency_calls ADD COLUMN location_label TEXT")
+    conn.execute("ALTER TABLE abandoned_emergencies ADD COLUMN location_label TEXT")
+
+
+@migration(8, "несколько ботов в одной базе: tenant_id")
+def tenants(conn: sqlite3.Connection) -> None:
+    # Всё, что было до появления нескольких ботов, принадлежит боту "default".
+    tables = ("emergency_calls", "consultations", "admin_outbox", "admin_digest", "abandoned_emergencies")
+    for table in tables:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN tenant_id TEXT NOT NULL DEFAULT 'default'")
+    rebuild_table(
+        conn,
+        "user_state",
+        """
+        CREATE TABLE {name} (
+            tenant_id TEXT NOT NULL DEFAULT 'default',
+            user_id INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            updated_at TEXT,
+            PRIMARY KEY (tenant_id, user_id)
+        )
+        """,
+        ("user_id", "data", "updated_at"),
+        ("user_id", "data", "updated_at"),
+    )
+    # Выборки очереди, расписания и выгрузки всегда идут по одному боту,
+    # поэтому tenant_id встаёт первым столбцом вместо прежних индексов.
+    conn.execute("DROP INDEX IF EXISTS idx_admin_outbox_pending")
+    conn.execute("DROP INDEX IF EXISTS idx_consultations_slot")
+    for statement in (
+        OUTBOX_TENANT_INDEX,
+        TENANT_SLOTS_INDEX,
+        "CREATE INDEX IF NOT EXISTS idx_emergency_calls_tenant_created "
+        "ON emergency_calls (tenant_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_consultations_tenant_created "
+        "ON consultations (tenant_id, created_at)",
+    ):
+        conn.execute(statement)
+    drop_search_index(conn)
+    create_search_index(conn, SEARCH_LAYOUT)
+
+
+@migration(9, "счётчики заявок по дням для /analytics")
+def request_rollups(conn: sqlite3.Connection) -> None:
+    # Архивы месяцев к транзакции не подключить: их заявки добавит
+    # /analytics_rebuild.
+    conn.execute(ROLLUP_SCHEMA)
+    replace_rollups(conn, count_requests(conn))
+
+
+@migration(10, "файлы к заявкам на консультацию")
+def consultation_media(conn: sqlite3.Connection) -> None:
+    for statement in (
+        MEDIA_FILES_SCHEMA,
+        MEDIA_SOURCES_SCHEMA,
+        CONSULTATION_ATTACHMENTS_SCHEMA,
+        CONSULTATION_ATTACHMENTS_INDEX,
+    ):
+        conn.execute(statement)
+    # Вложения уходят админу по file_id – и сразу, и после сводки.
+    for table in ("admin_outbox", "admin_digest"):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN media_kind TEXT")
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN file_id TEXT")
+
+
+@migration(11, "уведомления, снятые с очереди после ошибки")
+def outbox_failures(conn: sqlite3.Connection) -> None:
+    conn.execute(OUTBOX_FAILED_COLUMN)
@@ -0,0 +1,355 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Collection, Deque, Dict, List, Optional, Set, Tuple
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+from metrics import metrics
+from storage import Database, insert_row
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS admin_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    parse_mode TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at TEXT,
+    sent_at TEXT
+)
+"""
+OUTBOX_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_admin_outbox_pending
+    ON admin_outbox (next_attempt_at) WHERE sent_at IS NULL
+"""
+# Каждый бот выбирает из очереди только свои строки.
+OUTBOX_TENANT_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_admin_outbox_tenant_pending
+    ON admin_outbox (tenant_id, next_attempt_at) WHERE sent_at IS NULL
+"""
+
+# Уведомление с media_kind ("photo" или "document") отправляет файл по
+# file_id, а text становится подписью к нему.
+OutboxRow = Tuple[int, int, str, Optional[str], int, Optional[str], Optional[str]]
+CAPTION_LIMIT = 1024
+# Уведомление, которое Telegram не примет никогда (BadRequest, Forbidden) или
+# не принял за max_attempts попыток, получает failed_at и больше не выбирается.
+# Таких строк мало, поэтому частичный индекс очереди их не исключает.
+OUTBOX_FAILED_COLUMN = "ALTER TABLE admin_outbox ADD COLUMN failed_at TEXT"
+
+
+def enqueue_notification(
+    conn: sqlite3.Connection,
+    tenant_id: str,
+    chat_id: int,
+    text: str,
+    parse_mode: Optional[str] = None,
+    media_kind: Optional[str] = None,
+    file_id: Optional[str] = None,
+) -> int:
+    return insert_row(
+        conn,
+        "admin_outbox",
+        {
+            "tenant_id": tenant_id,
+            "chat_id": chat_id,
+            "text": text,
+            "parse_mode": parse_mode,
+            "media_kind": media_kind,
+            "file_id": file_id,
+            "next_attempt_at": 0,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        },
+    )
+
+
+def fetch_due(conn: sqlite3.Connection, tenant_id: str, now: float, limit: int) -> List[OutboxRow]:
+    return conn.execute(
+        """
+        SELECT id, chat_id, text, parse_mode, attempts, media_kind, file_id FROM admin_outbox
+        WHERE tenant_id = ? AND sent_at IS NULL AND failed_at IS NULL AND next_attempt_at <= ?
+        ORDER BY next_attempt_at, id LIMIT ?
+        """,
+        (tenant_id, now, limit),
+    ).fetchall()
+
+
+def next_due_at(
+    conn: sqlite3.Connection, tenant_id: str, exclude: Collection[int] = ()
+) -> Optional[float]:
+    placeholders = ", ".join("?" for _ in exclude)
+    return conn.execute(
+        "SELECT MIN(next_attempt_at) FROM admin_outbox "
+        "WHERE tenant_id = ? AND sent_at IS NULL AND failed_at IS NULL "
+        f"AND id NOT IN ({placeholders})",
+        (tenant_id, *exclude),
+    ).fetchone()[0]
+
+
+def retry_after_seconds(exc: RetryAfter) -> float:
+    value = exc.retry_after
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class OutboxSender:
+    """Фоновая доставка уведомлений из таблицы admin_outbox.
+
+    Неотправленные строки переживают перезапуск. Сетевые ошибки повторяются
+    с экспоненциальной задержкой, но не больше ``max_attempts`` раз;
+    RetryAfter приостанавливает всю отправку. Остальные ошибки Telegram
+    (неверная разметка, чат не найден, бот заблокирован) повтором не
+    исправить: строка сразу помечается failed_at, и очередь чата идёт дальше.
+
+    У каждого чата своя очередь и своя задача: сообщения одному получателю
+    уходят по порядку и не чаще ``chat_interval`` секунд (``group_interval``
+    для групп), а разные получатели обслуживаются параллельно – не больше
+    ``concurrency`` запросов к Bot API одновременно. Медленный или
+    ограниченный чат задерживает только свои сообщения.
+
+    Отправитель обслуживает строки одного ``tenant_id`` – у каждого бота
+    свой отправитель, и RetryAfter одного бота не задерживает остальных.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        tenant_id: str,
+        batch_size: int = 20,
+        base_delay: float = 2.0,
+        max_delay: float = 600.0,
+        max_attempts: int = 10,
+        idle_poll: float = 60.0,
+        concurrency: int = 8,
+        chat_interval: float = 1.0,
+        group_interval: float = 3.0,
+    ) -> None:
+        self.database = database
+        self.tenant_id = tenant_id
+        self.batch_size = batch_size
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.idle_poll = idle_poll
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self._bot: Optional[Bot] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._paused_until = 0.0
+        self._send_slots = asyncio.Semaphore(concurrency)
+        self._in_flight: Set[int] = set()
+        self._chat_queues: Dict[int, Deque[OutboxRow]] = {}
+        self._chat_tasks: Dict[int, asyncio.Task] = {}
+        self._chat_ready: Dict[int, float] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def start(self, bot: Bot) -> None:
+        self._bot = bot
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        tasks = [self._task, *self._chat_tasks.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._in_flight.clear()
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._pause_if_flooded()
+                # Будильник сбрасывается до чтения: wake() после него не потеряется.
+                self._wakeup.clear()
+                if len(self._in_flight) < self.batch_size:
+                    limit = self.batch_size + len(self._in_flight)
+                    rows = await self.database.read(
+                        lambda conn: fetch_due(conn, self.tenant_id, time.time(), limit)
+                    )
+                    for row in rows:
+                        if row[0] not in self._in_flight:
+                            self._dispatch(row)
+                await self._sleep_until_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # pragma: no cover - страховка фоновой задачи
+                logger.exception("Ошибка в очереди уведомлений: %s", exc)
+                await asyncio.sleep(self.base_delay)
+
+    def _dispatch(self, row: OutboxRow) -> None:
+        chat_id = row[1]
+        self._in_flight.add(row[0])
+        self._chat_queues.setdefault(chat_id, deque()).append(row)
+        if chat_id not in self._chat_tasks:
+            self._chat_tasks[chat_id] = asyncio.get_running_loop().create_task(self._drain_chat(chat_id))
+
+    async def _drain_chat(self, chat_id: int) -> None:
+        queue = self._chat_queues[chat_id]
+        try:
+            while queue:
+                row = queue[0]
+                try:
+                    await self._wait_chat_turn(chat_id)
+                    async with self._send_slots:
+                        await self._pause_if_flooded()
+                        await self._deliver(row)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    # Не ошибка Telegram (сбой в коде или записи в БД): строка
+                    # всё равно откладывается с задержкой, иначе её тут же
+                    # выберут снова – и, если сообщение уже ушло, повторят.
+                    logger.exception("Ошибка при отправке уведомления %s: %s", row[0], exc)
+                    try:
+                        await self._retry_or_fail(row[0], row[4], exc)
+                    except Exception as reschedule_exc:  # pragma: no cover - страховка фоновой задачи
+                        logger.exception(
+                            "Не удалось отложить уведомление %s: %s", row[0], reschedule_exc
+                        )
+                finally:
+                    queue.popleft()
+                    self._in_flight.discard(row[0])
+                    # Освободилось место: очередь может забрать следующие строки.
+                    self.wake()
+        finally:
+            # Неотправленное остаётся в таблице и будет выбрано заново.
+            for row in queue:
+                self._in_flight.discard(row[0])
+            del self._chat_queues[chat_id]
+            del self._chat_tasks[chat_id]
+
+    async def _wait_chat_turn(self, chat_id: int) -> None:
+        # В группах (отрицательные id) Telegram разрешает меньше сообщений в минуту.
+        interval = self.group_interval if chat_id < 0 else self.chat_interval
+        ready = max(self._chat_ready.get(chat_id, 0.0), time.monotonic())
+        self._chat_ready[chat_id] = ready + interval
+        delay = ready - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _pause_if_flooded(self) -> None:
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _sleep_until_due(self) -> None:
+        if len(self._in_flight) >= self.batch_size:
+            # Новые строки возьмём, когда воркеры чатов разгрузятся.
+            due = None
+        else:
+            exclude = tuple(self._in_flight)
+            due = await self.database.read(lambda conn: next_due_at(conn, self.tenant_id, exclude))
+        timeout = self.idle_poll if due is None else min(max(due - time.time(), 0), self.idle_poll)
+        # asyncio.timeout, а не wait_for: в Python 3.11 wait_for теряет отмену,
+        # если событие выставлено в тот же момент, и stop() зависает.
+        try:
+            async with asyncio.timeout(timeout):
+                await self._wakeup.wait()
+        except TimeoutError:
+            pass
+
+    async def _send(
+        self,
+        chat_id: int,
+        text: str,
+        parse_mode: Optional[str],
+        media_kind: Optional[str],
+        file_id: Optional[str],
+    ) -> None:
+        # Файл уже лежит на серверах Telegram: по file_id он не загружается заново.
+        if media_kind == "photo":
+            with metrics.span("telegram_seconds", method="send_photo"):
+                await self._bot.send_photo(
+                    chat_id=chat_id, photo=file_id, caption=text[:CAPTION_LIMIT], parse_mode=parse_mode
+                )
+        elif media_kind == "document":
+            with metrics.span("telegram_seconds", method="send_document"):
+                await self._bot.send_document(
+                    chat_id=chat_id, document=file_id, caption=text[:CAPTION_LIMIT], parse_mode=parse_mode
+                )
+        else:
+            with metrics.span("telegram_seconds", method="send_message"):
+                await self._bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+
+    async def _deliver(self, row: OutboxRow) -> None:
+        row_id, chat_id, text, parse_mode, attempts, media_kind, file_id = row
+        try:
+            await self._send(chat_id, text, parse_mode, media_kind, file_id)
+        except RetryAfter as exc:
+            metrics.inc("telegram_errors_total", error="RetryAfter")
+            delay = retry_after_seconds(exc)
+            logger.warning("Telegram просит подождать %.0f с перед отправкой", delay)
+            self._paused_until = time.monotonic() + delay
+            await self._reschedule(row_id, attempts, delay, str(exc))
+            return
+        except (BadRequest, Forbidden) as exc:
+            # BadRequest – подкласс NetworkError, поэтому проверяется первым.
+            metrics.inc("telegram_errors_total", error=type(exc).__name__)
+            await self._fail(row_id, attempts + 1, exc)
+            return
+        except NetworkError as exc:
+            metrics.inc("telegram_errors_total", error=type(exc).__name__)
+            logger.warning(
+                "Не удалось отправить уведомление %s (попытка %s): %s", row_id, attempts + 1, exc
+            )
+            await self._retry_or_fail(row_id, attempts, exc)
+            return
+        except TelegramError as exc:
+            metrics.inc("telegram_errors_total", error=type(exc).__name__)
+            await self._fail(row_id, attempts + 1, exc)
+            return
+
+        await self.database.execute(
+            lambda conn: conn.execute(
+                "UPDATE admin_outbox SET sent_at = ?, attempts = ? WHERE id = ?",
+                (datetime.now(timezone.utc).isoformat(), attempts + 1, row_id),
+            )
+        )
+
+    async def _reschedule(self, row_id: int, attempts: int, delay: float, error: str) -> None:
+        await self.database.execute(
+            lambda conn: conn.execute(
+                "UPDATE admin_outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                (attempts, time.time() + delay, error, row_id),
+            )
+        )
+
+    async def _retry_or_fail(self, row_id: int, attempts: int, exc: Exception) -> None:
+        # ``attempts`` – число попыток до этой, неудачной.
+        if attempts + 1 >= self.max_attempts:
+            await self._fail(row_id, attempts + 1, exc)
+            return
+        delay = min(self.base_delay * 2 ** attempts, self.max_delay)
+        error = str(exc) if isinstance(exc, TelegramError) else repr(exc)
+        await self._reschedule(row_id, attempts + 1, delay, error)
+
+    async def _fail(self, row_id: int, attempts: int, exc: Exception) -> None:
+        metrics.inc("outbox_failed_total", error=type(exc).__name__)
+        logger.error(
+            "Уведомление %s снято с очереди (попыток: %s): %s", row_id, attempts, exc
+        )
+        await self.database.execute(
+            lambda conn: conn.execute(
+                "UPDATE admin_outbox SET attempts = ?, failed_at = ?, last_error = ? WHERE id = ?",
+                (attempts, datetime.now(timezone.utc).isoformat(), str(exc), row_id),
+            )
+        )
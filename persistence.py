@@ -0,0 +1,168 @@
+import asyncio
+import json
+import logging
+import sqlite3
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Set
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from storage import Database
+
+logger = logging.getLogger(__name__)
+
+USER_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_state (
+    user_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at TEXT
+)
+"""
+
+
+def load_user_state(conn: sqlite3.Connection, tenant_id: str, user_id: int) -> Optional[str]:
+    row = conn.execute(
+        "SELECT data FROM user_state WHERE tenant_id = ? AND user_id = ?", (tenant_id, user_id)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def write_user_states(conn: sqlite3.Connection, tenant_id: str, states: Dict[int, Optional[str]]) -> None:
+    now = datetime.now(timezone.utc).isoformat()
+    conn.executemany(
+        """
+        INSERT INTO user_state (tenant_id, user_id, data, updated_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(tenant_id, user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+        """,
+        [(tenant_id, user_id, data, now) for user_id, data in states.items() if data is not None],
+    )
+    conn.executemany(
+        "DELETE FROM user_state WHERE tenant_id = ? AND user_id = ?",
+        [(tenant_id, user_id) for user_id, data in states.items() if data is None],
+    )
+
+
+class SQLitePersistence(BasePersistence):
+    """Хранит user_data одного бота (``tenant_id``) в таблице user_state базы advbot.db.
+
+    Состояние пользователя читается из БД при первом его обновлении, а не
+    при старте. Изменившиеся пользователи накапливаются и записываются одной
+    транзакцией за каждый проход ``update_interval``. ``json_default`` и
+    ``on_load`` переводят в JSON и обратно объекты, которых нет в JSON.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        tenant_id: str,
+        update_interval: float = 10,
+        json_default: Optional[Callable[[Any], Any]] = None,
+        on_load: Optional[Callable[[Dict[Any, Any]], None]] = None,
+    ) -> None:
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, user_data=True, callback_data=False
+            ),
+            update_interval=update_interval,
+        )
+        self.database = database
+        self.tenant_id = tenant_id
+        self.json_default = json_default
+        self.on_load = on_load
+        self._loaded: Set[int] = set()
+        self._written: Dict[int, str] = {}
+        self._dirty: Dict[int, Optional[str]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        if user_id in self._loaded:
+            return
+        self._loaded.add(user_id)
+        raw = await self.database.read(lambda conn: load_user_state(conn, self.tenant_id, user_id))
+        if raw is None:
+            return
+        self._written[user_id] = raw
+        try:
+            user_data.update(json.loads(raw))
+            if self.on_load is not None:
+                self.on_load(user_data)
+        except (TypeError, ValueError) as exc:
+            logger.warning("Повреждено сохранённое состояние пользователя %s: %s", user_id, exc)
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        raw = (
+            json.dumps(data, ensure_ascii=False, sort_keys=True, default=self.json_default)
+            if data
+            else None
+        )
+        if self._written.get(user_id) == raw:
+            self._dirty.pop(user_id, None)
+            return
+        self._dirty[user_id] = raw
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._dirty[user_id] = None
+        self._schedule_flush()
+
+    async def flush(self) -> None:
+        if self._flush_task is not None:
+            await self._flush_task
+        await self.flush_dirty()
+
+    async def flush_dirty(self) -> None:
+        while self._dirty:
+            states, self._dirty = self._dirty, {}
+            try:
+                await self.database.execute(lambda conn: write_user_states(conn, self.tenant_id, states))
+            except Exception as exc:
+                logger.error("Не удалось сохранить состояние пользователей: %s", exc)
+                self._dirty = {**states, **self._dirty}
+                return
+            for user_id, raw in states.items():
+                if raw is None:
+                    self._written.pop(user_id, None)
+                else:
+                    self._written[user_id] = raw
+
+    def _schedule_flush(self) -> None:
+        # Application вызывает update_user_data для всех затронутых
+        # пользователей одной пачкой; запись откладывается до конца пачки.
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush_dirty())
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict:
+        return {}
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        pass
@@ -0,0 +1,73 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+# Бюджеты по умолчанию: (ёмкость корзины, пополнение токенов в секунду).
+DEFAULT_BUDGETS: Dict[str, Tuple[float, float]] = {
+    "emergency": (15, 0.5),
+    "consultation": (20, 0.5),
+    "navigation": (10, 1.0),
+}
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated_at", "notified")
+
+    def __init__(self, capacity: float, now: float) -> None:
+        self.tokens = capacity
+        self.updated_at = now
+        self.notified = False
+
+
+class RateLimiter:
+    """Корзины токенов по паре (пользователь, категория действий).
+
+    Корзины хранятся в порядке последнего обращения; простаивающие дольше
+    ``idle_ttl`` удаляются с головы при каждом вызове, так что память
+    ограничена числом активных пользователей. Удалять их без потерь можно,
+    когда ``idle_ttl`` не меньше времени полного пополнения корзины.
+    """
+
+    def __init__(self, budgets: Optional[Dict[str, Tuple[float, float]]] = None, idle_ttl: float = 600) -> None:
+        self.budgets = {**DEFAULT_BUDGETS, **(budgets or {})}
+        self.idle_ttl = max(
+            idle_ttl, max(capacity / rate for capacity, rate in self.budgets.values())
+        )
+        self._buckets: "OrderedDict[Tuple[Hashable, str], TokenBucket]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def allow(self, owner: Hashable, category: str, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        self._evict_idle(now)
+        capacity, rate = self.budgets[category]
+        key = (owner, category)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(capacity, now)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated_at) * rate)
+            bucket.updated_at = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            bucket.notified = False
+            return True
+        return False
+
+    def should_notify(self, owner: Hashable, category: str) -> bool:
+        # Предупреждаем один раз за эпизод превышения, а не на каждое сообщение.
+        bucket = self._buckets.get((owner, category))
+        if bucket is None or bucket.notified:
+            return False
+        bucket.notified = True
+        return True
+
+    def _evict_idle(self, now: float) -> None:
+        buckets = self._buckets
+        while buckets:
+            key, bucket = next(iter(buckets.items()))
+            if now - bucket.updated_at < self.idle_ttl:
+                break
+            del buckets[key]
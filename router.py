@@ -0,0 +1,57 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+Handler = Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[Any]]
+
+
+class PrefixTrie:
+    """Посимвольное дерево префиксов; ищет самый длинный зарегистрированный префикс."""
+
+    __slots__ = ("_root",)
+
+    _VALUE = object()
+
+    def __init__(self) -> None:
+        self._root: Dict[Any, Any] = {}
+
+    def insert(self, prefix: str, value: Any) -> None:
+        node = self._root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[self._VALUE] = value
+
+    def longest_match(self, text: str) -> Optional[Any]:
+        node = self._root
+        found = node.get(self._VALUE)
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            found = node.get(self._VALUE, found)
+        return found
+
+
+class CallbackRouter:
+    """Маршрутизация callback_data: сначала точное совпадение, затем префикс."""
+
+    def __init__(self, fallback: Handler) -> None:
+        self.fallback = fallback
+        self._exact: Dict[str, Handler] = {}
+        self._prefixes = PrefixTrie()
+
+    def exact(self, data: str, handler: Handler) -> None:
+        self._exact[data] = handler
+
+    def prefix(self, prefix: str, handler: Handler) -> None:
+        self._prefixes.insert(prefix, handler)
+
+    def resolve(self, data: str) -> Handler:
+        handler = self._exact.get(data)
+        if handler is None:
+            handler = self._prefixes.longest_match(data) or self.fallback
+        return handler
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        await self.resolve(update.callback_query.data or "")(update, context)
@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+# Кому уходят уведомления о заявках. Правило срабатывает, если совпали все
+# заданные в нём условия; пустое условие подходит к любой заявке. Заявка
+# уходит всем получателям всех сработавших правил, а если не сработало ни
+# одно – получателям по умолчанию.
+#
+# В cfg.py правила задаются списком словарей:
+#
+#     NOTIFY_ROUTES = [
+#         {"chat_ids": [111, 222, -100333], "kinds": ["emergency"]},
+#         {"chat_ids": [444], "kinds": ["consultation"], "urgencies": ["Очень срочно"]},
+#         {"chat_ids": [555], "articles": ["228", "228.1"]},
+#     ]
+
+KINDS = ("emergency", "consultation")
+
+
+@dataclass(frozen=True)
+class Route:
+    chat_ids: Tuple[int, ...]
+    kinds: FrozenSet[str] = frozenset()
+    articles: FrozenSet[str] = frozenset()
+    urgencies: FrozenSet[str] = frozenset()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "Route":
+        chat_ids = tuple(int(chat_id) for chat_id in config.get("chat_ids", ()))
+        if not chat_ids:
+            raise ValueError(f"В правиле рассылки нет chat_ids: {config!r}")
+        kinds = frozenset(config.get("kinds", ()))
+        unknown = kinds - set(KINDS)
+        if unknown:
+            raise ValueError(f"Неизвестный вид заявки в правиле рассылки: {', '.join(sorted(unknown))}")
+        return cls(
+            chat_ids,
+            kinds,
+            frozenset(str(article) for article in config.get("articles", ())),
+            frozenset(config.get("urgencies", ())),
+        )
+
+    def matches(self, kind: str, article: Optional[str], urgency: Optional[str]) -> bool:
+        return (
+            (not self.kinds or kind in self.kinds)
+            and (not self.articles or article in self.articles)
+            and (not self.urgencies or urgency in self.urgencies)
+        )
+
+
+class RecipientRouter:
+    def __init__(self, routes: Iterable[Route], default: Sequence[int]) -> None:
+        self.routes = tuple(routes)
+        self.default = tuple(default)
+
+    @classmethod
+    def from_config(cls, config: Iterable[Dict[str, Any]], default: Sequence[int]) -> "RecipientRouter":
+        return cls((Route.from_config(item) for item in config or ()), default)
+
+    def recipients(
+        self, kind: str, article: Optional[str] = None, urgency: Optional[str] = None
+    ) -> Tuple[int, ...]:
+        chat_ids: List[int] = []
+        for route in self.routes:
+            if not route.matches(kind, article, urgency):
+                continue
+            for chat_id in route.chat_ids:
+                if chat_id not in chat_ids:
+                    chat_ids.append(chat_id)
+        return tuple(chat_ids) or self.default
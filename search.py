@@ -0,0 +1,306 @@
+import calendar
+import html
+import re
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+# Полнотекстовый индекс по обоим видам заявок. rowid кодирует источник:
+# id * 2 – консультация, id * 2 + 1 – экстренный вызов, поэтому триггерам
+# удаления хватает поиска по rowid. tenant_id не индексируется словами и
+# только отсекает заявки других ботов.
+
+
+class SearchLayout(NamedTuple):
+    schema: str
+    triggers: Tuple[str, ...]
+    columns: str
+    consult_values: str
+    emergency_values: str
+
+
+_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS requests_fts USING fts5(
+    full_name,
+    city,
+    article,
+    description,
+    address,
+    created_at UNINDEXED,{extra}
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3 4 5 6'
+)
+"""
+
+_CONSULT_VALUES = "NEW.id * 2, NEW.full_name, NEW.city, NEW.article, NEW.description, NULL, NEW.created_at"
+_EMERGENCY_VALUES = (
+    "NEW.id * 2 + 1, NEW.full_name, NULL, NEW.article, NULL, "
+    "COALESCE(NEW.address, NEW.coordinates), NEW.created_at"
+)
+_COLUMNS = "rowid, full_name, city, article, description, address, created_at"
+
+
+def _triggers(columns: str, consult_values: str, emergency_values: str) -> Tuple[str, ...]:
+    return (
+        f"""
+        CREATE TRIGGER IF NOT EXISTS consultations_fts_insert AFTER INSERT ON consultations BEGIN
+            INSERT INTO requests_fts ({columns}) VALUES ({consult_values});
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS consultations_fts_delete AFTER DELETE ON consultations BEGIN
+            DELETE FROM requests_fts WHERE rowid = OLD.id * 2;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS consultations_fts_update AFTER UPDATE ON consultations BEGIN
+            DELETE FROM requests_fts WHERE rowid = OLD.id * 2;
+            INSERT INTO requests_fts ({columns}) VALUES ({consult_values});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS emergency_calls_fts_insert AFTER INSERT ON emergency_calls BEGIN
+            INSERT INTO requests_fts ({columns}) VALUES ({emergency_values});
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS emergency_calls_fts_delete AFTER DELETE ON emergency_calls BEGIN
+            DELETE FROM requests_fts WHERE rowid = OLD.id * 2 + 1;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS emergency_calls_fts_update AFTER UPDATE ON emergency_calls BEGIN
+            DELETE FROM requests_fts WHERE rowid = OLD.id * 2 + 1;
+            INSERT INTO requests_fts ({columns}) VALUES ({emergency_values});
+        END
+        """,
+    )
+
+
+def _layout(extra: Sequence[str] = ()) -> SearchLayout:
+    """Индекс с дополнительными неиндексируемыми столбцами ``extra`` из таблиц заявок."""
+    columns = ", ".join((_COLUMNS, *extra))
+    consult_values = ", ".join((_CONSULT_VALUES, *(f"NEW.{column}" for column in extra)))
+    emergency_values = ", ".join((_EMERGENCY_VALUES, *(f"NEW.{column}" for column in extra)))
+    return SearchLayout(
+        _SCHEMA.format(extra="".join(f"\n    {column} UNINDEXED," for column in extra)),
+        _triggers(columns, consult_values, emergency_values),
+        columns,
+        consult_values,
+        emergency_values,
+    )
+
+
+# Индекс в том виде, в каком его создала миграция 4, и нынешний.
+SEARCH_LAYOUT_V1 = _layout()
+SEARCH_LAYOUT = _layout(("tenant_id",))
+SEARCH_TRIGGER_NAMES = (
+    "consultations_fts_insert",
+    "consultations_fts_delete",
+    "consultations_fts_update",
+    "emergency_calls_fts_insert",
+    "emergency_calls_fts_delete",
+    "emergency_calls_fts_update",
+)
+
+# Самый длинный префикс, для которого в индексе есть готовый список строк.
+PREFIX_MAX = 6
+FIND_PAGE_SIZE = 5
+# Больше совпадений не считаются и не ранжируются: bm25 по всем строкам
+# стоит сотни миллисекунд, а для такого широкого запроса полезнее свежие.
+RANK_LIMIT = 1000
+FIND_USAGE = (
+    "Использование: /find <слова> [с ГГГГ-ММ-ДД] [по ГГГГ-ММ-ДД]\n"
+    "Например: /find 228 Новосибирск 2025-01-01"
+)
+
+# Маркеры подсветки, которые не встретятся в тексте заявки: snippet()
+# расставляет их, а после экранирования HTML они заменяются на <b>.
+_MARK_OPEN, _MARK_CLOSE = "\x02", "\x03"
+
+
+class SearchHit(NamedTuple):
+    kind: str
+    request_id: int
+    created_at: Optional[int]
+    city: Optional[str]
+    article: Optional[str]
+    snippet: str
+
+
+class FindQuery(NamedTuple):
+    match: str
+    low: Optional[int] = None
+    high: Optional[int] = None
+
+
+def create_search_index(conn: sqlite3.Connection, layout: SearchLayout = SEARCH_LAYOUT) -> int:
+    """Создаёт индекс с триггерами и заполняет его; возвращает число строк."""
+    conn.execute(layout.schema)
+    for statement in layout.triggers:
+        conn.execute(statement)
+    return backfill_search_index(conn, layout)
+
+
+def drop_search_index(conn: sqlite3.Connection) -> None:
+    for name in SEARCH_TRIGGER_NAMES:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.execute("DROP TABLE IF EXISTS requests_fts")
+
+
+def backfill_search_index(conn: sqlite3.Connection, layout: SearchLayout = SEARCH_LAYOUT) -> int:
+    """Заново заполняет индекс из таблиц заявок и возвращает число строк."""
+    conn.execute("DELETE FROM requests_fts")
+    conn.execute(
+        f"""
+        INSERT INTO requests_fts ({layout.columns})
+        SELECT {layout.consult_values.replace("NEW.", "")} FROM consultations
+        """
+    )
+    conn.execute(
+        f"""
+        INSERT INTO requests_fts ({layout.columns})
+        SELECT {layout.emergency_values.replace("NEW.", "")} FROM emergency_calls
+        """
+    )
+    conn.execute("INSERT INTO requests_fts (requests_fts) VALUES ('optimize')")
+    return conn.execute("SELECT COUNT(*) FROM requests_fts").fetchone()[0]
+
+
+def _epoch(day: date) -> int:
+    return calendar.timegm(day.timetuple())
+
+
+def search_prefix(word: str) -> str:
+    # Грубое отсечение окончаний: «обыски», «обыска» и «обыск» ищутся по
+    # «обыс». Длина ограничена PREFIX_MAX, чтобы запрос шёл по готовому
+    # префиксному индексу, а не сливал списки всех подходящих слов.
+    if len(word) <= 3:
+        return word
+    keep = len(word) - 1 if len(word) <= 5 else len(word) - 2
+    return word[: min(max(keep, 3), PREFIX_MAX)]
+
+
+def parse_find_args(args: Sequence[str]) -> FindQuery:
+    # Слова ищутся по префиксу и все сразу; синтаксис FTS5 из ввода не
+    # пропускается, поэтому кавычки и операторы в запросе безопасны.
+    words: List[str] = []
+    dates: List[date] = []
+    for arg in args:
+        try:
+            dates.append(date.fromisoformat(arg))
+            continue
+        except ValueError:
+            pass
+        words.extend(re.findall(r"\w+", arg.lower()))
+    if not words or len(dates) > 2:
+        raise ValueError(FIND_USAGE)
+    low = _epoch(dates[0]) if dates else None
+    high = _epoch(dates[1] + timedelta(days=1)) if len(dates) > 1 else None
+    return FindQuery(" ".join(f'"{search_prefix(word)}"*' for word in words), low, high)
+
+
+def _rowid_ranges(conn: sqlite3.Connection, query: FindQuery) -> List[Tuple[int, int, int]]:
+    # id заявок растут вместе с created_at, поэтому период сводится к
+    # диапазону rowid индекса – его FTS5 отбирает без чтения лишних строк.
+    if query.low is None and query.high is None:
+        return [(0, 2**62, -1)]
+    low = query.low if query.low is not None else 0
+    high = query.high if query.high is not None else 2**62
+    ranges = []
+    for table, kind in (("consultations", 0), ("emergency_calls", 1)):
+        first, last = conn.execute(
+            f"SELECT MIN(id), MAX(id) FROM {table} WHERE created_at >= ? AND created_at < ?",
+            (low, high),
+        ).fetchone()
+        if first is not None:
+            ranges.append((first * 2 + kind, last * 2 + kind, kind))
+    return ranges
+
+
+_HIT_COLUMNS = (
+    f"rowid, created_at, city, article, "
+    f"snippet(requests_fts, -1, '{_MARK_OPEN}', '{_MARK_CLOSE}', '…', 12)"
+)
+_IN_RANGE = (
+    "requests_fts MATCH ? AND rowid BETWEEN ? AND ? AND (? < 0 OR rowid % 2 = ?) AND tenant_id = ?"
+)
+
+
+def _hit(row: tuple) -> SearchHit:
+    rowid, created_at, city, article, snippet = row
+    kind = "emergency" if rowid % 2 else "consultation"
+    return SearchHit(kind, rowid // 2, created_at, city, article, snippet)
+
+
+def search_requests(
+    conn: sqlite3.Connection,
+    tenant_id: str,
+    query: FindQuery,
+    offset: int = 0,
+    limit: int = FIND_PAGE_SIZE,
+) -> Tuple[int, List[SearchHit]]:
+    """Число совпадений (не больше ``RANK_LIMIT + 1``) и страница найденного.
+
+    Сниппеты считаются только для показываемых строк: при ранжировании – по
+    одной строке на rowid, а для широких запросов – прямо в выборке по
+    убыванию rowid, которую FTS5 отдаёт без сортировки.
+    """
+    ranges = _rowid_ranges(conn, query)
+    per_range = [(query.match, first, last, kind, kind, tenant_id) for first, last, kind in ranges]
+    total = 0
+    for params in per_range:
+        total += conn.execute(
+            f"SELECT COUNT(*) FROM (SELECT 1 FROM requests_fts WHERE {_IN_RANGE} LIMIT ?)",
+            params + (RANK_LIMIT + 1 - total,),
+        ).fetchone()[0]
+        if total > RANK_LIMIT:
+            break
+    if not total:
+        return 0, []
+
+    if total > RANK_LIMIT:
+        rows: List[tuple] = []
+        for params in per_range:
+            rows += conn.execute(
+                f"SELECT {_HIT_COLUMNS} FROM requests_fts WHERE {_IN_RANGE} "
+                "ORDER BY rowid DESC LIMIT ?",
+                params + (offset + limit,),
+            ).fetchall()
+        rows.sort(key=lambda row: (row[1] or 0, row[0]), reverse=True)
+        return total, [_hit(row) for row in rows[offset:offset + limit]]
+
+    candidates = " UNION ALL ".join(
+        f"SELECT rowid, rank FROM requests_fts WHERE {_IN_RANGE}" for _ in per_range
+    )
+    rowids = conn.execute(
+        f"SELECT rowid FROM ({candidates}) ORDER BY rank LIMIT ? OFFSET ?",
+        sum(per_range, ()) + (limit, offset),
+    ).fetchall()
+    hits = [
+        _hit(
+            conn.execute(
+                f"SELECT {_HIT_COLUMNS} FROM requests_fts WHERE requests_fts MATCH ? AND rowid = ?",
+                (query.match, rowid),
+            ).fetchone()
+        )
+        for (rowid,) in rowids
+    ]
+    return total, hits
+
+
+def format_hit(hit: SearchHit) -> str:
+    title = "🚨 Вызов" if hit.kind == "emergency" else "📨 Консультация"
+    parts = [f"{title} #{hit.request_id}"]
+    if hit.created_at is not None:
+        parts.append(datetime.fromtimestamp(hit.created_at, timezone.utc).strftime("%d.%m.%Y"))
+    if hit.city:
+        parts.append(html.escape(hit.city))
+    if hit.article:
+        parts.append(f"ст. {html.escape(hit.article)}")
+    snippet = (
+        html.escape(hit.snippet or "")
+        .replace(_MARK_OPEN, "<b>")
+        .replace(_MARK_CLOSE, "</b>")
+    )
+    return " · ".join(parts) + f"\n{snippet}"
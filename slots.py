@@ -0,0 +1,83 @@
+import sqlite3
+from collections import Counter
+from datetime import date
+from typing import Dict, FrozenSet, Iterable, Tuple
+
+SLOTS_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_consultations_slot
+    ON consultations (preferred_date, preferred_time)
+"""
+TENANT_SLOTS_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_consultations_tenant_slot
+    ON consultations (tenant_id, preferred_date, preferred_time)
+"""
+
+
+class SlotTaken(Exception):
+    """Интервал заняли, пока пользователь заполнял заявку."""
+
+
+def count_booked(conn: sqlite3.Connection, tenant_id: str, day: str, slot: str) -> int:
+    return conn.execute(
+        "SELECT COUNT(*) FROM consultations "
+        "WHERE tenant_id = ? AND preferred_date = ? AND preferred_time = ?",
+        (tenant_id, day, slot),
+    ).fetchone()[0]
+
+
+class SlotBook:
+    """Занятость интервалов консультаций в памяти процесса.
+
+    Индекс строится одним запросом по ``idx_consultations_tenant_slot`` при старте и
+    дальше только дополняется после каждой сохранённой заявки, поэтому
+    клавиатуры рисуются без обращений к БД. Окончательная проверка места
+    делается в ``check`` внутри операции записи: все записи идут через один
+    поток, так что две одновременные заявки не займут одно место дважды.
+    У каждого бота (``tenant_id``) своё расписание.
+    """
+
+    def __init__(self, tenant_id: str, slots: Iterable[str], capacity: int = 1) -> None:
+        self.tenant_id = tenant_id
+        self.slots = tuple(slots)
+        self.capacity = capacity
+        self._booked: Dict[str, Counter] = {}
+
+    def load(self, conn: sqlite3.Connection, since: date) -> None:
+        rows = conn.execute(
+            """
+            SELECT preferred_date, preferred_time, COUNT(*) FROM consultations
+            WHERE tenant_id = ? AND preferred_date >= ? AND preferred_time IS NOT NULL
+            GROUP BY preferred_date, preferred_time
+            """,
+            (self.tenant_id, since.isoformat()),
+        ).fetchall()
+        booked: Dict[str, Counter] = {}
+        for day, slot, count in rows:
+            booked.setdefault(day, Counter())[slot] = count
+        self._booked = booked
+
+    def record(self, day: str, slot: str) -> None:
+        self._booked.setdefault(day, Counter())[slot] += 1
+
+    def prune(self, today: date) -> None:
+        # ISO-даты сравниваются как строки.
+        cutoff = today.isoformat()
+        for day in [day for day in self._booked if day < cutoff]:
+            del self._booked[day]
+
+    def is_free(self, day: str, slot: str) -> bool:
+        booked = self._booked.get(day)
+        return booked is None or booked[slot] < self.capacity
+
+    def free_slots(self, day: str) -> Tuple[str, ...]:
+        booked = self._booked.get(day)
+        if booked is None:
+            return self.slots
+        return tuple(slot for slot in self.slots if booked[slot] < self.capacity)
+
+    def full_days(self, days: Iterable[date]) -> FrozenSet[date]:
+        return frozenset(day for day in days if not self.free_slots(day.isoformat()))
+
+    def check(self, conn: sqlite3.Connection, day: str, slot: str) -> None:
+        if count_booked(conn, self.tenant_id, day, slot) >= self.capacity:
+            raise SlotTaken(f"{day} {slot}")
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+Operation = Callable[[sqlite3.Connection], Any]
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA foreign_keys=ON",
+)
+
+
+def connect(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def insert_row(conn: sqlite3.Connection, table: str, row: Dict[str, Any]) -> int:
+    columns = ", ".join(row)
+    placeholders = ", ".join("?" for _ in row)
+    cursor = conn.execute(
+        f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", tuple(row.values())
+    )
+    return cursor.lastrowid
+
+
+class Database:
+    """Одно долгоживущее соединение в отдельном потоке и пакетная запись (write-behind).
+
+    Обработчики кладут операции в asyncio-очередь и ждут подтверждения; операции
+    копятся до ``batch_size`` штук или ``flush_interval`` секунд и фиксируются
+    одной транзакцией. ``durable=True`` сбрасывает пакет сразу и коммитит его
+    с ``synchronous=FULL``.
+    """
+
+    def __init__(self, path: Path, batch_size: int = 64, flush_interval: float = 0.05) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.operations = 0
+        self.write_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._writer_task is not None and not self._writer_task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="advbot-db")
+        self._conn = await self._in_thread(connect, self.path)
+        self._queue = asyncio.Queue()
+        self._writer_task = asyncio.get_running_loop().create_task(self._writer_loop())
+
+    async def stop(self) -> None:
+        if self._writer_task is None:
+            return
+        await self._queue.put(None)
+        await self._writer_task
+        self._writer_task = None
+        await self._in_thread(self._conn.close)
+        self._executor.shutdown(wait=True)
+        self._conn = None
+        self._executor = None
+
+    async def execute(self, operation: Callable[[sqlite3.Connection], T], durable: bool = False) -> T:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((operation, future, durable))
+        return await future
+
+    async def insert(self, table: str, row: Dict[str, Any], durable: bool = False) -> int:
+        return await self.execute(lambda conn: insert_row(conn, table, row), durable=durable)
+
+    async def read(self, operation: Callable[[sqlite3.Connection], T]) -> T:
+        # Чтение идёт мимо очереди, но в том же потоке, что и запись.
+        return await self._in_thread(operation, self._conn)
+
+    async def _writer_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            durable = item[2]
+            deadline = loop.time() + self.flush_interval
+            while not durable and len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                durable = durable or item[2]
+            await self._flush(batch, durable)
+
+    async def _flush(self, batch: List[Tuple[Operation, asyncio.Future, bool]], durable: bool) -> None:
+        operations = [operation for operation, _, _ in batch]
+        try:
+            results = await self._in_thread(self._commit_batch, operations, durable)
+        except Exception as exc:
+            logger.error("Не удалось записать пакет в БД: %s", exc)
+            results = [(False, exc)] * len(batch)
+        for (_, future, _), (ok, value) in zip(batch, results):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _commit_batch(self, operations: List[Operation], durable: bool) -> List[Tuple[bool, Any]]:
+        conn = self._conn
+        started = time.perf_counter()
+        if durable:
+            conn.execute("PRAGMA synchronous=FULL")
+        results: List[Tuple[bool, Any]] = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for operation in operations:
+                # Каждая операция в своей точке сохранения: ошибка одной
+                # не откатывает остальные записи пакета.
+                conn.execute("SAVEPOINT op")
+                try:
+                    results.append((True, operation(conn)))
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO op")
+                    results.append((False, exc))
+                conn.execute("RELEASE op")
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            if durable:
+                conn.execute("PRAGMA synchronous=NORMAL")
+        elapsed = time.perf_counter() - started
+        self.batches += 1
+        self.operations += len(operations)
+        self.write_seconds += elapsed
+        logger.debug("Записано операций: %s за %.1f мс", len(operations), elapsed * 1000)
+        return results
+
+    async def _in_thread(self, func: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
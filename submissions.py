@@ -0,0 +1,68 @@
+import sqlite3
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+# Уникальные индексы по токену черновика: вторая строка с тем же токеном не
+# запишется, даже если память процесса о первой отправке уже потеряна.
+SUBMISSION_TOKEN_INDEXES = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_emergency_calls_token "
+    "ON emergency_calls (submission_token) WHERE submission_token IS NOT NULL",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_consultations_token "
+    "ON consultations (submission_token) WHERE submission_token IS NOT NULL",
+)
+
+
+class DuplicateSubmission(Exception):
+    """Заявка с этим токеном уже сохранена."""
+
+    def __init__(self, row_id: int) -> None:
+        super().__init__(row_id)
+        self.row_id = row_id
+
+
+def check_token(conn: sqlite3.Connection, table: str, token: str) -> None:
+    # Вызывается внутри операции записи: все записи идут через один поток,
+    # поэтому между проверкой и вставкой строку никто не добавит.
+    row = conn.execute(f"SELECT id FROM {table} WHERE submission_token = ?", (token,)).fetchone()
+    if row is not None:
+        raise DuplicateSubmission(row[0])
+
+
+class SubmissionCache:
+    """Недавно отправленные заявки: токен черновика → подтверждение пользователю.
+
+    Повторное нажатие «Отправить» отвечает подтверждением из памяти, не
+    обращаясь к БД. Помнится и последний токен каждого пользователя по
+    сценарию (пользователь – любой ключ, например пара бот и id): после
+    отправки черновик из user_data уже удалён, и повтор узнаётся только по
+    нему. Оба словаря ограничены ``maxsize`` записями, вытесняются самые
+    давние.
+    """
+
+    def __init__(self, maxsize: int = 10_000) -> None:
+        self.maxsize = maxsize
+        self._confirmations: "OrderedDict[str, str]" = OrderedDict()
+        self._latest: "OrderedDict[Tuple[Hashable, str], str]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[str]:
+        confirmation = self._confirmations.get(token)
+        if confirmation is not None:
+            self._confirmations.move_to_end(token)
+        return confirmation
+
+    def latest(self, user: Hashable, flow: str) -> Optional[str]:
+        token = self._latest.get((user, flow))
+        return self.get(token) if token is not None else None
+
+    def remember(self, user: Hashable, flow: str, token: str, confirmation: str) -> None:
+        self._confirmations[token] = confirmation
+        self._confirmations.move_to_end(token)
+        self._latest[(user, flow)] = token
+        self._latest.move_to_end((user, flow))
+        while len(self._confirmations) > self.maxsize:
+            self._confirmations.popitem(last=False)
+        while len(self._latest) > self.maxsize:
+            self._latest.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._confirmations)
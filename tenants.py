@@ -0,0 +1,163 @@
+import asyncio
+import re
+import signal
+from dataclasses import dataclass, fields, replace
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from telegram.ext import Application
+from telegram.request import HTTPXRequest
+
+from about import AboutInfoProvider
+from outbox import OutboxSender
+from routing import RecipientRouter
+from slots import SlotBook
+
+# Несколько ботов-адвокатов в одном процессе. В cfg.py они задаются списком
+# словарей; незаданные поля берутся из общих настроек cfg.py:
+#
+#     TENANTS = [
+#         {"tenant_id": "pankratova", "token": "123:abc", "admin_id": 111},
+#         {
+#             "tenant_id": "ivanov",
+#             "token": "456:def",
+#             "admin_id": 222,
+#             "about_url": "https://ivanov-advokat.ru/",
+#             "greeting": "Здравствуйте! Это бот адвоката Иванова И.И.",
+#             "contacts": "Телефон: +7 (900) 000-00-00",
+#             "slot_capacity": 2,
+#             "notify_routes": [{"chat_ids": [222, -100333]}],
+#         },
+#     ]
+#
+# Без TENANTS работает один бот "default" из TELEGRAM_BOT_TOKEN и ADMIN_ID.
+# Общие у всех ботов: цикл событий, поток записи SQLite, пул соединений к
+# Bot API, страницы «О нас» (по одной на URL) и обработчик апдейтов. Свои у
+# каждого: user_data, расписание консультаций, получатели уведомлений и
+# очередь их отправки; строки в таблицах помечены tenant_id.
+
+DEFAULT_TENANT = "default"
+TENANT_ID_RE = re.compile(r"[a-z0-9_-]{1,32}")
+REQUIRED_FIELDS = ("tenant_id", "token", "admin_id")
+
+
+@dataclass(frozen=True)
+class TenantConfig:
+    tenant_id: str
+    token: str
+    admin_id: int
+    about_url: str
+    greeting: str
+    contacts: str
+    notify_routes: Tuple[Dict[str, Any], ...] = ()
+    slot_capacity: int = 1
+
+
+def load_tenants(configs: Iterable[Dict[str, Any]], default: TenantConfig) -> List[TenantConfig]:
+    """Настройки ботов из cfg.TENANTS, а без них – один бот ``default``."""
+    known = {item.name for item in fields(TenantConfig)}
+    tenants: List[TenantConfig] = []
+    for config in configs or ():
+        unknown = set(config) - known
+        if unknown:
+            raise ValueError(f"Неизвестные поля в настройках бота: {', '.join(sorted(unknown))}")
+        missing = [name for name in REQUIRED_FIELDS if not config.get(name)]
+        if missing:
+            raise ValueError(f"В настройках бота не заданы {', '.join(missing)}: {config.get('tenant_id')!r}")
+        tenant = replace(default, **config)
+        if not TENANT_ID_RE.fullmatch(tenant.tenant_id):
+            raise ValueError(f"tenant_id – латиница, цифры, «_» и «-», до 32 символов: {tenant.tenant_id!r}")
+        tenants.append(
+            replace(tenant, admin_id=int(tenant.admin_id), notify_routes=tuple(tenant.notify_routes))
+        )
+    for name in ("tenant_id", "token"):
+        values = [getattr(tenant, name) for tenant in tenants]
+        if len(set(values)) != len(values):
+            raise ValueError(f"Повторяется {name} в TENANTS")
+    return tenants or [default]
+
+
+@dataclass(eq=False)
+class Tenant:
+    """Один бот: его настройки и всё, что у ботов не общее."""
+
+    config: TenantConfig
+    about: AboutInfoProvider
+    slot_book: SlotBook
+    recipients: RecipientRouter
+    outbox: OutboxSender
+    # Страницу «О нас» с общим URL обновляет по расписанию только один бот.
+    refreshes_about: bool = True
+    application: Optional[Application] = None
+
+    @property
+    def tenant_id(self) -> str:
+        return self.config.tenant_id
+
+    @property
+    def admin_id(self) -> int:
+        return self.config.admin_id
+
+
+class SharedHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest для нескольких ботов: один пул соединений к Bot API.
+
+    Каждый Bot открывает и закрывает свой запрос при initialize и shutdown;
+    общий клиент закрывается, только когда его отпустил последний бот.
+    """
+
+    __slots__ = ("_users",)
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._users = 0
+
+    async def initialize(self) -> None:
+        self._users += 1
+        await super().initialize()
+
+    async def shutdown(self) -> None:
+        self._users = max(self._users - 1, 0)
+        if not self._users:
+            await super().shutdown()
+
+
+async def serve_applications(
+    applications: Sequence[Application],
+    start_receiving: Callable[[Sequence[Application]], Awaitable[None]],
+    stop_receiving: Callable[[Sequence[Application]], Awaitable[None]],
+) -> None:
+    """Запускает приложения в текущем цикле событий и ждёт SIGINT/SIGTERM.
+
+    Повторяет жизненный цикл Application.run_polling для каждого: post_init
+    после initialize и post_shutdown после shutdown. Апдейты начинают
+    приниматься (``start_receiving``), когда все приложения готовы, и
+    перестают до их остановки; останавливаются приложения в обратном порядке.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    initialized: List[Application] = []
+    try:
+        for application in applications:
+            await application.initialize()
+            initialized.append(application)
+            if application.post_init:
+                await application.post_init(application)
+        try:
+            await start_receiving(applications)
+            for application in applications:
+                await application.start()
+            await stop.wait()
+        finally:
+            await stop_receiving(applications)
+    finally:
+        for application in reversed(initialized):
+            if application.running:
+                await application.stop()
+                if application.post_stop:
+                    await application.post_stop(application)
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
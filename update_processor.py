@@ -0,0 +1,162 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import metrics
+
+
+def update_owner(update: object) -> Optional[Hashable]:
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return ("chat", update.effective_chat.id)
+    return None
+
+
+class PrioritySlots:
+    """Места воркеров, которые отдаются ждущим по наименьшему сроку ``deadline``.
+
+    Срок – время поступления апдейта плюс фора его класса, поэтому важный
+    апдейт обгоняет недавние менее важные, но апдейт, прождавший дольше
+    своей форы, пропускать вперёд больше не будут (старение).
+    """
+
+    def __init__(self, slots: int) -> None:
+        self._free = slots
+        self._waiters: List[Tuple[float, int, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    async def acquire(self, deadline: float) -> None:
+        # Свободное место бывает, только когда живых ждущих нет: release
+        # передаёт место первому из них напрямую.
+        if self._free:
+            self._free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (deadline, next(self._order), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Место уже выдали, а задачу отменили – отдаём следующему.
+                self.release()
+            else:
+                future.cancel()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._free += 1
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Разные пользователи обрабатываются параллельно, апдейты одного – строго по очереди.
+
+    ``max_pending`` ограничивает число принятых в работу апдейтов (включая
+    ждущих своей очереди), ``workers`` – число одновременно выполняемых
+    обработчиков. Место воркера занимается только после того, как подошла
+    очередь пользователя, поэтому один активный пользователь не блокирует
+    остальных. Место в ``max_pending`` апдейт занимает ещё до очереди
+    своего пользователя, поэтому у одного пользователя в работе не больше
+    ``max_user_pending`` апдейтов: лишние отбрасываются сразу, иначе флуд
+    одного занял бы все места и остановил остальных.
+
+    Если задан ``classify``, свободное место воркера получает апдейт
+    важнейшего класса из ``priorities`` (первый – самый важный): каждый
+    следующий класс уступает предыдущему ``aging`` секунд ожидания. Время
+    от поступления апдейта до запуска обработчика пишется в гистограмму
+    ``update_wait_seconds`` по классам.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_pending: int,
+        max_user_pending: int = 20,
+        classify: Optional[Callable[[object], str]] = None,
+        priorities: Sequence[str] = (),
+        aging: float = 1.0,
+    ) -> None:
+        super().__init__(max_concurrent_updates=max(max_pending, workers))
+        self.workers = workers
+        self.max_user_pending = max_user_pending
+        self.classify = classify
+        self._head_starts = {name: index * aging for index, name in enumerate(priorities)}
+        self._lowest = len(priorities) * aging
+        self._worker_slots = PrioritySlots(workers)
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._depths: Dict[Hashable, int] = {}
+        self._waiting: Counter = Counter()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        arrived = time.perf_counter()
+        priority = self.classify(update) if self.classify is not None else "default"
+        deadline = arrived + self._head_starts.get(priority, self._lowest)
+        owner = update_owner(update)
+        if owner is None:
+            await self._run(coroutine, priority, arrived, deadline)
+            return
+
+        if self._depths.get(owner, 0) >= self.max_user_pending:
+            metrics.inc("updates_dropped_total", priority=priority)
+            if asyncio.iscoroutine(coroutine):
+                coroutine.close()
+            return
+
+        lock = self._locks.get(owner)
+        if lock is None:
+            lock = self._locks[owner] = asyncio.Lock()
+        self._depths[owner] = self._depths.get(owner, 0) + 1
+        try:
+            async with lock:
+                await self._run(coroutine, priority, arrived, deadline)
+        finally:
+            depth = self._depths[owner] - 1
+            if depth:
+                self._depths[owner] = depth
+            else:
+                del self._depths[owner]
+                del self._locks[owner]
+
+    async def _run(self, coroutine: Awaitable[Any], priority: str, arrived: float, deadline: float) -> None:
+        self._waiting[priority] += 1
+        try:
+            await self._worker_slots.acquire(deadline)
+        finally:
+            self._waiting[priority] -= 1
+        try:
+            metrics.observe("update_wait_seconds", time.perf_counter() - arrived, priority=priority)
+            await coroutine
+        finally:
+            self._worker_slots.release()
+
+    def queue_depth(self, owner: Hashable) -> int:
+        return self._depths.get(owner, 0)
+
+    def stats(self) -> Dict[str, int]:
+        depths = self._depths.values()
+        return {
+            "users": len(self._depths),
+            "pending": sum(depths),
+            "max_depth": max(depths, default=0),
+            "workers": self.workers,
+            **{f"waiting_{priority}": count for priority, count in self._waiting.items()},
+        }
@@ -0,0 +1,172 @@
+import asyncio
+import hmac
+import json
+import logging
+import ssl
+from pathlib import Path
+from typing import Dict, Mapping, Optional, Sequence, Tuple
+
+from telegram import Update
+from telegram.ext import Application
+
+from tenants import serve_applications
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+MAX_BODY_SIZE = 1024 * 1024
+READ_TIMEOUT = 30
+
+RESPONSES = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    503: "Service Unavailable",
+}
+
+
+def build_ssl_context(cert: Optional[str], key: Optional[str]) -> Optional[ssl.SSLContext]:
+    if not cert:
+        return None
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+class WebhookServer:
+    """Минимальный HTTP(S)-приёмник вебхуков Telegram на asyncio.
+
+    Проверяет секретный токен и кладёт апдейты в ограниченную очередь
+    приложения; если очередь заполнена, отвечает 503, и Telegram повторит
+    доставку позже. ``routes`` сопоставляет пути приложениям: несколько
+    ботов слушают один порт, каждый на своём пути.
+    """
+
+    def __init__(
+        self,
+        routes: Mapping[str, Application],
+        listen: str,
+        port: int,
+        secret_token: str,
+        ssl_context: Optional[ssl.SSLContext] = None,
+    ) -> None:
+        self.routes = {"/" + path.strip("/"): application for path, application in routes.items()}
+        self.listen = listen
+        self.port = port
+        self.secret_token = secret_token
+        self.ssl_context = ssl_context
+        self._server: Optional[asyncio.base_events.Server] = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.listen, self.port, ssl=self.ssl_context
+        )
+        logger.info("Вебхук слушает %s:%s %s", self.listen, self.port, ", ".join(self.routes))
+
+    async def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await asyncio.wait_for(self._read_request(reader), READ_TIMEOUT)
+                if request is None:
+                    break
+                status, keep_alive = self._accept(*request)
+                reason = RESPONSES[status]
+                writer.write(
+                    f"HTTP/1.1 {status} {reason}\r\n"
+                    "Content-Length: 0\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("ascii")
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(
+        self, reader: asyncio.StreamReader
+    ) -> Optional[Tuple[str, str, Dict[str, str], Optional[bytes]]]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        if length > MAX_BODY_SIZE:
+            return method, target, headers, None
+        body = await reader.readexactly(length) if length else b""
+        return method, target, headers, body
+
+    def _accept(
+        self, method: str, target: str, headers: Dict[str, str], body: Optional[bytes]
+    ) -> Tuple[int, bool]:
+        keep_alive = headers.get("connection", "").lower() != "close"
+        application = self.routes.get(target.split("?", 1)[0])
+        if application is None:
+            return 404, keep_alive
+        if method != "POST":
+            return 405, keep_alive
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, ""), self.secret_token):
+            logger.warning("Отклонён запрос к вебхуку с неверным секретом")
+            return 403, keep_alive
+        if body is None:
+            return 413, False
+        try:
+            payload = json.loads(body)
+            if not isinstance(payload, dict):
+                raise TypeError(f"ожидался JSON-объект, получено {type(payload).__name__}")
+            update = Update.de_json(payload, application.bot)
+        except (ValueError, TypeError, KeyError, AttributeError) as exc:
+            logger.warning("Некорректный апдейт во входящем вебхуке: %s", exc)
+            return 400, keep_alive
+        try:
+            application.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            logger.warning("Очередь апдейтов переполнена, Telegram повторит доставку")
+            return 503, keep_alive
+        return 200, keep_alive
+
+
+async def serve_webhook(
+    server: WebhookServer,
+    webhooks: Sequence[Tuple[Application, Optional[str]]],
+    certificate: Optional[str] = None,
+    max_connections: int = 40,
+) -> None:
+    """Регистрирует вебхук каждого бота (если задан его URL) и принимает апдейты."""
+
+    async def start_receiving(applications: Sequence[Application]) -> None:
+        for application, webhook_url in webhooks:
+            if webhook_url:
+                await application.bot.set_webhook(
+                    url=webhook_url,
+                    secret_token=server.secret_token,
+                    certificate=Path(certificate).read_bytes() if certificate else None,
+                    max_connections=max_connections,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+        await server.start()
+
+    async def stop_receiving(applications: Sequence[Application]) -> None:
+        await server.stop()
+
+    await serve_applications(
+        [application for application, _ in webhooks], start_receiving, stop_receiving
+    )